@@ -1,12 +1,10 @@
-import datetime
-import random
-import threading
-
 import ac  # type: ignore
 import acsys  # type: ignore
 
-from llm.services import generate_commentary
-from models import Driver, Event, EventType, RaceState
+import config
+from instrumentation import metrics
+from camera import Camera
+from telemetry import LiveTelemetry
 from third_party.sim_info import SimInfo
 
 # Global constants
@@ -17,20 +15,28 @@ FOCUS_DURATION_MAX_MS = 1500
 simInfo = SimInfo()
 
 # Global variables
-last_update_time = 0
-last_camera_update_time = 0
-is_commentating = False
-driver_count = 32
-sector_count = 0
-car_in_focus = 0
+last_metrics_time = 0
+# RaceEngine, or the RingWriter feeding it in split mode
+engine = None
+ring_writer = None
+
+if config.METRICS_PATH:
+    metrics.enable()
+
 
-event_queue = []
+class AcCamera(Camera):
+    def focus(self, car_id):
+        return ac.focusCar(car_id)
 
-current_state = RaceState()
+    def set_mode(self, mode):
+        ac.setCameraMode(getattr(acsys.CM, mode))
+
+
+camera = AcCamera()
 
 
 def acMain(ac_version):
-    global appWindow, driver_count, current_state
+    global appWindow, engine, ring_writer
 
     appWindow = ac.newApp(APP_NAME)
     ac.setTitle(appWindow, APP_NAME)
@@ -39,213 +45,62 @@ def acMain(ac_version):
     ac.addRenderCallback(appWindow, appGL)
 
     ac.console("===BEGIN RACE===")
-    ac.console("DRIVERS:")
-
-    driver_count = ac.getCarsCount()
-    for id in range(driver_count):
-        driver = Driver(id)
-        current_state.add_driver(driver)
-        ac.console(
-            "Driver: {} - {} - {}".format(driver.name, driver.car_name, driver.nation)
-        )
-
-    return APP_NAME
-
-
-def appGL(deltaT):
-    pass
-
-
-def acUpdate(deltaT):
-    global \
-        last_update_time, \
-        last_camera_update_time, \
-        event_queue, \
-        driver_count, \
-        car_in_focus, \
-        is_commentating, \
-        current_state
-
-    last_update_time += deltaT
-    last_camera_update_time += deltaT
-    if last_update_time < 5:
-        return
-
-    event_queue.extend(current_state.update())
-
-    if len(event_queue) == 0:
-        ac.console("No events. Resetting last_update_time")
-        camera_control(current_state)
-        last_update_time = 0
-        return
-
-    if is_commentating:
-        ac.console("Actively commentating")
-        event = event_queue[0]
-        duration = (datetime.datetime.now() - event.time).total_seconds()
-        if duration > 30:
-            if event.type in [
-                EventType.BEST_LAP,
-                EventType.SHORT_INTERVAL,
-                EventType.ENTERED_PIT,
-            ]:
-                ac.console(
-                    "{} event is {} seconds old. Removing from queue".format(
-                        event.type, duration
-                    )
-                )
-                event_queue.pop()
-    else:
-        is_commentating = True
-        event = event_queue.pop()
-        ac.console("Trigger commentary on {} event".format(event.type))
-        camera_control(current_state, event)
-        
-        commentary_thread = threading.Thread(target=handle_commentary, args=(event), daemon=True)
-        commentary_thread.start()
-
-    last_update_time = 0
-
-
-def camera_control(state: RaceState, event=None):
-    global last_camera_update_time
 
-    if last_camera_update_time < 15:
-        ac.console("Camera locked for {} more seconds".format(15 - int(last_camera_update_time)))
-        return
+    if config.SPLIT_ENGINE:
+        from ring import RingWriter, TelemetryRing
 
-    if not event or event.type == EventType.DNF:
-        driver = state.drivers[random.randint(1, len(state.drivers) - 1)]
-        ac.focusCar(driver.id)
+        ring_writer = RingWriter(
+            TelemetryRing(config.RING_NAME, create=True),
+            LiveTelemetry(),
+            simInfo.graphics.session,
+            config.RING_CARS_PER_FRAME,
+        )
         ac.console(
-            "No camera event or driver DNF'd. Randomly focusing on driver: {}".format(
-                driver.name
+            "Race engine runs out of process, {} cars on ring {}".format(
+                ring_writer.car_count, config.RING_NAME
             )
         )
-        ac.setCameraMode(acsys.CM.Random)
-        last_camera_update_time = 0
-        return
-
-    ac.console("Focus on driver_id: {}".format(event.driver_id))
-    if not ac.focusCar(event.driver_id):
-        ac.console("ERROR: Unable to focus on driver_id: {}".format(event.driver_id))
-        driver = state.drivers[random.randint(1, len(state.drivers) - 1)]
-        ac.focusCar(driver)
-        ac.console("Randomly focusing on driver: {}".format(driver.name))
-
-    if event.type in (
-        EventType.START_SAFETY_CAR,
-        EventType.END_SAFETY_CAR,
-        EventType.DNF,
-        EventType.COLLISION,
-    ):
-        ac.setCameraMode(acsys.CM.Helicopter)
-        ac.console("Selecting HELICOPTER camera")
-    elif event.type in (EventType.ENTERED_PIT, EventType.OVERTAKE):
-        ac.setCameraMode(acsys.CM.Car)
-        ac.console("Selecting CAR camera")
-    elif event.type in (EventType.SHORT_INTERVAL, EventType.DRS_RANGE):
-        ac.setCameraMode(acsys.CM.Cockpit)
-        ac.console("Selecting COCKPIT camera")
     else:
-        ac.setCameraMode(acsys.CM.Random)
-        ac.console("Selecting RANDOM camera")
+        from race_engine import RaceEngine
 
-    last_camera_update_time = 0
+        ac.console("DRIVERS:")
+        engine = RaceEngine(LiveTelemetry(), camera, simInfo.graphics.session, simInfo)
+        engine.add_drivers()
 
+    return APP_NAME
 
-def handle_commentary(event):
-    """
-    Handles chat completion and audio generation in a separate thread.
-    """
-    global is_commentating
 
-    try:
-        # Generate the prompt
-        prompt = generate_prompt(event)
-        ac.console("PROMPT = '{}'".format(prompt))
+def appGL(deltaT):
+    pass
 
-        # Get the chat completion from ollama and generate/play audio
-        success = generate_commentary(prompt)
-        ac.console("SCRIPT STATUS = '{}'".format(success))
-    finally:
-        is_commentating = False
 
+def acShutdown():
+    if engine is not None:
+        engine.shutdown()
+    if ring_writer is not None:
+        ring_writer.ring.close()
+    if config.METRICS_PATH:
+        metrics.write(config.METRICS_PATH)
 
-def generate_prompt(event: Event):
-    ac.console("{} -- event type: {}".format(datetime.datetime.now(), event.type))
-    prompt = ""
-    if event.type == EventType.START_SAFETY_CAR:
-        prompt = "The safety car has come out on lap {}.".format(
-            event.params["lap_count"]
-        )
-    elif event.type == EventType.END_SAFETY_CAR:
-        prompt = "The safety car has now ended on lap {}.".format(
-            event.params["lap_count"]
-        )
-    elif event.type == EventType.DNF:
-        prompt = (
-            "The driver named {} is now out of the race due to this reason: {}.".format(
-                event.params["driver"], event.params["reason"]
-            )
-        )
-    elif event.type == EventType.COLLISION:
-        pass
-    elif event.type == EventType.BEST_LAP:
-        prompt = "The driver named {} has just set a personal best with a lap time of {}.".format(
-            event.params["driver"], event.params["lap_time"]
-        )
-    elif event.type == EventType.FASTEST_LAP:
-        prompt = "The driver named {} has just set the fastest lap with a time of {}.".format(
-            event.params["driver"], event.params["lap_time"]
-        )
-    elif event.type == EventType.ENTERED_PIT:
-        prompt = "The driver named {} has entered the pit on lap {}. They completed their last lap with a time of {} on the {} compound tire.".format(
-            event.params["driver"],
-            event.params["lap_count"],
-            event.params["last_lap"],
-            event.params["compound"],
-        )
-    elif event.type == EventType.QUICK_PIT:
-        prompt = "The driver named {} just finished a quick pit stop that lasted {} seconds. They are now running the {} compound tire.".format(
-            event.params["driver"],
-            event.params["duration"],
-            event.params["compound"],
-        )
-    elif event.type == EventType.LONG_PIT:
-        prompt = "The driver named {} just finished a long pit stop that lasted {} seconds. They are now running the {} compound tire.".format(
-            event.params["driver"],
-            event.params["duration"],
-            event.params["compound"],
-        )
-    elif event.type == EventType.SHORT_INTERVAL:
-        prompt = (
-            "The driver named {} is within {} seconds of the driver named {}.".format(
-                event.params["driver_b"],
-                event.params["interval"],
-                event.params["driver_a"],
-            )
-        )
-    elif event.type == EventType.DRS_RANGE:
-        prompt = "The driver named {} is within {} seconds of the driver named {}. They can now use D-R-S to help with overtaking.".format(
-            event.params["driver_b"],
-            event.params["interval"],
-            event.params["driver_a"],
-        )
-    elif event.type == EventType.OVERTAKE:
-        prompt = "The driver named {} has overtaken the driver named {}. The driver named {} is now in position {}.".format(
-            event.params["driver_a"],
-            event.params["driver_b"],
-            event.params["driver_a"],
-            event.params["position"],
-        )
-    elif event.type == EventType.LONG_STINT:
-        prompt = "The driver named {} has now completed {} laps with the {} compound tires. They completed the last lap with a time of {}. We are now on lap {}".format(
-            event.params["driver"],
-            event.params["tire_age"],
-            event.params["compound"],
-            event.params["last_lap"],
-            event.params["lap_count"],
-        )
 
-    return prompt
+def acUpdate(deltaT):
+    global last_metrics_time
+
+    start = metrics.start()
+    if ring_writer is not None:
+        ring_writer.write(simInfo.graphics.session)
+        for car_id, mode in ring_writer.commands():
+            if car_id is not None:
+                camera.focus(car_id)
+            if mode is not None:
+                camera.set_mode(mode)
+    else:
+        engine.set_session(simInfo.graphics.session)
+        engine.update(deltaT)
+    metrics.stop("ac_update", start)
+
+    if config.METRICS_PATH:
+        last_metrics_time += deltaT
+        if last_metrics_time >= config.METRICS_INTERVAL:
+            metrics.write(config.METRICS_PATH)
+            last_metrics_time = 0
@@ -0,0 +1,133 @@
+"""
+Battles
+
+Trains of cars running within a few seconds of each other, kept from one
+update to the next so a battle keeps its identity (and start time) while
+cars join it, drop out of it or pass each other inside it
+"""
+
+import itertools
+
+
+class Battle:
+    """
+    cars are the keys in running order, gaps[i] the seconds between cars[i]
+    and cars[i + 1]. position is the 1 based position of the first car
+    """
+
+    __slots__ = ("id", "cars", "gaps", "position", "since")
+
+    def __init__(self, battle_id: int, since: float):
+        self.id = battle_id
+        self.cars = []
+        self.gaps = []
+        self.position = 0
+        self.since = since
+
+    @property
+    def span(self) -> float:
+        """Seconds from the first car to the last"""
+        return sum(self.gaps)
+
+    @property
+    def attacker(self):
+        """The car closest to the one ahead of it"""
+        closest = min(range(len(self.gaps)), key=self.gaps.__getitem__)
+        return self.cars[closest + 1]
+
+    def __repr__(self):
+        return "Battle({}, P{} {!r}, {:.1f}s)".format(
+            self.id, self.position, self.cars, self.span
+        )
+
+
+class BattleTracker:
+    """
+    BattleTracker
+
+    update() is given the running order and the gap between each pair of
+    consecutive cars. Two cars are linked once their gap closes to
+    join_gap and stay linked until it opens past leave_gap, so a battle
+    doesn't flicker when a gap hovers around the threshold. A battle is a
+    run of linked cars. Only the links change between updates, so each new
+    battle takes the id of the old one most of its cars came from
+    """
+
+    def __init__(self, join_gap: float = 1.0, leave_gap: float = 1.5):
+        self.join_gap = join_gap
+        self.leave_gap = leave_gap
+        self.battles = []
+        self._links = set()  # (car ahead, car behind)
+        self._battle_of = {}  # Car to the id of its battle
+        self._ids = itertools.count(1)
+
+    def update(self, order, gaps, now: float) -> list:
+        """
+        order is every key leader first and gaps[i] the gap in seconds
+        between order[i] and order[i + 1], None if unknown. Returns the
+        battles, front first
+        """
+        links = set()
+        linked = []
+        for i in range(len(order) - 1):
+            gap = gaps[i]
+            if gap is None:
+                continue
+            pair = (order[i], order[i + 1])
+            limit = self.leave_gap if pair in self._links else self.join_gap
+            if gap <= limit:
+                links.add(pair)
+                linked.append(i)
+        self._links = links
+        return self.update_linked(order, gaps, linked, now)
+
+    def update_linked(self, order, gaps, linked, now: float) -> list:
+        """
+        update() for a caller that links the cars itself (VectorRaceState
+        does it on arrays): linked are the i, ascending, for which order[i]
+        and order[i + 1] are linked. Only those gaps are read
+        """
+        previous = {battle.id: battle for battle in self.battles}
+        battle_of = self._battle_of
+        battles = []
+        battle = None
+        last = None
+        for i in linked:
+            if battle is None or i != last + 1:
+                battle = Battle(0, now)
+                battle.cars.append(order[i])
+                battle.position = i + 1
+                battles.append(battle)
+            battle.cars.append(order[i + 1])
+            battle.gaps.append(gaps[i])
+            last = i
+
+        # Carry over the id of the old battle most cars came from, the
+        # larger part keeps it when a battle splits
+        taken = set()
+        new_battle_of = {}
+        for battle in sorted(battles, key=lambda battle: -len(battle.cars)):
+            counts = {}
+            for car in battle.cars:
+                old = battle_of.get(car)
+                if old is not None and old not in taken:
+                    counts[old] = counts.get(old, 0) + 1
+            if counts:
+                battle.id = max(counts, key=counts.get)
+                battle.since = previous[battle.id].since
+                taken.add(battle.id)
+            else:
+                battle.id = next(self._ids)
+            for car in battle.cars:
+                new_battle_of[car] = battle.id
+        self._battle_of = new_battle_of
+        self.battles = battles
+        return battles
+
+    def battle_of(self, key):
+        """The battle key is in, or None"""
+        battle_id = self._battle_of.get(key)
+        for battle in self.battles:
+            if battle.id == battle_id:
+                return battle
+        return None
@@ -0,0 +1,80 @@
+"""
+Session host load test
+
+Stand-in games, one engine process per session and a stand-in sidecar whose
+LLM slots are shared between the sessions. Reports each engine's update
+cost and lost samples, and the lines and LLM slot waits of every session
+
+    python benchmarks/host.py --sessions 8 --cars 30 --duration 60
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from host import STAND_IN_RING, SessionHost, stand_in_game, summary  # noqa: E402
+from llm.sidecar import Sidecar, StandInLLM, StandInTTS  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the session host")
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--cars", type=int, default=30)
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--speed", type=float, default=4)
+    parser.add_argument("--slots", type=int, default=2)
+    parser.add_argument("--first-token", type=float, default=0.5)
+    parser.add_argument("--token-time", type=float, default=0.01)
+    parser.add_argument("--word-time", type=float, default=0.01)
+    args = parser.parse_args()
+
+    sidecar = Sidecar(
+        StandInLLM(args.first_token, args.token_time),
+        StandInTTS(args.word_time),
+        args.slots,
+    )
+    sidecar.start(port=0)
+
+    rings = [STAND_IN_RING.format(index) for index in range(args.sessions)]
+    stop = multiprocessing.Event()
+    games = [
+        multiprocessing.Process(
+            target=stand_in_game,
+            args=(ring_name, args.cars, index, 60, args.speed, stop),
+            daemon=True,
+        )
+        for index, ring_name in enumerate(rings)
+    ]
+    for game in games:
+        game.start()
+    host = SessionHost(rings, sidecar_port=sidecar.port)
+    host.start()
+    time.sleep(args.duration)
+    stats = host.stop()
+    stop.set()
+    for game in games:
+        game.join(5)
+    sidecar.stop()
+
+    print()
+    for ring_name in rings:
+        if ring_name in stats:
+            print(summary(ring_name, stats[ring_name]))
+    for session, session_stats in sorted(sidecar.scheduler.stats.items()):
+        print(
+            "sidecar session {}: {} requests, mean slot wait {:.2f}s, "
+            "max {:.2f}s".format(
+                session,
+                session_stats["requests"],
+                session_stats["wait"] / session_stats["requests"],
+                session_stats["max_wait"],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
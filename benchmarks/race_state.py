@@ -0,0 +1,74 @@
+"""
+RaceState benchmark
+
+Per-tick cost of the object-per-driver RaceState against VectorRaceState on
+a synthetic race. Both states read the same seeded telemetry so they also
+produce the same events
+
+    python benchmarks/race_state.py
+    python benchmarks/race_state.py --cars 20 60 200 --ticks 500
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Driver, RaceState  # noqa: E402
+from telemetry import SyntheticTelemetry  # noqa: E402
+from vector_state import VectorRaceState  # noqa: E402
+
+TICK_SECONDS = 5
+
+
+def run(state_class, car_count: int, ticks: int):
+    """Returns the mean per-tick cost in seconds and the number of events"""
+    telemetry = SyntheticTelemetry(car_count)
+    state = state_class(telemetry)
+    for id in range(car_count):
+        state.add_driver(Driver(id, telemetry))
+
+    elapsed = 0
+    event_count = 0
+    for _ in range(ticks):
+        telemetry.begin_tick(TICK_SECONDS)
+        start = time.perf_counter()
+        event_count += len(state.update())
+        elapsed += time.perf_counter() - start
+    return elapsed / ticks, event_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RaceState.update()")
+    parser.add_argument("--cars", type=int, nargs="+", default=[20, 60, 200])
+    parser.add_argument("--ticks", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3, help="Best of N runs")
+    args = parser.parse_args()
+
+    print(
+        "{:>5}  {:>14}  {:>14}  {:>8}  {:>7}".format(
+            "cars", "objects (us)", "vector (us)", "speedup", "events"
+        )
+    )
+    for car_count in args.cars:
+        object_cost, object_events = min(
+            run(RaceState, car_count, args.ticks) for _ in range(args.repeat)
+        )
+        vector_cost, vector_events = min(
+            run(VectorRaceState, car_count, args.ticks) for _ in range(args.repeat)
+        )
+        print(
+            "{:>5}  {:>14.1f}  {:>14.1f}  {:>7.2f}x  {:>7}".format(
+                car_count,
+                object_cost * 1e6,
+                vector_cost * 1e6,
+                object_cost / vector_cost,
+                "{}/{}".format(object_events, vector_events),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
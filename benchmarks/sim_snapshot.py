@@ -0,0 +1,95 @@
+"""
+SimInfo snapshot benchmark
+
+Maps file-backed SimInfo pages in a temporary directory, lets a writer
+process publish physics packets as fast as it can and compares copying the
+whole page with from_buffer_copy against PageReader snapshots of a few
+fields. The writer bumps packetId first and then fills in the fields, like
+a memcpy of the whole page would, and every field holds the same counter so
+torn snapshots can be counted
+
+    python benchmarks/sim_snapshot.py --reads 200000
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sim_snapshot import PageReader  # noqa: E402
+from third_party.sim_info import SimInfo, SPageFilePhysics  # noqa: E402
+
+FIELDS = ("speedKmh", "accG", "carDamage", "numberOfTyresOut")
+
+
+def write_packets(path, stop):
+    writer = SimInfo(path)
+    physics = writer.physics
+    counter = 0
+    while not stop.is_set():
+        counter += 1
+        physics.packetId = counter
+        physics.speedKmh = counter
+        physics.accG[0] = counter
+        physics.carDamage[0] = counter
+        physics.numberOfTyresOut = counter
+    del physics
+    writer.close()
+
+
+def consistent(snapshot):
+    return (
+        snapshot.speedKmh
+        == snapshot.accG[0]
+        == snapshot.carDamage[0]
+        == snapshot.numberOfTyresOut
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SimInfo snapshots")
+    parser.add_argument("--reads", type=int, default=200000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+        sim_info = SimInfo(path)
+        stop = multiprocessing.Event()
+        writer = multiprocessing.Process(target=write_packets, args=(path, stop))
+        writer.start()
+        while sim_info.physics.packetId == 0:
+            time.sleep(0.01)
+
+        start = time.perf_counter()
+        for _ in range(args.reads):
+            page = SPageFilePhysics.from_buffer_copy(sim_info._acpmf_physics)
+            [getattr(page, field) for field in FIELDS]
+        copy_cost = (time.perf_counter() - start) / args.reads
+
+        reader = PageReader(sim_info.physics, FIELDS)
+        start = time.perf_counter()
+        for _ in range(args.reads):
+            reader.read()
+        read_cost = (time.perf_counter() - start) / args.reads
+
+        checker = PageReader(sim_info.physics, FIELDS)
+        snapshots = [checker.read() for _ in range(args.reads)]
+        snapshots = [snapshot for snapshot in snapshots if snapshot]
+        inconsistent = len(snapshots) - sum(map(consistent, snapshots))
+        stats = (checker.reads, checker.unchanged, checker.torn, inconsistent)
+
+        stop.set()
+        writer.join()
+        del reader, checker
+        sim_info.close()
+
+    print("Full page copy: {:.2f} us/read".format(copy_cost * 1e6))
+    print("PageReader:     {:.2f} us/read".format(read_cost * 1e6))
+    print("Snapshots: {}  Unchanged: {}  Torn: {}  Inconsistent: {}".format(*stats))
+
+
+if __name__ == "__main__":
+    main()
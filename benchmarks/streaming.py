@@ -0,0 +1,74 @@
+"""
+Streaming commentary benchmark
+
+Time to first audio and total time per line against the stand-in sidecar,
+with and without sentence streaming and the phrase cache
+
+    python benchmarks/streaming.py --lines 5
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm.services import SidecarChannel  # noqa: E402
+from llm.sidecar import PHRASE_CACHE, Sidecar, StandInLLM, StandInTTS  # noqa: E402
+from prompts import STOCK_PHRASES  # noqa: E402
+
+PROMPT = (
+    "The driver named Dabro has overtaken the driver named Yabo. "
+    "The driver named Dabro is now in position 3."
+)
+DRIVERS = ["Dabro", "Yabo"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streamed commentary")
+    parser.add_argument("--lines", type=int, default=5)
+    parser.add_argument("--first-token", type=float, default=0.5)
+    parser.add_argument("--token-time", type=float, default=0.03)
+    parser.add_argument("--word-time", type=float, default=0.05)
+    parser.add_argument("--render-time", type=float, default=0.01)
+    args = parser.parse_args()
+
+    for cache in (False, True):
+        sidecar = Sidecar(
+            StandInLLM(args.first_token, args.token_time),
+            StandInTTS(args.word_time, args.render_time),
+            phrase_cache=PHRASE_CACHE if cache else 0,
+        )
+        sidecar.start(port=0)
+        channel = SidecarChannel(port=sidecar.port)
+        channel.connect()
+        if cache:
+            phrases = DRIVERS + list(STOCK_PHRASES)
+            channel.preload(phrases)
+            while len(sidecar.phrases) < len(phrases):
+                time.sleep(0.01)
+
+        for stream in (False, True):
+            first_audio = []
+            total = []
+            for _ in range(args.lines):
+                request = channel.submit(PROMPT, stream=stream)
+                request.wait()
+                first_audio.append(request.time_to_first_audio)
+                total.append(time.monotonic() - request.sent_time)
+            print(
+                "{:<10} {:<9}  time to first audio: {:.3f}s  total: {:.3f}s".format(
+                    "streamed" if stream else "whole line",
+                    "cached" if cache else "uncached",
+                    sum(first_audio) / len(first_audio),
+                    sum(total) / len(total),
+                )
+            )
+
+        channel.close()
+        sidecar.stop()
+
+
+if __name__ == "__main__":
+    main()
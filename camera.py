@@ -0,0 +1,33 @@
+"""
+Camera
+
+The camera interface the race engine drives. Kept apart from the engine so
+the game side of split mode (ring.py) can implement it without importing
+the engine
+"""
+
+
+class CameraMode:
+    """Names of the acsys.CM camera modes the engine selects"""
+
+    RANDOM = "Random"
+    HELICOPTER = "Helicopter"
+    CAR = "Car"
+    COCKPIT = "Cockpit"
+
+
+class Camera:
+    """
+    Camera
+
+    Where the engine sends camera commands. The in-game app applies them
+    with ac.focusCar/ac.setCameraMode, in split mode they go back to the
+    game through the ring
+    """
+
+    def focus(self, car_id: int) -> bool:
+        """Returns False if the car couldn't be focused"""
+        raise NotImplementedError
+
+    def set_mode(self, mode: str):
+        raise NotImplementedError
@@ -0,0 +1,125 @@
+"""
+Event coalescer
+
+Merges bursts of related events into CompositeEvents before they are queued
+so one prompt (and one LLM round-trip) covers all of them
+"""
+
+import time
+
+from models import CompositeEvent, EventType
+
+# Events between two drivers, params hold driver_a and driver_b
+PAIR_EVENTS = (EventType.OVERTAKE, EventType.DRS_RANGE, EventType.SHORT_INTERVAL)
+# Events that are always commentated on by themselves
+SOLO_EVENTS = (
+    EventType.START_SAFETY_CAR,
+    EventType.END_SAFETY_CAR,
+    EventType.FASTEST_LAP,
+)
+
+
+class EventCoalescer:
+    """
+    EventCoalescer
+
+    Events are held for window seconds after the first of them arrives
+    (0 merges only what a single RaceState.update() emitted) and then
+    grouped:
+
+    - pair events whose drivers overlap form one "battle" per group of
+      cars, of at most max_drivers cars. A DRS train would otherwise chain
+      the whole field into one prompt. Overtakes are grouped first, a pair
+      that would grow a full battle past the cap is a battle of its own
+    - the remaining events of the same type form one group per type
+
+    Groups of one are passed through unchanged
+    """
+
+    def __init__(self, window: float = 0, clock=time.time, max_drivers: int = 3):
+        self.window = window
+        self.max_drivers = max_drivers
+        self.clock = clock
+        self.events_in = 0
+        self.events_out = 0
+        self._pending = []
+        self._first_time = None
+
+    def add(self, events, now: float = None):
+        if not events:
+            return
+        if not self._pending:
+            self._first_time = self.clock() if now is None else now
+        self._pending.extend(events)
+        self.events_in += len(events)
+
+    def flush(self, now: float = None, force: bool = False) -> list:
+        """Returns the coalesced events once the window has passed"""
+        if not self._pending:
+            return []
+        if now is None:
+            now = self.clock()
+        if not force and now - self._first_time < self.window:
+            return []
+
+        events = coalesce(self._pending, self.max_drivers)
+        self._pending = []
+        self.events_out += len(events)
+        return events
+
+
+def coalesce(events, max_drivers: int = 3) -> list:
+    """Groups related events, see EventCoalescer"""
+    # Union-find over driver names to find the groups of battling cars,
+    # size counts the cars of each root
+    parent = {}
+    size = {}
+
+    def find(name):
+        while parent.setdefault(name, name) != name:
+            parent[name] = parent[parent[name]]
+            name = parent[name]
+        return name
+
+    pairs = [event for event in events if event.type in PAIR_EVENTS]
+    pairs.sort(key=lambda event: PAIR_EVENTS.index(event.type))
+    joined = []
+    battles = {}
+    for event in pairs:
+        driver_a, driver_b = event.params["driver_a"], event.params["driver_b"]
+        a = find(driver_a)
+        b = find(driver_b)
+        if a != b:
+            merged = size.get(a, 1) + size.get(b, 1)
+            if merged > max_drivers:
+                key = (min(driver_a, driver_b), max(driver_a, driver_b))
+                battles.setdefault(key, []).append(event)
+                continue
+            parent[a] = b
+            size[b] = merged
+        joined.append(event)
+    for event in joined:
+        battles.setdefault(find(event.params["driver_a"]), []).append(event)
+
+    by_type = {}
+    for event in events:
+        if event.type not in PAIR_EVENTS and event.type not in SOLO_EVENTS:
+            by_type.setdefault(event.type, []).append(event)
+
+    coalesced = [event for event in events if event.type in SOLO_EVENTS]
+    for group in battles.values():
+        if len(group) == 1:
+            coalesced.append(group[0])
+            continue
+        drivers = []
+        for event in group:
+            for name in (event.params["driver_a"], event.params["driver_b"]):
+                if name not in drivers:
+                    drivers.append(name)
+        coalesced.append(CompositeEvent(group, "battle", drivers))
+    for event_type, group in by_type.items():
+        if len(group) == 1:
+            coalesced.append(group[0])
+        else:
+            coalesced.append(CompositeEvent(group, event_type))
+    return coalesced
@@ -0,0 +1,90 @@
+"""
+Config
+
+Settings shared by the in-game app (YaboAI.py) and the race engine process
+(race_engine.py)
+"""
+
+import os
+import tempfile
+
+# Set to a file path (e.g. "race.ytl.gz") to record every telemetry read
+# so the race can be replayed headless with replay.py
+RECORD_TELEMETRY_PATH = None
+# Set to a file path (e.g. "race.yel") to append every detected event to a
+# binary event log, read it with eventlog.py
+EVENT_LOG_PATH = None
+# Seconds to hold events so related ones can be merged into one prompt.
+# 0 only merges the events of a single update
+COALESCE_WINDOW = 0
+# Most cars merged into one battle prompt, longer trains are split
+COALESCE_MAX_DRIVERS = 3
+# Generate the next line while the current one is playing
+SPECULATIVE_COMMENTARY = True
+# Lines generated ahead in one batch when several events are waiting, fewer
+# if they would expire before their turn. 1 only generates the next line
+COMMENTARY_BATCH = 4
+# Seconds a line is expected to take until some have been played
+LINE_SECONDS = 10
+# Have the sidecar render driver names and stock phrases at session start
+PRELOAD_PHRASES = True
+# Let the sidecar answer repeats of an event from its response cache
+CACHE_COMMENTARY = True
+# Lines can't overlap, so one worker plays them and a couple more may wait
+COMMENTARY_WORKERS = 1
+COMMENTARY_QUEUE = 2
+# Seconds a commentary job may take from being queued to the end of its audio
+COMMENTARY_DEADLINE = 90
+# Keep per-car state in NumPy arrays (vector_state.py). Faster from around 60
+# cars, slower than the default on smaller grids
+VECTORIZED_STATE = False
+# Sample a few cars every frame (sampler.py) instead of the whole grid every
+# UPDATE_INTERVAL seconds. Not used with VECTORIZED_STATE, which reads the
+# grid in one batch
+ADAPTIVE_SAMPLING = True
+# Seconds between full updates without ADAPTIVE_SAMPLING
+UPDATE_INTERVAL = 5
+# Seconds between passing new events to the commentary queue
+DISPATCH_INTERVAL = 1
+# Every car's position is read at least this often (seconds)
+SAMPLE_INTERVAL = 0.5
+# Seconds of sampling work allowed per frame
+SAMPLE_FRAME_BUDGET = 0.001
+# Sample the player's car physics on a background thread (incidents.py) to
+# catch collisions and off-track excursions. INCIDENT_SAMPLE_RATE is in
+# samples a second, IMPACT_G the horizontal g that counts as an impact and
+# OFF_TRACK_TIME how long 3 or more tyres must be off the track
+INCIDENT_DETECTION = True
+INCIDENT_SAMPLE_RATE = 200
+IMPACT_G = 5.0
+OFF_TRACK_TIME = 1.0
+# Detectors (detectors.py) to turn off, e.g. ("long_stint",). Detectors that
+# don't apply to the session type are turned off as well
+DISABLED_DETECTORS = ()
+# Set to a file path to export stage timings and counters every
+# METRICS_INTERVAL seconds, as JSON if it ends in .json and otherwise in the
+# Prometheus text format (e.g. for node_exporter's textfile collector)
+METRICS_PATH = None
+METRICS_INTERVAL = 10
+# Log records under LOG_LEVEL ("debug", "info", "warning" or "error") are
+# dropped, the rest are appended to LOG_PATH by a background thread. Those
+# at LOG_CONSOLE_LEVEL or above also go to the console, at most
+# LOG_CONSOLE_LINES a frame
+LOG_PATH = os.path.join(tempfile.gettempdir(), "yaboai.log")
+LOG_LEVEL = "info"
+LOG_CONSOLE_LEVEL = "info"
+LOG_CONSOLE_LINES = 5
+# Records kept a second for each message key, and keys that only keep every
+# nth record (e.g. the per car pair "drs_available" debug lines)
+LOG_RATE = 5
+LOG_SAMPLE = {"drs_available": 10}
+# Run detection, scheduling and commentary in a separate process
+# (python race_engine.py). The game only copies telemetry into the shared
+# memory ring RING_NAME and applies the camera commands that come back. Give
+# each lobby its own RING_NAME to serve several from one host.py
+SPLIT_ENGINE = False
+RING_NAME = "yaboai_telemetry"
+# Cars the game copies into the ring every frame
+RING_CARS_PER_FRAME = 4
+# Seconds between race engine updates in split mode
+ENGINE_TICK = 0.02
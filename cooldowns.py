@@ -0,0 +1,149 @@
+"""
+Cooldowns
+
+When an event may be raised again for the same car or pair of cars. Each
+key (event type and car ids) cools down for a number of laps and seconds
+after its event, so a battle being reported doesn't hold back the others.
+Expired keys are dropped by a hashed timer wheel, so a race with thousands
+of keys never scans them
+"""
+
+from collections import defaultdict
+
+
+def pair(event_type: str, car_a, car_b) -> tuple:
+    """The key of event_type for two cars, whichever of them is ahead"""
+    if car_b < car_a:
+        car_a, car_b = car_b, car_a
+    return (event_type, car_a, car_b)
+
+
+class TimerWheel:
+    """
+    TimerWheel
+
+    slots buckets of tick seconds each. An item scheduled for a deadline
+    goes into the bucket of the next tick and advance() only visits the
+    buckets of the ticks passed since its last call, so scheduling and
+    expiring an item are O(1) however many are waiting, and it is handed
+    out at most a tick late. Items more than a turn of the wheel (slots *
+    tick seconds) away stay in their bucket until the turn they are due
+    """
+
+    def __init__(self, tick: float = 0.5, slots: int = 512):
+        self.tick = tick
+        self._slots = [[] for _ in range(slots)]
+        self._tick = None  # Last tick advanced to
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def schedule(self, item, deadline: float):
+        tick = -int(-deadline // self.tick)
+        if self._tick is not None and tick <= self._tick:
+            # Due already, the next advance() hands it out
+            tick = self._tick + 1
+        self._slots[tick % len(self._slots)].append((deadline, item))
+        self._count += 1
+
+    def advance(self, now: float) -> list:
+        """The items whose deadline is now or earlier"""
+        tick = int(now // self.tick)
+        slots = self._slots
+        if self._tick is None:
+            # The first call looks at every bucket
+            first = tick - len(slots) + 1
+        else:
+            first = self._tick + 1
+        due = []
+        # A whole turn visits every bucket, a longer gap needs no more
+        for passed in range(first, min(tick, first + len(slots) - 1) + 1):
+            bucket = slots[passed % len(slots)]
+            if not bucket:
+                continue
+            waiting = []
+            for deadline, item in bucket:
+                if deadline <= now:
+                    due.append(item)
+                else:
+                    waiting.append((deadline, item))
+            slots[passed % len(slots)] = waiting
+        if self._tick is None or tick > self._tick:
+            self._tick = tick
+        self._count -= len(due)
+        return due
+
+
+class _Cooldown:
+    __slots__ = ("lap", "until")
+
+    def __init__(self, lap: int, until: float):
+        self.lap = lap
+        self.until = until
+
+
+class Cooldowns:
+    """
+    Cooldowns
+
+    start() cools a key down until laps laps after lap (never for None,
+    once per race) and seconds after now. ready() is an O(1) lookup, True
+    once both have passed or if the key never started.
+
+    expire() drops the keys that are ready for good. Their seconds run out
+    on the timer wheel, keys still waiting on their lap then move to a
+    bucket for that lap, emptied once lap is the lowest lap on track. Laps
+    are the cars' own, the race leader's for race wide keys, and the lowest
+    lap is behind all of them, so no key is dropped early
+    """
+
+    def __init__(self, tick: float = 0.5, slots: int = 512):
+        self._keys = {}
+        self._wheel = TimerWheel(tick, slots)
+        self._laps = defaultdict(list)
+        self._lap = None  # Lowest lap expired up to
+        self.expired = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def ready(self, key, lap: int, now: float) -> bool:
+        cooldown = self._keys.get(key)
+        if cooldown is None:
+            return True
+        return (
+            cooldown.lap is not None and lap >= cooldown.lap and now >= cooldown.until
+        )
+
+    def start(self, key, lap: int, now: float, laps: int = 1, seconds: float = 0):
+        cooldown = _Cooldown(None if laps is None else lap + laps, now + seconds)
+        self._keys[key] = cooldown
+        if cooldown.lap is not None:
+            self._wheel.schedule((key, cooldown), cooldown.until)
+
+    def expire(self, now: float, lap: int):
+        """Drops the keys that are ready at now for every car on lap or later"""
+        keys = self._keys
+        if self._lap is None:
+            self._lap = lap
+        for key, cooldown in self._wheel.advance(now):
+            if keys.get(key) is not cooldown:
+                continue  # Started again since
+            if cooldown.lap <= lap:
+                del keys[key]
+                self.expired += 1
+            else:
+                # Not before a lap already emptied, the lowest lap can drop
+                # when a car joins
+                self._laps[max(cooldown.lap, self._lap + 1)].append((key, cooldown))
+
+        while self._lap < lap:
+            self._lap += 1
+            for key, cooldown in self._laps.pop(self._lap, ()):
+                if keys.get(key) is cooldown:
+                    del keys[key]
+                    self.expired += 1
@@ -0,0 +1,264 @@
+"""
+Detectors
+
+The per-driver event checks as plugins. Each detector declares the
+telemetry fields it needs so Driver.sample() only reads what the enabled
+detectors (and RaceState's own checks) use
+"""
+
+from instrumentation import metrics
+from log import log
+from models import Driver, Event, EventType, RaceState
+from telemetry import CarState, Reading
+from third_party.sim_info import AC_RACE
+
+# Detector classes in the order they run, see register()
+DETECTORS = []
+
+
+def register(detector_class):
+    """Class decorator adding a Detector to the default DetectorSet"""
+    DETECTORS.append(detector_class)
+    return detector_class
+
+
+class Detector:
+    """
+    Detector
+
+    Checks one driver for one kind of event. fields are the CarState and
+    Reading names it needs, cooldown the number of laps before the same
+    driver can raise the same event again (None for once per race),
+    cooldown_time the seconds it must also wait and sessions the sim_info
+    session types it runs in (None for all of them).
+
+    check() appends Events to events. It runs every time the driver is
+    sampled and may keep state on the driver
+    """
+
+    name = ""
+    fields = ()
+    cooldown = 1
+    cooldown_time = 0
+    sessions = None
+
+    def __init__(self):
+        self.metric = "detector_" + self.name
+        self.events = 0
+
+    def check(self, driver, events):
+        raise NotImplementedError
+
+    def ready(self, driver, event_type: str) -> bool:
+        """False while event_type is cooling down for driver"""
+        return driver.cooldowns.ready(
+            (event_type, driver.id), driver.lap_count, driver.sample_time
+        )
+
+    def emit(self, driver, events, event_type: str, params):
+        log.info(event_type, "EVENT: {} - {}", event_type, driver.name)
+        events.append(Event(event_type, driver.id, params))
+        driver.cooldowns.start(
+            (event_type, driver.id),
+            driver.lap_count,
+            driver.sample_time,
+            self.cooldown,
+            self.cooldown_time,
+        )
+        self.events += 1
+
+
+class DetectorSet:
+    """
+    DetectorSet
+
+    The detectors a race runs. configure() disables detectors by name and
+    drops the ones that don't apply to the session type, it can be called
+    again when the session changes. fields is the union of the fields the
+    active detectors, Driver and RaceState need
+    """
+
+    def __init__(self, detectors=None):
+        if detectors is None:
+            detectors = [detector_class() for detector_class in DETECTORS]
+        self.detectors = detectors
+        self.configure()
+
+    def configure(self, session: int = None, disabled=()):
+        self.active = [
+            detector
+            for detector in self.detectors
+            if detector.name not in disabled
+            and (
+                session is None
+                or detector.sessions is None
+                or session in detector.sessions
+            )
+        ]
+        fields = set(RaceState.FIELDS)
+        fields.update(Driver.FIELDS)
+        for detector in self.active:
+            fields.update(detector.fields)
+        self.fields = frozenset(fields)
+
+    def run(self, driver) -> list:
+        events = []
+        start = metrics.start()
+        for detector in self.active:
+            detector.check(driver, events)
+            start = metrics.lap(detector.metric, start)
+        return events
+
+    def stats(self) -> dict:
+        """Events raised and cost so far of every detector"""
+        stats = {}
+        for detector in self.detectors:
+            histogram = metrics.histograms.get(detector.metric)
+            stats[detector.name] = {
+                "active": detector in self.active,
+                "events": detector.events,
+                "calls": histogram.count if histogram else None,
+                "seconds": histogram.sum if histogram else None,
+            }
+        return stats
+
+
+@register
+class DNFDetector(Detector):
+    """The driver has left the game"""
+
+    name = "dnf"
+    fields = (Reading.CONNECTED,)
+    cooldown = None
+    sessions = (AC_RACE,)
+
+    def check(self, driver, events):
+        connected = driver.sampled_connected
+        if driver.connected and not connected and self.ready(driver, EventType.DNF):
+            self.emit(
+                driver,
+                events,
+                EventType.DNF,
+                {"driver": driver.name, "reason": "Disconnected"},
+            )
+
+
+@register
+class PitDetector(Detector):
+    """Pit entries and the duration of the driver's pitstop"""
+
+    name = "pit"
+    fields = (Reading.IN_PIT, CarState.LAST_LAP, Reading.TYRE_COMPOUND)
+    sessions = (AC_RACE,)
+
+    def check(self, driver, events):
+        in_pit = driver.sampled_in_pit
+        if not driver.in_pit and in_pit and self.ready(driver, EventType.ENTERED_PIT):
+            driver.latest_pit_start = driver.telemetry.clock()
+            driver.pit_stops += 1
+            self.emit(
+                driver,
+                events,
+                EventType.ENTERED_PIT,
+                {
+                    "driver": driver.name,
+                    "lap_count": driver.lap_count,
+                    "last_lap": driver.last_lap,
+                    "compound": driver.compound,
+                },
+            )
+        elif driver.in_pit and not in_pit and driver.latest_pit_start is not None:
+            duration = driver.telemetry.clock() - driver.latest_pit_start
+            if duration > 60 and self.ready(driver, EventType.LONG_PIT):
+                event_type = EventType.LONG_PIT
+            elif duration < 30 and self.ready(driver, EventType.QUICK_PIT):
+                event_type = EventType.QUICK_PIT
+            else:
+                event_type = None
+            if event_type is not None:
+                self.emit(
+                    driver,
+                    events,
+                    event_type,
+                    {
+                        "driver": driver.name,
+                        "compound": driver.compound,
+                        "duration": int(duration),
+                    },
+                )
+
+
+@register
+class LapHistoryRecorder(Detector):
+    """
+    Records completed laps and stints in the driver's LapHistory. In and out
+    laps are flagged so they don't count towards the stint pace. Raises no
+    events
+    """
+
+    name = "lap_history"
+    fields = (CarState.LAST_LAP, Reading.IN_PIT, Reading.TYRE_COMPOUND)
+
+    def check(self, driver, events):
+        in_pit = driver.sampled_in_pit
+        if driver.lap_completed:
+            if driver.last_lap > 0:
+                driver.history.add_lap(
+                    driver.lap_count, driver.last_lap, driver.lap_in_pit or in_pit
+                )
+            driver.lap_completed = False
+            driver.lap_in_pit = in_pit
+        elif in_pit:
+            driver.lap_in_pit = True
+
+        if driver.sampled_compound != driver.history.stint.compound:
+            driver.history.new_stint(driver.sampled_compound, driver.lap_count)
+
+
+@register
+class BestLapDetector(Detector):
+    """The driver has set their personal best lap"""
+
+    name = "best_lap"
+    fields = (CarState.LAST_LAP, CarState.BEST_LAP)
+
+    def check(self, driver, events):
+        # Both are 0 until the driver has a lap time
+        if (
+            driver.last_lap > 0
+            and driver.last_lap == driver.best_lap
+            and self.ready(driver, EventType.BEST_LAP)
+        ):
+            self.emit(
+                driver,
+                events,
+                EventType.BEST_LAP,
+                {"driver": driver.name, "lap_time": driver.best_lap},
+            )
+
+
+@register
+class LongStintDetector(Detector):
+    """Tire age, raises an event once the tires are over 15 laps old"""
+
+    name = "long_stint"
+    fields = (Reading.TYRE_COMPOUND, CarState.LAST_LAP)
+    sessions = (AC_RACE,)
+
+    def check(self, driver, events):
+        compound = driver.sampled_compound
+        if compound != driver.compound:
+            driver.tire_age = 0
+            driver.last_compound_change_lap = 0
+        else:
+            driver.tire_age = driver.lap_count - driver.last_compound_change_lap
+            if driver.tire_age > 15 and self.ready(driver, EventType.LONG_STINT):
+                params = {
+                    "driver": driver.name,
+                    "lap_count": driver.lap_count,
+                    "tire_age": driver.tire_age,
+                    "last_lap": driver.last_lap,
+                    "compound": driver.compound,
+                }
+                params.update(driver.history.stint.params())
+                self.emit(driver, events, EventType.LONG_STINT, params)
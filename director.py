@@ -0,0 +1,54 @@
+"""
+Camera director
+
+Picks the car to show when no event asks for one, from the race state's
+battles and spline index instead of at random
+"""
+
+import random
+
+# Two cars closer than this (fraction of a lap) are worth showing even if
+# they aren't battling, e.g. a car being lapped
+TRAFFIC_DISTANCE = 0.005
+
+
+class CameraDirector:
+    """
+    CameraDirector
+
+    pick() returns the attacker of the best battle. Battles score higher the
+    more cars they hold, the tighter they are and the further up the order
+    they run. Without a battle it picks the car behind the closest pair on
+    track, and failing that a random car
+    """
+
+    def __init__(self, state, rng=random):
+        self.state = state
+        self.rng = rng
+
+    @staticmethod
+    def score(battle) -> float:
+        return len(battle.cars) / (1 + battle.span) + 1 / battle.position
+
+    def pick(self, exclude=None):
+        """The id of the car to focus on, never exclude if there is another"""
+        battles = [
+            battle
+            for battle in self.state.battles.battles
+            if battle.attacker != exclude
+        ]
+        if battles:
+            return max(battles, key=self.score).attacker
+
+        track = self.state.track
+        if len(track) > 1:
+            behind, ahead, distance = track.closest_pair()
+            if distance <= TRAFFIC_DISTANCE and behind != exclude:
+                return behind
+
+        drivers = [
+            driver.id for driver in self.state.drivers[1:] if driver.id != exclude
+        ]
+        if not drivers:
+            return None
+        return self.rng.choice(drivers)
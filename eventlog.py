@@ -0,0 +1,409 @@
+"""
+Event log
+
+Every detected event appended to a memory-mapped binary file, so post-race
+tools and replays can scan a race's events without parsing console output.
+
+The file is a header followed by fixed size records in the order they were
+written, so they are sorted by time. A record is either an event or a
+string: driver names and other text params are written once as string
+records and referred to by number, and so is each event type's list of
+fields (EventType.FIELDS). An event record holds its time (wall clock
+seconds, taken from the monotonic event time), the number of its type's
+field list, the driver id and up to MAX_FIELDS params in typed slots.
+
+A tiny index (path + ".idx", JSON) is kept beside it with the count of
+each event type, the string records and the time of every INDEX_EVERY-th
+record, so a reader can start at a time or list the types without a scan
+
+    python eventlog.py race.yel --type overtake --since 600
+"""
+
+import argparse
+import bisect
+import json
+import mmap
+import os
+import struct
+import time
+from collections import Counter
+
+from models import Event, EventType
+
+MAGIC = b"YABOEVT1"
+# magic, record size, records written, wall clock and monotonic time at open
+HEADER = struct.Struct("<8sHxxxxxxQdd")
+HEADER_SIZE = 64
+MAX_FIELDS = 8
+# time, field list (string number) or string length, driver id or STRING,
+# slot kinds (2 bits each), slots
+RECORD = struct.Struct("<dIhH{}d".format(MAX_FIELDS))
+RECORD_HEAD = struct.Struct("<dIhH")
+STRING_BYTES = RECORD.size - RECORD_HEAD.size
+# Driver id marking a string record
+STRING = -32768
+ABSENT, INT, FLOAT, TEXT = range(4)
+# Records the file grows by
+GROW = 4096
+INDEX_EVERY = 1024
+# Events are logged up to this many seconds after they were detected (an
+# incident once it has settled), so records are only in time order to
+# within it
+DISORDER = 5.0
+
+
+class EventLog:
+    """
+    EventLog
+
+    Appends events to path, carrying on from the records already there.
+    One writer at a time, the header's record count is updated after each
+    append so a reader only ever sees whole records. Events whose params
+    don't fit their type's fields are stored with their params sorted, and
+    params past MAX_FIELDS are left out
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.wall_base = time.time()
+        self.monotonic_base = time.monotonic()
+        exists = os.path.exists(path) and os.path.getsize(path) >= HEADER_SIZE
+        self._file = open(path, "r+b" if exists else "w+b")
+        self._map = None
+        self._capacity = 0
+        self.count = 0
+        self.types = Counter()
+        self.strings = {}
+        self.schemas = {}
+        self.string_records = []
+        self.times = []
+        if exists:
+            self._resize(-(-(os.path.getsize(path) - HEADER_SIZE) // RECORD.size))
+            magic, size, self.count = HEADER.unpack_from(self._map, 0)[:3]
+            if magic != MAGIC or size != RECORD.size:
+                raise ValueError("{} is not an event log".format(path))
+            self._rebuild()
+        else:
+            self._resize(GROW)
+        HEADER.pack_into(
+            self._map,
+            0,
+            MAGIC,
+            RECORD.size,
+            self.count,
+            self.wall_base,
+            self.monotonic_base,
+        )
+
+    def __len__(self):
+        return self.count
+
+    def append(self, event: Event):
+        when = self.wall_base + (event.time - self.monotonic_base)
+        fields = EventType.FIELDS.get(event.type)
+        if fields is None or not set(event.params) <= set(fields):
+            fields = tuple(sorted(event.params))
+        fields = fields[:MAX_FIELDS]
+        schema = self.schemas.get((event.type, fields))
+        if schema is None:
+            schema = self._string("{}\t{}".format(event.type, ",".join(fields)), when)
+            self.schemas[(event.type, fields)] = schema
+
+        kinds = 0
+        slots = [0.0] * MAX_FIELDS
+        params = event.params
+        for slot, name in enumerate(fields):
+            value = params.get(name)
+            if value is None:
+                continue
+            if isinstance(value, str):
+                kind = TEXT
+                value = self._string(value, when)
+            elif isinstance(value, int):
+                kind = INT
+            else:
+                kind = FLOAT
+            kinds |= kind << (2 * slot)
+            slots[slot] = value
+
+        self._reserve(1)
+        values = [when, schema, event.driver_id, kinds] + slots
+        RECORD.pack_into(self._map, self._offset(self.count), *values)
+        self._written(when)
+        self.types[event.type] += 1
+
+    def extend(self, events):
+        for event in events:
+            self.append(event)
+
+    def flush(self):
+        self._map.flush()
+        self._write_index()
+
+    def close(self):
+        if self._map is None:
+            return
+        self.flush()
+        self._map.close()
+        self._map = None
+        self._file.truncate(self._offset(self.count))
+        self._file.close()
+
+    def _string(self, text: str, when: float) -> int:
+        """
+        The number of text's string record, written if it is new with the
+        time of the event that needs it
+        """
+        number = self.strings.get(text)
+        if number is not None:
+            return number
+        data = text.encode("utf-8")
+        records = max(1, -(-len(data) // STRING_BYTES))
+        self._reserve(records)
+        start = self.count
+        for index in range(records):
+            offset = self._offset(start + index)
+            RECORD_HEAD.pack_into(self._map, offset, when, len(data), STRING, 0)
+            chunk = data[index * STRING_BYTES : (index + 1) * STRING_BYTES]
+            self._map[
+                offset + RECORD_HEAD.size : offset + RECORD_HEAD.size + len(chunk)
+            ] = chunk
+        number = len(self.string_records)
+        self.string_records.append(start)
+        self.strings[text] = number
+        for _ in range(records):
+            self._written(when)
+        return number
+
+    def _written(self, when: float):
+        if self.count % INDEX_EVERY == 0:
+            self.times.append(when)
+        self.count += 1
+        struct.pack_into("<Q", self._map, 16, self.count)
+
+    def _offset(self, record: int) -> int:
+        return HEADER_SIZE + record * RECORD.size
+
+    def _reserve(self, records: int):
+        if self.count + records > self._capacity:
+            self._resize(self.count + records + GROW)
+
+    def _resize(self, capacity: int):
+        if self._map is not None:
+            self._map.close()
+        # Only ever grown, a reader mapping the file can't have it shrink
+        # under it until the log is closed
+        self._file.truncate(self._offset(capacity))
+        self._capacity = capacity
+        self._map = mmap.mmap(self._file.fileno(), self._offset(capacity))
+
+    def _rebuild(self):
+        """Recovers the strings, schemas and index of the records already there"""
+        reader = EventLogReader(self.path, self._map)
+        reader.scan_strings()
+        self.string_records = reader.string_records
+        for number, text in enumerate(reader.strings):
+            self.strings[text] = number
+        for number, (event_type, fields) in reader.schemas.items():
+            self.schemas[(event_type, fields)] = number
+        self.times = reader.times
+        self.types = reader.counts()
+
+    def _write_index(self):
+        index = {
+            "records": self.count,
+            "types": dict(self.types),
+            "strings": self.string_records,
+            "times": self.times,
+        }
+        temporary = self.path + ".idx.tmp"
+        with open(temporary, "w") as file:
+            json.dump(index, file)
+        os.replace(temporary, self.path + ".idx")
+
+
+class EventLogReader:
+    """
+    EventLogReader
+
+    Reads an event log, also while it is being written. The index is used
+    when it covers every record, otherwise the strings and times are found
+    with a scan
+    """
+
+    def __init__(self, path: str, buffer=None):
+        self.path = path
+        if buffer is None:
+            with open(path, "rb") as file:
+                buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = buffer
+        magic, size, self.count, self.wall_base, self.monotonic_base = (
+            HEADER.unpack_from(buffer, 0)
+        )
+        if magic != MAGIC or size != RECORD.size:
+            raise ValueError("{} is not an event log".format(path))
+        self.strings = []
+        self.string_records = []
+        self.schemas = {}
+        self.times = []
+        self._types = None
+        self._scanned = False
+
+        try:
+            with open(path + ".idx") as file:
+                index = json.load(file)
+        except (OSError, ValueError):
+            index = None
+        if index is not None and index["records"] == self.count:
+            self._types = Counter(index["types"])
+            self.string_records = index["strings"]
+            self.times = index["times"]
+            for record in self.string_records:
+                self._add_string(self._read_string(record)[0])
+            self._scanned = True
+
+    def __len__(self):
+        return self.count
+
+    def counts(self) -> Counter:
+        """Events of each type"""
+        self.scan_strings()
+        return self._types
+
+    def scan_strings(self):
+        """Finds the strings, type counts and index times without the index"""
+        if self._scanned:
+            return
+        schemas = Counter()
+        record = 0
+        while record < self.count:
+            offset = HEADER_SIZE + record * RECORD.size
+            when, schema, driver_id, _ = RECORD_HEAD.unpack_from(self._buffer, offset)
+            if record % INDEX_EVERY == 0:
+                self.times.append(when)
+            if driver_id != STRING:
+                schemas[schema] += 1
+                record += 1
+                continue
+            text, records = self._read_string(record)
+            self.string_records.append(record)
+            self._add_string(text)
+            for skipped in range(record + 1, record + records):
+                if skipped % INDEX_EVERY == 0:
+                    self.times.append(when)
+            record += records
+        self._types = Counter()
+        for schema, count in schemas.items():
+            self._types[self.schemas[schema][0]] += count
+        self._scanned = True
+
+    def records(self, types=None, since: float = None, until: float = None):
+        """
+        (type, time, driver id, params) of the events logged between since
+        and until (wall clock seconds), of the given types if any
+        """
+        self.scan_strings()
+        start = 0
+        if since is not None:
+            chunk = bisect.bisect_left(self.times, since - DISORDER) - 1
+            start = max(0, chunk) * INDEX_EVERY
+        wanted = None
+        if types is not None:
+            wanted = set(
+                number
+                for number, (event_type, fields) in self.schemas.items()
+                if event_type in types
+            )
+        strings = self.strings
+        schemas = self.schemas
+        end = HEADER_SIZE + self.count * RECORD.size
+        view = memoryview(self._buffer)[HEADER_SIZE + start * RECORD.size : end]
+        for when, schema, driver_id, kinds, *slots in RECORD.iter_unpack(view):
+            if driver_id == STRING:
+                continue
+            if since is not None and when < since:
+                continue
+            if until is not None and when > until:
+                if when > until + DISORDER:
+                    break
+                continue
+            if wanted is not None and schema not in wanted:
+                continue
+            event_type, fields = schemas[schema]
+            params = {}
+            for slot, name in enumerate(fields):
+                kind = (kinds >> (2 * slot)) & 3
+                if kind == INT:
+                    params[name] = int(slots[slot])
+                elif kind == FLOAT:
+                    params[name] = slots[slot]
+                elif kind == TEXT:
+                    params[name] = strings[int(slots[slot])]
+            yield event_type, when, driver_id, params
+        view.release()
+
+    def events(self, types=None, since: float = None, until: float = None):
+        """The logged events as Events, time is in wall clock seconds"""
+        for event_type, when, driver_id, params in self.records(types, since, until):
+            yield Event(event_type, driver_id, params, when)
+
+    def close(self):
+        self._buffer.close()
+
+    def _read_string(self, record: int):
+        """The text of the string starting at record and its record count"""
+        offset = HEADER_SIZE + record * RECORD.size
+        length = RECORD_HEAD.unpack_from(self._buffer, offset)[1]
+        records = max(1, -(-length // STRING_BYTES))
+        data = b"".join(
+            self._buffer[
+                HEADER_SIZE + index * RECORD.size + RECORD_HEAD.size : HEADER_SIZE
+                + (index + 1) * RECORD.size
+            ]
+            for index in range(record, record + records)
+        )
+        return data[:length].decode("utf-8"), records
+
+    def _add_string(self, text: str):
+        number = len(self.strings)
+        self.strings.append(text)
+        event_type, tab, fields = text.partition("\t")
+        if tab:
+            self.schemas[number] = (
+                event_type,
+                tuple(fields.split(",")) if fields else (),
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read a YaboAI event log")
+    parser.add_argument("path")
+    parser.add_argument("--type", action="append", help="Only events of this type")
+    parser.add_argument(
+        "--since", type=float, help="Seconds after the first record to start at"
+    )
+    parser.add_argument("--until", type=float, help="Seconds after the first record")
+    parser.add_argument("--summary", action="store_true", help="Only count events")
+    args = parser.parse_args()
+
+    reader = EventLogReader(args.path)
+    print("Events: {}".format(sum(reader.counts().values())))
+    for event_type, count in sorted(reader.counts().items()):
+        print("  {}: {}".format(event_type, count))
+    if args.summary:
+        return
+
+    reader.scan_strings()
+    first = reader.times[0] if reader.times else 0
+    since = None if args.since is None else first + args.since
+    until = None if args.until is None else first + args.until
+    for event_type, when, driver_id, params in reader.records(args.type, since, until):
+        print(
+            "{:10.3f}  {:<16} {:>3}  {}".format(
+                when - first, event_type, driver_id, params
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Lap history
+
+Per-driver lap times and stint statistics in typed arrays, about 11 bytes
+a lap, so a 24 hour race of a few thousand laps takes tens of KB per car
+"""
+
+from array import array
+
+# Weight of the newest lap in the EWMA pace
+EWMA_ALPHA = 0.3
+
+
+class Stint:
+    """
+    Stint
+
+    Running statistics of the laps on one set of tyres, updated in O(1) per
+    lap. In and out laps (the car was in the pits) count towards laps but
+    not towards the pace figures
+    """
+
+    __slots__ = (
+        "number",
+        "compound",
+        "start_lap",
+        "laps",
+        "clean_laps",
+        "ewma",
+        "_sum_x",
+        "_sum_y",
+        "_sum_xy",
+        "_sum_xx",
+    )
+
+    def __init__(self, number: int, compound: str, start_lap: int):
+        self.number = number
+        self.compound = compound
+        self.start_lap = start_lap
+        self.laps = 0
+        self.clean_laps = 0
+        self.ewma = None
+        self._sum_x = 0
+        self._sum_y = 0
+        self._sum_xy = 0
+        self._sum_xx = 0
+
+    def add(self, lap: int, lap_time: int, clean: bool):
+        self.laps += 1
+        if not clean:
+            return
+        x = lap - self.start_lap
+        self.clean_laps += 1
+        self._sum_x += x
+        self._sum_y += lap_time
+        self._sum_xy += x * lap_time
+        self._sum_xx += x * x
+        if self.ewma is None:
+            self.ewma = float(lap_time)
+        else:
+            self.ewma += EWMA_ALPHA * (lap_time - self.ewma)
+
+    @property
+    def average(self) -> float:
+        """Mean clean lap time in ms, None before the first clean lap"""
+        if not self.clean_laps:
+            return None
+        return self._sum_y / self.clean_laps
+
+    @property
+    def degradation(self) -> float:
+        """
+        Least squares slope of the clean lap times in ms per lap, positive
+        when the driver is getting slower. None with fewer than 3 clean laps
+        """
+        n = self.clean_laps
+        if n < 3:
+            return None
+        denominator = n * self._sum_xx - self._sum_x * self._sum_x
+        if not denominator:
+            return None
+        return (n * self._sum_xy - self._sum_x * self._sum_y) / denominator
+
+    def params(self) -> dict:
+        """Stint figures in seconds for event params, None if not known yet"""
+        figures = {}
+        for name, value in (
+            ("stint_average", self.average),
+            ("pace", self.ewma),
+            ("degradation", self.degradation),
+        ):
+            figures[name] = None if value is None else round(value / 1000, 3)
+        return figures
+
+
+class LapHistory:
+    """
+    LapHistory
+
+    Every lap of one driver in arrays of lap times, stint numbers and pit
+    flags indexed by lap number, plus the running Stint. Lookups are O(1).
+
+    The memory per car is deliberately not fixed: the arrays start with room
+    for capacity laps and double when a lap doesn't fit, so nothing is
+    dropped however long the race. A fixed ring of the last capacity laps
+    overwrote the start of a 24 hour race on a short track, growing costs
+    about 45KB per car for 4096 laps
+    """
+
+    def __init__(self, compound: str, capacity: int = 1024):
+        self.capacity = capacity
+        self.best_lap = None
+        self.stints = 1
+        self.stint = Stint(0, compound, 0)
+        self._laps = array("i", [-1]) * capacity
+        self._times = array("i", [0]) * capacity
+        self._stints = array("h", [0]) * capacity
+        self._pit = array("b", [0]) * capacity
+
+    def add_lap(self, lap: int, lap_time: int, pit: bool = False):
+        """lap is the number of the lap that was completed"""
+        if lap >= self.capacity:
+            self._grow(lap + 1)
+        self._laps[lap] = lap
+        self._times[lap] = lap_time
+        self._stints[lap] = self.stint.number
+        self._pit[lap] = pit
+        self.stint.add(lap, lap_time, not pit)
+        if not pit and (self.best_lap is None or lap_time < self.best_lap):
+            self.best_lap = lap_time
+
+    def new_stint(self, compound: str, start_lap: int):
+        self.stint = Stint(self.stints, compound, start_lap)
+        self.stints += 1
+
+    def lap_time(self, lap: int) -> int:
+        """Time of lap in ms, None if it's not recorded"""
+        if not 0 <= lap < self.capacity or self._laps[lap] != lap:
+            return None
+        return self._times[lap]
+
+    def lap(self, lap: int):
+        """(lap time, stint number, pit lap) of lap, None if not recorded"""
+        if not 0 <= lap < self.capacity or self._laps[lap] != lap:
+            return None
+        return self._times[lap], self._stints[lap], bool(self._pit[lap])
+
+    def _grow(self, laps: int):
+        capacity = max(self.capacity, 1)
+        while capacity < laps:
+            capacity *= 2
+        extra = capacity - self.capacity
+        self._laps.extend(array("i", [-1]) * extra)
+        self._times.extend(array("i", [0]) * extra)
+        self._stints.extend(array("h", [0]) * extra)
+        self._pit.extend(array("b", [0]) * extra)
+        self.capacity = capacity
@@ -0,0 +1,238 @@
+"""
+Session host
+
+Runs the race engine for several lobbies from one machine. Each lobby's
+app runs in split mode (SPLIT_ENGINE) with its own RING_NAME and the host
+runs one engine process per ring. The engines share one LLM/TTS sidecar,
+which shares its LLM fairly between them when started with --slots:
+
+    python -m llm.sidecar --slots 2
+    python host.py lobby_a lobby_b lobby_c
+
+--stand-in starts stand-in games that feed synthetic races into their own
+rings instead, to load test the host and the sidecar:
+
+    python host.py --stand-in 8 --cars 30 --duration 120
+"""
+
+import argparse
+import multiprocessing
+import os
+import queue
+import sys
+import time
+
+import config
+from instrumentation import metrics
+from llm.services import SIDECAR_PORT
+
+STAND_IN_RING = "yaboai_stand_in_{}"
+
+
+def session_path(path: str, ring_name: str) -> str:
+    """METRICS_PATH, EVENT_LOG_PATH or LOG_PATH with the ring name added"""
+    root, extension = os.path.splitext(path)
+    return "{}.{}{}".format(root, ring_name, extension)
+
+
+def serve_session(ring_name, tick, sidecar_port, stop, results):
+    """Engine process of one session"""
+    from llm.services import channel
+    from race_engine import run
+
+    channel.port = sidecar_port
+    metrics.enable()
+    path = None
+    if config.METRICS_PATH:
+        path = session_path(config.METRICS_PATH, ring_name)
+    if config.EVENT_LOG_PATH:
+        config.EVENT_LOG_PATH = session_path(config.EVENT_LOG_PATH, ring_name)
+    if config.LOG_PATH:
+        config.LOG_PATH = session_path(config.LOG_PATH, ring_name)
+
+    def report(stats):
+        # Sent before the engine shuts down, so a line still being
+        # generated doesn't hold the stats past SessionHost.stop's timeout
+        stats["metrics"] = metrics.snapshot()
+        results.put((ring_name, stats))
+
+    run(ring_name, tick, path, stop, report)
+
+
+def stand_in_game(ring_name, cars, seed, fps, speed, stop):
+    """
+    Game process feeding a SyntheticTelemetry race into ring_name, fps
+    frames a second with speed seconds of race time per second
+    """
+    from ring import RingWriter, TelemetryRing
+    from telemetry import SyntheticTelemetry
+    from third_party.sim_info import AC_RACE
+
+    telemetry = SyntheticTelemetry(cars, seed)
+    ring = TelemetryRing(ring_name, create=True)
+    writer = RingWriter(ring, telemetry, AC_RACE, config.RING_CARS_PER_FRAME)
+    frame = 1 / fps
+    next_frame = time.perf_counter()
+    while not stop.is_set():
+        telemetry.begin_tick(frame * speed)
+        writer.write(AC_RACE)
+        writer.commands()
+        next_frame += frame
+        time.sleep(max(0, next_frame - time.perf_counter()))
+    ring.close()
+
+
+class SessionHost:
+    """
+    SessionHost
+
+    One engine process per ring. watch() restarts the ones that died,
+    stop() ends them all and returns the stats of each session
+    """
+
+    def __init__(
+        self, rings, tick: float = config.ENGINE_TICK, sidecar_port=SIDECAR_PORT
+    ):
+        self.rings = list(rings)
+        self.tick = tick
+        self.sidecar_port = sidecar_port
+        self.restarts = 0
+        self._processes = {}
+        self._stop = multiprocessing.Event()
+        self._results = multiprocessing.Queue()
+
+    def start(self):
+        for ring_name in self.rings:
+            self._start(ring_name)
+
+    def _start(self, ring_name: str):
+        process = multiprocessing.Process(
+            target=serve_session,
+            args=(ring_name, self.tick, self.sidecar_port, self._stop, self._results),
+            name="engine-" + ring_name,
+            daemon=True,
+        )
+        process.start()
+        self._processes[ring_name] = process
+
+    def watch(self):
+        for ring_name, process in list(self._processes.items()):
+            if not process.is_alive() and not self._stop.is_set():
+                print(
+                    "Engine for {} exited with {}, restarting".format(
+                        ring_name, process.exitcode
+                    )
+                )
+                self.restarts += 1
+                self._start(ring_name)
+
+    def stop(self, timeout: float = 15) -> dict:
+        self._stop.set()
+        stats = {}
+        deadline = time.time() + timeout
+        # Drain the results before joining, a process can't exit while its
+        # queued results are unread
+        while len(stats) < len(self._processes) and time.time() < deadline:
+            try:
+                ring_name, session_stats = self._results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            stats[ring_name] = session_stats
+        for process in self._processes.values():
+            process.join(max(0, deadline - time.time()))
+            if process.is_alive():
+                process.terminate()
+        return stats
+
+
+def summary(ring_name: str, stats: dict) -> str:
+    histograms = stats["metrics"]["histograms"]
+    counters = stats["metrics"]["counters"]
+    update = histograms.get("engine_update", {"p50": 0, "p99": 0, "max": 0})
+    commentary = stats["commentary"]
+    return (
+        "{}: {} cars, {} samples lost, update p50 {:.2f}ms p99 {:.2f}ms "
+        "max {:.2f}ms, {} events, {} lines, {} failed, {} expired, "
+        "mean commentary wait {:.2f}s".format(
+            ring_name,
+            stats["cars"],
+            stats["lost"],
+            update["p50"] * 1e3,
+            update["p99"] * 1e3,
+            update["max"] * 1e3,
+            counters.get("events_detected", 0),
+            counters.get("commentary_lines", 0),
+            counters.get("commentary_failed", 0),
+            stats["expired"],
+            commentary["mean_wait"],
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the YaboAI race engine for several lobbies"
+    )
+    parser.add_argument("rings", nargs="*", help="RING_NAME of each lobby's app")
+    parser.add_argument("--tick", type=float, default=config.ENGINE_TICK)
+    parser.add_argument("--sidecar-port", type=int, default=SIDECAR_PORT)
+    parser.add_argument(
+        "--duration", type=float, default=None, help="seconds to run for"
+    )
+    parser.add_argument(
+        "--stand-in", type=int, default=0, metavar="SESSIONS", help="stand-in games"
+    )
+    parser.add_argument("--cars", type=int, default=30)
+    parser.add_argument("--fps", type=float, default=60)
+    parser.add_argument(
+        "--speed", type=float, default=1, help="stand-in race seconds per second"
+    )
+    args = parser.parse_args()
+
+    games = []
+    game_stop = multiprocessing.Event()
+    rings = list(args.rings)
+    for index in range(args.stand_in):
+        ring_name = STAND_IN_RING.format(index)
+        rings.append(ring_name)
+        game = multiprocessing.Process(
+            target=stand_in_game,
+            args=(ring_name, args.cars, index, args.fps, args.speed, game_stop),
+            daemon=True,
+        )
+        game.start()
+        games.append(game)
+    if not rings:
+        parser.error("no rings to serve")
+
+    host = SessionHost(rings, args.tick, args.sidecar_port)
+    host.start()
+    print("Serving {} sessions: {}".format(len(rings), ", ".join(rings)))
+    start = time.time()
+    try:
+        while args.duration is None or time.time() - start < args.duration:
+            time.sleep(1)
+            host.watch()
+    except KeyboardInterrupt:
+        pass
+
+    stats = host.stop()
+    game_stop.set()
+    for game in games:
+        game.join(5)
+    missing = [ring_name for ring_name in rings if ring_name not in stats]
+    for ring_name in rings:
+        if ring_name in stats:
+            print(summary(ring_name, stats[ring_name]))
+    if host.restarts:
+        print("{} engine restarts".format(host.restarts))
+    if missing:
+        sys.exit(
+            "No stats from {}, the engine didn't stop in time".format(
+                ", ".join(missing)
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Incidents
+
+Collisions and off-track excursions, read from the SimInfo physics page on
+a background thread. An impact lasts a few physics frames, far too short
+for the race state's update, so the page is sampled at a high rate into a
+ring buffer and the incidents found in it are handed to the game loop,
+which only ever takes what is ready and never waits.
+
+The physics page describes the player's car only
+"""
+
+import array
+import collections
+import math
+import threading
+import time
+
+from models import Event, EventType
+from sim_snapshot import PageReader
+
+FIELDS = ("speedKmh", "accG", "carDamage", "numberOfTyresOut")
+# The player's car
+PLAYER_CAR = 0
+# Another car closer than this (fraction of a lap, about 10m on a 5km
+# track) is taken to be the one the player hit
+CONTACT_DISTANCE = 0.002
+
+
+class Incident:
+    """
+    kind is EventType.COLLISION or EventType.OFF_TRACK. g is the peak
+    horizontal g, damage the damage taken and speed_before/speed_after the
+    speeds (km/h) around it
+    """
+
+    __slots__ = ("kind", "time", "g", "damage", "speed_before", "speed_after")
+
+    def __init__(self, kind: str, time: float, g: float, damage: float, speed_before):
+        self.kind = kind
+        self.time = time
+        self.g = g
+        self.damage = damage
+        self.speed_before = speed_before
+        self.speed_after = None
+
+    def __repr__(self):
+        return "Incident({}, {:.1f}g, damage {:.1f}, {} -> {} km/h)".format(
+            self.kind, self.g, self.damage, self.speed_before, self.speed_after
+        )
+
+
+class PhysicsRing:
+    """
+    PhysicsRing
+
+    The last capacity samples in typed arrays. There is one writer, which
+    fills a slot and then bumps written, so readers never take a lock: a
+    reader only looks at slots below written and at most capacity back
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self.written = 0
+        self.times = array.array("d", [0.0]) * capacity
+        self.speeds = array.array("f", [0.0]) * capacity
+        self.g = array.array("f", [0.0]) * capacity
+        self.damage = array.array("f", [0.0]) * capacity
+        self.tyres_out = array.array("b", [0]) * capacity
+
+    def push(self, time: float, speed: float, g: float, damage: float, tyres_out):
+        slot = self.written % self.capacity
+        self.times[slot] = time
+        self.speeds[slot] = speed
+        self.g[slot] = g
+        self.damage[slot] = damage
+        self.tyres_out[slot] = tyres_out
+        self.written += 1
+
+    def at(self, time: float) -> int:
+        """Index (a count, not a slot) of the last sample at or before time"""
+        index = self.written - 1
+        oldest = max(0, self.written - self.capacity)
+        while index > oldest and self.times[index % self.capacity] > time:
+            index -= 1
+        return index
+
+    def peak_g(self, start: int, end: int) -> float:
+        return max(self.g[index % self.capacity] for index in range(start, end + 1))
+
+
+class IncidentSampler:
+    """
+    IncidentSampler
+
+    Samples the physics page rate times a second on its own thread.
+
+    An impact starts with a horizontal g spike over impact_g or a damage
+    jump over damage_delta, and is reported settle seconds later, so the
+    peak g, total damage and speed after it are known. Speed and damage
+    before it are taken lookback seconds earlier, before the car started to
+    slow. Spikes within cooldown seconds of an impact belong to it.
+
+    An off-track excursion is off_track_tyres or more tyres out for
+    off_track_time seconds, reported once per excursion.
+
+    drain() returns the finished Incidents and can be called from any
+    thread
+    """
+
+    def __init__(
+        self,
+        sim_info,
+        rate: float = 200,
+        impact_g: float = 5.0,
+        damage_delta: float = 1.0,
+        off_track_tyres: int = 3,
+        off_track_time: float = 1.0,
+        settle: float = 0.5,
+        lookback: float = 0.3,
+        cooldown: float = 3.0,
+        clock=time.monotonic,
+    ):
+        self.reader = PageReader(sim_info.physics, FIELDS)
+        self.ring = PhysicsRing()
+        self.interval = 1 / rate
+        self.impact_g = impact_g
+        self.damage_delta = damage_delta
+        self.off_track_tyres = off_track_tyres
+        self.off_track_time = off_track_time
+        self.settle = settle
+        self.lookback = lookback
+        self.cooldown = cooldown
+        self.clock = clock
+        self.incidents = 0
+        self._ready = collections.deque()
+        self._impact = None
+        self._impact_start = None
+        self._damage_before = 0
+        self._last_impact = None
+        self._off_track_since = None
+        self._off_track_reported = False
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, name="incident-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(1)
+            if self._thread.is_alive():
+                # Still reading the page, it lets go of it when it exits
+                return
+        # Let go of the page view so SimInfo can close its maps
+        self.reader.page = None
+
+    def drain(self) -> list:
+        incidents = []
+        ready = self._ready
+        while ready:
+            incidents.append(ready.popleft())
+        return incidents
+
+    def _run(self):
+        next_sample = self.clock()
+        try:
+            while self._running:
+                self.sample()
+                next_sample += self.interval
+                delay = next_sample - self.clock()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # Fell behind (e.g. the game held the GIL), don't try to
+                    # catch up
+                    next_sample = self.clock()
+        finally:
+            self.reader.page = None
+
+    def sample(self):
+        """Reads one packet and checks it, unless the game hasn't published one"""
+        snapshot = self.reader.read()
+        if snapshot is None:
+            return
+        now = self.clock()
+        acceleration = snapshot.accG
+        # accG is x, y, z. Kerbs and bumps show up on y, impacts on x and z
+        g = math.hypot(acceleration[0], acceleration[2])
+        damage = sum(snapshot.carDamage)
+        ring = self.ring
+        previous_damage = (
+            ring.damage[(ring.written - 1) % ring.capacity] if ring.written else damage
+        )
+        ring.push(now, snapshot.speedKmh, g, damage, snapshot.numberOfTyresOut)
+        self._check_impact(now, g, damage - previous_damage)
+        self._check_off_track(now, snapshot.numberOfTyresOut)
+
+    def _check_impact(self, now: float, g: float, damage_delta: float):
+        ring = self.ring
+        if self._impact is None:
+            if g < self.impact_g and damage_delta < self.damage_delta:
+                return
+            if (
+                self._last_impact is not None
+                and now - self._last_impact < self.cooldown
+            ):
+                return
+            before = ring.at(now - self.lookback)
+            slot = before % ring.capacity
+            self._impact = Incident(EventType.COLLISION, now, g, 0, ring.speeds[slot])
+            self._impact_start = before
+            self._damage_before = ring.damage[slot]
+            return
+
+        impact = self._impact
+        if now - impact.time < self.settle:
+            return
+        end = ring.written - 1
+        impact.g = ring.peak_g(self._impact_start, end)
+        impact.damage = ring.damage[end % ring.capacity] - self._damage_before
+        impact.speed_after = ring.speeds[end % ring.capacity]
+        self._ready.append(impact)
+        self.incidents += 1
+        self._impact = None
+        self._last_impact = now
+
+    def _check_off_track(self, now: float, tyres_out: int):
+        if tyres_out < self.off_track_tyres:
+            self._off_track_since = None
+            self._off_track_reported = False
+            return
+        if self._off_track_since is None:
+            self._off_track_since = now
+        elif (
+            not self._off_track_reported
+            and now - self._off_track_since >= self.off_track_time
+        ):
+            ring = self.ring
+            before = ring.at(self._off_track_since) % ring.capacity
+            incident = Incident(
+                EventType.OFF_TRACK,
+                self._off_track_since,
+                0,
+                0,
+                ring.speeds[before],
+            )
+            incident.speed_after = ring.speeds[(ring.written - 1) % ring.capacity]
+            self._ready.append(incident)
+            self.incidents += 1
+            self._off_track_reported = True
+
+
+def incident_event(incident: Incident, state, driver_id: int = PLAYER_CAR) -> Event:
+    """
+    The Event for incident. A collision names the closest car on track as
+    driver_b when it is within CONTACT_DISTANCE
+    """
+    driver = None
+    for candidate in state.drivers:
+        if candidate.id == driver_id:
+            driver = candidate
+    params = {
+        "driver": driver.name if driver is not None else str(driver_id),
+        "speed_before": int(incident.speed_before),
+        "speed_after": int(incident.speed_after),
+    }
+    if incident.kind == EventType.COLLISION:
+        params["g"] = round(incident.g, 1)
+        params["damage"] = round(incident.damage, 1)
+        if len(state.track) > 1:
+            other, offset = state.track.nearest(driver_id)[0]
+            if abs(offset) <= CONTACT_DISTANCE:
+                for candidate in state.drivers:
+                    if candidate.id == other:
+                        params["driver_b"] = candidate.name
+    return Event(incident.kind, driver_id, params, incident.time)
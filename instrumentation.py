@@ -0,0 +1,161 @@
+"""
+Instrumentation
+
+Stage timers, latency histograms and counters for the update and
+commentary pipeline, exported to a local file as Prometheus text or JSON.
+Disabled by default, when disabled every call returns straight away
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+
+PREFIX = "yaboai_"
+# Histogram bucket upper bounds in seconds: 10us doubling up to ~84s
+BUCKETS = tuple(1e-5 * 2**k for k in range(24))
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # Last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q quantile"""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank and seen:
+                return bound
+        return self.max
+
+
+class Metrics:
+    """
+    Metrics
+
+    Stages are timed with the monotonic perf_counter:
+
+        start = metrics.start()
+        ...
+        metrics.stop("race_state_update", start)
+
+    lap() stops one stage and starts the next with a single clock read, for
+    consecutive stages such as the detectors of Driver.detect(). observe()
+    records a latency measured some other way and count() bumps a counter.
+    start() returns None while disabled and the other calls then do
+    nothing, so leaving them in the hot path costs a method call each
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def enable(self, enabled: bool = True):
+        self.enabled = enabled
+
+    def start(self) -> float:
+        if not self.enabled:
+            return None
+        return time.perf_counter()
+
+    def stop(self, name: str, start: float):
+        if start is None:
+            return
+        self.observe(name, time.perf_counter() - start)
+
+    def lap(self, name: str, start: float) -> float:
+        if start is None:
+            return None
+        now = time.perf_counter()
+        self.observe(name, now - start)
+        return now
+
+    def observe(self, name: str, seconds: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, name: str, amount: int = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self) -> dict:
+        """Counters and histogram summaries as plain values"""
+        with self._lock:
+            histograms = {}
+            for name, histogram in sorted(self.histograms.items()):
+                histograms[name] = {
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "max": histogram.max,
+                    "p50": histogram.quantile(0.5),
+                    "p99": histogram.quantile(0.99),
+                    "buckets": list(histogram.counts),
+                }
+            return {
+                "time": time.time(),
+                "bucket_bounds": list(BUCKETS),
+                "counters": dict(sorted(self.counters.items())),
+                "histograms": histograms,
+            }
+
+    def prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                metric = PREFIX + name + "_total"
+                lines.append("# TYPE {} counter".format(metric))
+                lines.append("{} {}".format(metric, value))
+            for name, histogram in sorted(self.histograms.items()):
+                metric = PREFIX + name + "_seconds"
+                lines.append("# TYPE {} histogram".format(metric))
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    cumulative += count
+                    lines.append(
+                        '{}_bucket{{le="{:g}"}} {}'.format(metric, bound, cumulative)
+                    )
+                lines.append(
+                    '{}_bucket{{le="+Inf"}} {}'.format(metric, histogram.count)
+                )
+                lines.append("{}_sum {}".format(metric, histogram.sum))
+                lines.append("{}_count {}".format(metric, histogram.count))
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """Writes JSON if path ends in .json, otherwise Prometheus text"""
+        if path.endswith(".json"):
+            text = json.dumps(self.snapshot(), indent=1)
+        else:
+            text = self.prometheus()
+        # Replace the file in one step so a scraper never reads half of it
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as file:
+            file.write(text)
+        os.replace(temp_path, path)
+
+
+metrics = Metrics()
@@ -0,0 +1,191 @@
+"""
+Response cache
+
+Commentary lines the sidecar has generated, kept so a repeat of the same
+kind of event can be voiced without another LLM round trip. Requests name
+their cache entry with a key (see prompts.commentary_key) and the names to
+swap into the line. The cache is saved to disk so it carries over between
+sessions
+"""
+
+import collections
+import json
+import os
+import re
+import threading
+import time
+
+from llm.services import TEMP_DIR
+
+RESPONSE_CACHE_FILE = os.path.join(TEMP_DIR, "yaboai_responses.json")
+
+
+class _Entry:
+    __slots__ = ("lines", "created", "generated", "turn")
+
+    def __init__(self, lines, created: float, generated: int = 0):
+        self.lines = lines
+        self.created = created
+        self.generated = generated
+        self.turn = 0
+
+
+class ResponseCache:
+    """
+    ResponseCache
+
+    Up to variants lines per key. Until variants lines have been generated
+    for a key every request for it is a miss and its new line is added
+    (unless it is the same as one already there), after that requests are
+    hits and take turns through the lines so none is repeated back to back. The
+    capacity keys used least recently are evicted first and a key is
+    dropped, to be generated afresh, ttl seconds after its first line.
+
+    Lines are stored as templates with the request's values (driver names)
+    replaced by {name} fields, and filled with the next request's values.
+
+    Thread-safe. save() writes the cache to path, at most every
+    save_interval seconds unless forced
+    """
+
+    def __init__(
+        self,
+        path: str = RESPONSE_CACHE_FILE,
+        capacity: int = 1024,
+        ttl: float = 7 * 24 * 3600,
+        variants: int = 3,
+        save_interval: float = 30,
+        clock=time.time,
+    ):
+        self.path = path
+        self.capacity = capacity
+        self.ttl = ttl
+        self.variants = variants
+        self.save_interval = save_interval
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self._entries = collections.OrderedDict()
+        self._dirty = False
+        self._saved = clock()
+        self._lock = threading.Lock()
+        if path is not None:
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str, values) -> str:
+        """A cached line for key filled with values, or None on a miss"""
+        with self._lock:
+            entry = self._entry(key)
+            if entry is None or entry.generated < self.variants:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            template = entry.lines[entry.turn % len(entry.lines)]
+            entry.turn += 1
+        try:
+            return template.format(**values)
+        except (KeyError, IndexError, ValueError):
+            return None
+
+    def put(self, key: str, values, line: str):
+        template = _template(line, values)
+        with self._lock:
+            entry = self._entry(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry([], self.clock())
+            self._entries.move_to_end(key)
+            entry.generated += 1
+            if template not in entry.lines and len(entry.lines) < self.variants:
+                entry.lines.append(template)
+            self._dirty = True
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        self.save(force=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "keys": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expired": self.expired,
+        }
+
+    def load(self):
+        """Reads the entries saved at path, skipping expired ones"""
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                saved = json.load(file)
+        except (OSError, ValueError):
+            return
+        now = self.clock()
+        with self._lock:
+            for key, lines, created, generated in saved.get("entries", []):
+                if now - created < self.ttl:
+                    self._entries[key] = _Entry(
+                        lines[: self.variants], created, generated
+                    )
+
+    def save(self, force: bool = True):
+        """Writes the cache to path if it changed"""
+        if self.path is None:
+            return
+        with self._lock:
+            now = self.clock()
+            if not self._dirty or (
+                not force and now - self._saved < self.save_interval
+            ):
+                return
+            saved = {
+                "entries": [
+                    [key, entry.lines, entry.created, entry.generated]
+                    for key, entry in self._entries.items()
+                ]
+            }
+            self._dirty = False
+            self._saved = now
+        # Written beside the cache and swapped in, so a crash can't leave
+        # half a file behind
+        temporary = self.path + ".tmp"
+        try:
+            with open(temporary, "w", encoding="utf-8") as file:
+                json.dump(saved, file)
+            os.replace(temporary, self.path)
+        except OSError:
+            self._dirty = True
+
+    def _entry(self, key: str) -> _Entry:
+        entry = self._entries.get(key)
+        if entry is not None and self.clock() - entry.created >= self.ttl:
+            del self._entries[key]
+            self.expired += 1
+            self._dirty = True
+            return None
+        return entry
+
+
+def _template(line: str, values) -> str:
+    """line with braces escaped and every value replaced by its {name} field"""
+    template = line.replace("{", "{{").replace("}", "}}")
+    names = {}
+    for name, value in values.items():
+        if value:
+            names.setdefault(value, name)
+    if not names:
+        return template
+    # Longest first so a name inside another isn't replaced on its own
+    pattern = re.compile(
+        r"(?<!\w)(?:{})(?!\w)".format(
+            "|".join(re.escape(value) for value in sorted(names, key=len, reverse=True))
+        )
+    )
+    return pattern.sub(lambda match: "{" + names[match.group(0)] + "}", template)
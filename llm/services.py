@@ -1,12 +1,309 @@
+import itertools
+import json
 import os
+import socket
 import tempfile
+import threading
 import time
 
 TEMP_DIR = tempfile.gettempdir()
 PROMPT_FILE = os.path.join(TEMP_DIR, "yaboai_prompt.txt")
 STATUS_FILE = os.path.join(TEMP_DIR, "yaboai_status.txt")
 
-def generate_commentary(prompt: str):
+# "socket" talks to the LLM/TTS sidecar over a local TCP connection and falls
+# back to the file protocol when nothing is listening. "file" always uses the
+# prompt/status files
+CHANNEL_MODE = "socket"
+SIDECAR_HOST = "127.0.0.1"
+SIDECAR_PORT = 50627
+CONNECT_TIMEOUT = 0.5
+# Ask the sidecar to stream LLM tokens and voice each sentence as soon as it
+# is complete instead of waiting for the whole line
+STREAMING = True
+# Timeout in seconds for a whole commentary line
+TIMEOUT = 120
+
+
+class CommentaryRequest:
+    """
+    CommentaryRequest
+
+    A prompt sent to the sidecar. wait() blocks until the sidecar answers,
+    the request is cancelled or the channel drops
+    """
+
+    def __init__(self, channel, request_id: int, prompt: str):
+        self.channel = channel
+        self.id = request_id
+        self.prompt = prompt
+        self.status = "pending"
+        self.success = False
+        self.text = ""
+        self.sent_time = time.monotonic()
+        self.play_time = None
+        self.first_audio_time = None
+        self.ready = False
+        self.cached = False
+        self._done = threading.Event()
+
+    @property
+    def time_to_first_audio(self):
+        """
+        Seconds from sending the prompt (or the play message of a held
+        request) until the sidecar started playing
+        """
+        if self.first_audio_time is None:
+            return None
+        return self.first_audio_time - (self.play_time or self.sent_time)
+
+    def wait(self, timeout: float = None) -> bool:
+        """Returns False if the request is still pending after timeout"""
+        return self._done.wait(timeout)
+
+    def cancel(self):
+        if not self._done.is_set():
+            self.channel.cancel(self)
+
+    def finish(self, status: str, success: bool):
+        self.status = status
+        self.success = success
+        self._done.set()
+
+
+class SidecarChannel:
+    """
+    SidecarChannel
+
+    Newline delimited JSON over one TCP connection to the sidecar. Every
+    request carries an id and a reader thread hands responses back to the
+    matching CommentaryRequest, so several prompts can be in flight at once
+
+        -> {"id": 1, "type": "commentary", "prompt": "...", "stream": true}
+        -> {"id": 1, "type": "commentary", "prompt": "...", "hold": true}
+        -> {"id": 1, "type": "commentary", "prompt": "...",
+            "cache": {"key": "...", "values": {"driver": "..."}}}
+        -> {"id": 1, "type": "batch", "items": [{"id": 1, "prompt": "..."},
+                                               {"id": 2, "prompt": "..."}]}
+        -> {"id": 1, "type": "play"}
+        -> {"id": 1, "type": "cancel"}
+        -> {"type": "phrases", "phrases": ["...", "..."]}
+        <- {"id": 1, "status": "token", "text": "..."}
+        <- {"id": 1, "status": "ready"}
+        <- {"id": 1, "status": "audio"}
+        <- {"id": 1, "status": "done", "success": true, "cached": false}
+        <- {"id": 1, "status": "cancelled", "success": false}
+
+    "token" messages are only sent for streamed requests, "audio" is sent
+    when the first sentence starts playing. A held request is generated
+    right away, reports "ready" and waits for "play" (or "cancel"). A batch
+    has its lines generated in one LLM call, after that each item is a held
+    request of its own. A request (or batch item) with "cache" may be
+    answered from the sidecar's response cache, "done" says if it was.
+    "phrases" lists text worth rendering ahead of time, it is sent again
+    whenever the connection is made
+    """
+
+    def __init__(self, host: str = SIDECAR_HOST, port: int = SIDECAR_PORT):
+        self.host = host
+        self.port = port
+        self._socket = None
+        self._pending = {}
+        self._phrases = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @property
+    def connected(self) -> bool:
+        return self._socket is not None
+
+    def connect(self) -> bool:
+        with self._lock:
+            if self._socket is not None:
+                return True
+            try:
+                sock = socket.create_connection(
+                    (self.host, self.port), timeout=CONNECT_TIMEOUT
+                )
+            except OSError:
+                return False
+            sock.settimeout(None)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._socket = sock
+        reader = threading.Thread(target=self._read_loop, args=(sock,), daemon=True)
+        reader.start()
+        if self._phrases:
+            self._send({"type": "phrases", "phrases": self._phrases})
+        return True
+
+    def close(self):
+        with self._lock:
+            sock = self._socket
+            self._socket = None
+        if sock is not None:
+            sock.close()
+        self._fail_pending()
+
+    def submit(self, prompt: str, **fields) -> CommentaryRequest:
+        request = CommentaryRequest(self, next(self._ids), prompt)
+        with self._lock:
+            self._pending[request.id] = request
+        message = {"id": request.id, "type": "commentary", "prompt": prompt}
+        message.update(fields)
+        if not self._send(message) and self._forget(request.id):
+            request.finish("disconnected", False)
+        return request
+
+    def submit_batch(self, prompts, item_fields=None, **fields) -> list:
+        """
+        Submits prompts as one batch, returns a held request per prompt.
+        item_fields holds extra fields for each prompt's item
+        """
+        requests = [
+            CommentaryRequest(self, next(self._ids), prompt) for prompt in prompts
+        ]
+        with self._lock:
+            for request in requests:
+                self._pending[request.id] = request
+        items = []
+        for index, request in enumerate(requests):
+            item = {"id": request.id, "prompt": request.prompt}
+            if item_fields is not None:
+                item.update(item_fields[index])
+            items.append(item)
+        message = {"id": requests[0].id, "type": "batch", "items": items}
+        message.update(fields)
+        if not self._send(message):
+            for request in requests:
+                if self._forget(request.id):
+                    request.finish("disconnected", False)
+        return requests
+
+    def preload(self, phrases):
+        """Asks the sidecar to render phrases ahead of time, now or on connect"""
+        self._phrases = list(phrases)
+        if self.connected:
+            self._send({"type": "phrases", "phrases": self._phrases})
+
+    def play(self, request: CommentaryRequest):
+        """Starts playback of a held request"""
+        request.play_time = time.monotonic()
+        self._send({"id": request.id, "type": "play"})
+
+    def cancel(self, request: CommentaryRequest):
+        self._send({"id": request.id, "type": "cancel"})
+        if self._forget(request.id):
+            request.finish("cancelled", False)
+
+    def _send(self, message) -> bool:
+        data = (json.dumps(message) + "\n").encode("utf-8")
+        with self._lock:
+            if self._socket is None:
+                return False
+            try:
+                self._socket.sendall(data)
+                return True
+            except OSError:
+                pass
+        self.close()
+        return False
+
+    def _read_loop(self, sock):
+        try:
+            for line in sock.makefile("r", encoding="utf-8"):
+                self._handle(json.loads(line))
+        except (OSError, ValueError):
+            pass
+        finally:
+            # Whatever stopped the reader, nothing more will be answered on
+            # sock, so later requests must reconnect instead of waiting
+            with self._lock:
+                ours = self._socket is sock
+                if ours:
+                    self._socket = None
+            if ours:
+                sock.close()
+            self._fail_pending()
+
+    def _handle(self, message):
+        request = self._pending.get(message["id"])
+        if request is None:
+            return
+        if message["status"] == "token":
+            request.text += message["text"]
+        elif message["status"] == "ready":
+            request.ready = True
+        elif message["status"] == "audio":
+            request.first_audio_time = time.monotonic()
+        elif message["status"] in ("done", "cancelled", "error"):
+            # cancel() may have finished it already
+            if self._forget(request.id):
+                request.cached = bool(message.get("cached"))
+                request.finish(message["status"], bool(message.get("success")))
+
+    def _forget(self, id: int) -> bool:
+        """Removes a pending request, False if another thread got there first"""
+        with self._lock:
+            return self._pending.pop(id, None) is not None
+
+    def _fail_pending(self):
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for request in pending:
+            request.finish("disconnected", False)
+
+
+channel = SidecarChannel()
+_file_lock = threading.Lock()
+
+
+def request_commentary(
+    prompt: str, timeout: float = TIMEOUT, on_submit=None, cache=None
+) -> CommentaryRequest:
+    """
+    Voices a commentary line and returns the finished request, which holds
+    the outcome and the time to first audio. on_submit is called with the
+    request once it is in flight so the caller can cancel it. cache names
+    the line's response cache entry (see prompts.commentary_key)
+    """
+    if CHANNEL_MODE == "socket" and channel.connect():
+        fields = {"stream": STREAMING}
+        if cache is not None:
+            fields["cache"] = cache
+        request = channel.submit(prompt, **fields)
+        if on_submit is not None:
+            on_submit(request)
+        if not request.wait(timeout):
+            request.cancel()
+        return request
+
+    request = CommentaryRequest(None, 0, prompt)
+    success = generate_commentary_file(prompt, timeout)
+    request.finish("done" if success else "error", success)
+    return request
+
+
+def play_commentary(
+    request: CommentaryRequest, timeout: float = TIMEOUT
+) -> CommentaryRequest:
+    """Plays a request submitted with hold=True and waits for it to finish"""
+    request.channel.play(request)
+    if not request.wait(timeout):
+        request.cancel()
+    return request
+
+
+def generate_commentary(prompt: str, timeout: float = TIMEOUT):
+    return request_commentary(prompt, timeout).success
+
+
+def generate_commentary_file(prompt: str, timeout: float = TIMEOUT):
+    # The prompt and status files only hold one line at a time
+    with _file_lock:
+        return _generate_commentary_file(prompt, timeout)
+
+
+def _generate_commentary_file(prompt: str, timeout: float):
     try:
         if os.path.exists(STATUS_FILE):
             os.remove(STATUS_FILE)
@@ -15,8 +312,7 @@ def generate_commentary(prompt: str):
             f.write(prompt)
 
         # Wait for the status file to indicate success or failure
-        timeout = 120  # Timeout in seconds
-        start_time = time.time()
+        start_time = time.monotonic()
 
         while True:
             try:
@@ -27,10 +323,10 @@ def generate_commentary(prompt: str):
                     elif status == "false":
                         return False
             except Exception:
-                continue
+                pass
 
             # Check for timeout
-            if time.time() - start_time > timeout:
+            if time.monotonic() - start_time > timeout:
                 return False
 
             # Sleep briefly to avoid busy-waiting
@@ -51,4 +347,3 @@ def generate_commentary(prompt: str):
 #         print("Audio played successfully.")
 #     else:
 #         print("Failed to process the prompt.")
-    
@@ -0,0 +1,721 @@
+"""
+Stand-in sidecar
+
+Speaks the SidecarChannel protocol from llm/services.py without an LLM or
+TTS engine so the app can be exercised offline. The "LLM" echoes the prompt
+back as a commentary line one word at a time and the "TTS" takes a fixed
+time per word to "play" it. Point a real LLM/TTS sidecar at the same
+protocol to use it in a race
+
+Streamed requests hand every complete sentence to the TTS while the rest of
+the line is still being generated, the others wait for the whole line. Held
+requests are generated straight away but only played once a "play" message
+for them arrives. A batch is generated in one LLM call and each of its lines
+is then held
+
+Requests that name a response cache entry (see llm/responses.py) are voiced
+from the cache when it has lines for it, without going to the LLM.
+
+Lines are voiced through a PhraseCache: phrases the app sends ahead of time
+(driver names, stock phrases) are rendered once in the background and their
+clips reused, so only the rest of a line has to be rendered
+
+With --slots the LLM is shared fairly between connections (one per race
+session, see host.py): at most that many lines are generated at once and a
+freed slot goes to the next session in turn
+
+    python -m llm.sidecar --port 50627 --first-token 0.5 --token-time 0.03
+"""
+
+import argparse
+import collections
+import itertools
+import json
+import queue
+import re
+import socket
+import threading
+import time
+
+from llm.responses import RESPONSE_CACHE_FILE, ResponseCache
+from llm.services import SIDECAR_HOST, SIDECAR_PORT
+
+
+# Rendered phrase clips kept, least recently used are evicted first
+PHRASE_CACHE = 512
+
+# A sentence ends at ., ! or ? followed by whitespace so lap times like
+# 1:33.456 stay in one piece
+SENTENCE_END = re.compile(r"[.!?]\s")
+
+
+class SentenceSplitter:
+    """
+    SentenceSplitter
+
+    Collects streamed tokens and hands back each sentence once it is complete
+    """
+
+    def __init__(self):
+        self._buffer = ""
+
+    def feed(self, token: str) -> list:
+        self._buffer += token
+        sentences = []
+        match = SENTENCE_END.search(self._buffer)
+        while match:
+            sentences.append(self._buffer[: match.end()].strip())
+            self._buffer = self._buffer[match.end() :]
+            match = SENTENCE_END.search(self._buffer)
+        return sentences
+
+    def flush(self) -> list:
+        sentence = self._buffer.strip()
+        self._buffer = ""
+        return [sentence] if sentence else []
+
+
+class StandInLLM:
+    def __init__(self, first_token_delay: float = 0.5, token_time: float = 0.03):
+        self.first_token_delay = first_token_delay
+        self.token_time = token_time
+
+    def stream(self, prompt: str):
+        time.sleep(self.first_token_delay)
+        for word in "And what a moment! {}".format(prompt).split(" "):
+            time.sleep(self.token_time)
+            yield word + " "
+
+    def complete(self, prompt: str) -> str:
+        return "".join(self.stream(prompt)).strip()
+
+    def complete_batch(self, prompts) -> list:
+        """
+        The lines for several prompts from one pass. A batching server
+        decodes them side by side, so the batch takes as long as its longest
+        line
+        """
+        lines = ["And what a moment! {}".format(prompt) for prompt in prompts]
+        words = max(len(line.split(" ")) for line in lines)
+        time.sleep(self.first_token_delay + self.token_time * words)
+        return lines
+
+
+class StandInTTS:
+    def __init__(self, word_time: float = 0.05, render_time: float = 0.01):
+        self.word_time = word_time
+        self.render_time = render_time
+
+    def render(self, text: str):
+        """The clip for text, a real TTS would return its audio"""
+        time.sleep(self.render_time * len(text.split()))
+        return text
+
+    def play(self, clip, cancelled: threading.Event) -> bool:
+        """Returns False if playback was cut short by a cancel"""
+        for _ in clip.split():
+            if cancelled.wait(self.word_time):
+                return False
+        return True
+
+
+class PhraseCache:
+    """
+    PhraseCache
+
+    Rendered clips of the phrases that keep coming up in lines, at most
+    capacity of them with the least recently used evicted first. preload()
+    registers phrases and renders them on a background thread. render()
+    splits a line around the registered phrases (ignoring case), takes their
+    clips from the cache and only renders the text in between. A phrase that
+    was evicted is rendered again and put back
+    """
+
+    def __init__(self, tts, capacity: int = PHRASE_CACHE):
+        self.tts = tts
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._clips = collections.OrderedDict()
+        self._phrases = {}  # Lower case to the phrase as registered
+        self._pattern = None
+        self._loading = collections.deque()
+        self._loader = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._clips)
+
+    def preload(self, phrases):
+        if not self.capacity:
+            return
+        with self._lock:
+            for phrase in phrases:
+                phrase = phrase.strip()
+                key = phrase.lower()
+                if phrase and key not in self._phrases:
+                    self._phrases[key] = phrase
+                    self._loading.append(key)
+            # Longest first, so a name isn't split up by a shorter phrase in it
+            phrases = sorted(self._phrases, key=len, reverse=True)
+            self._pattern = re.compile(
+                r"(?<!\w)(?:{})(?!\w)".format("|".join(map(re.escape, phrases))),
+                re.IGNORECASE,
+            )
+            if self._loader is None and self._loading:
+                self._loader = threading.Thread(
+                    target=self._load, name="phrase-loader", daemon=True
+                )
+                self._loader.start()
+
+    def render(self, text: str) -> list:
+        """The clips that make up text, in order"""
+        pattern = self._pattern
+        if pattern is None:
+            return [self.tts.render(text)]
+        clips = []
+        position = 0
+        for match in pattern.finditer(text):
+            self._render_gap(text[position : match.start()], clips)
+            clips.append(self._clip(match.group(0).lower()))
+            position = match.end()
+        self._render_gap(text[position:], clips)
+        return clips
+
+    def stats(self) -> dict:
+        return {
+            "phrases": len(self._phrases),
+            "cached": len(self._clips),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _render_gap(self, text: str, clips):
+        # Punctuation and spaces between two phrases have nothing to say
+        if re.search(r"\w", text):
+            clips.append(self.tts.render(text.strip()))
+
+    def _clip(self, key: str):
+        with self._lock:
+            clip = self._clips.get(key)
+            if clip is not None:
+                self._clips.move_to_end(key)
+                self.hits += 1
+                return clip
+            self.misses += 1
+        clip = self.tts.render(self._phrases[key])
+        self._store(key, clip)
+        return clip
+
+    def _store(self, key: str, clip):
+        with self._lock:
+            self._clips[key] = clip
+            self._clips.move_to_end(key)
+            while len(self._clips) > self.capacity:
+                self._clips.popitem(last=False)
+                self.evictions += 1
+
+    def _load(self):
+        while True:
+            with self._lock:
+                if not self._loading:
+                    self._loader = None
+                    return
+                key = self._loading.popleft()
+                if key in self._clips:
+                    continue
+            self._store(key, self.tts.render(self._phrases[key]))
+
+
+class FairScheduler:
+    """
+    FairScheduler
+
+    Shares a fixed number of LLM slots between sessions. Requests waiting for
+    a slot queue per session and a freed slot goes to the session whose turn
+    is next, so a busy session can't starve the others. stats holds the
+    requests and seconds waited per session
+    """
+
+    def __init__(self, slots: int):
+        self.slots = slots
+        self.stats = {}
+        self._busy = 0
+        # Sessions with waiting requests, in turn order
+        self._waiting = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, session, cancelled: threading.Event) -> bool:
+        """Waits for a slot, returns False if cancelled first"""
+        start = time.time()
+        with self._lock:
+            if self._busy < self.slots and not self._waiting:
+                self._busy += 1
+                granted = None
+            else:
+                granted = threading.Event()
+                self._waiting.setdefault(session, collections.deque()).append(granted)
+        if granted is not None:
+            while not granted.wait(0.05):
+                if cancelled.is_set():
+                    with self._lock:
+                        if not granted.is_set():
+                            waiters = self._waiting[session]
+                            waiters.remove(granted)
+                            if not waiters:
+                                del self._waiting[session]
+                            return False
+                    break
+
+        waited = time.time() - start
+        with self._lock:
+            stats = self.stats.setdefault(
+                session, {"requests": 0, "wait": 0.0, "max_wait": 0.0}
+            )
+            stats["requests"] += 1
+            stats["wait"] += waited
+            stats["max_wait"] = max(stats["max_wait"], waited)
+        return True
+
+    def release(self):
+        with self._lock:
+            if not self._waiting:
+                self._busy -= 1
+                return
+            # Hand the slot straight to the next session in turn
+            session, waiters = self._waiting.popitem(last=False)
+            granted = waiters.popleft()
+            if waiters:
+                self._waiting[session] = waiters
+            granted.set()
+
+
+class _AllSet:
+    """Set once every one of events is"""
+
+    def __init__(self, events):
+        self.events = events
+
+    def is_set(self) -> bool:
+        return all(event.is_set() for event in self.events)
+
+
+class _Requests:
+    """
+    The cancel and play events of a connection's requests in flight. A
+    request's thread forgets it when it finishes, possibly while a late
+    cancel or play for it is being read, so every access takes the lock
+    """
+
+    def __init__(self):
+        self._cancels = {}
+        self._plays = {}
+        self._lock = threading.Lock()
+
+    def add(self, request_id) -> threading.Event:
+        """Returns the request's cancel event"""
+        cancelled = threading.Event()
+        with self._lock:
+            self._cancels[request_id] = cancelled
+            self._plays[request_id] = threading.Event()
+        return cancelled
+
+    def play(self, request_id):
+        with self._lock:
+            play = self._plays.get(request_id)
+        if play is not None:
+            play.set()
+
+    def cancel(self, request_id):
+        with self._lock:
+            cancelled = self._cancels.get(request_id)
+            play = self._plays.get(request_id)
+        if cancelled is not None:
+            cancelled.set()
+        if play is not None:
+            play.set()
+
+    def wait_play(self, request_id):
+        with self._lock:
+            play = self._plays.get(request_id)
+        if play is not None:
+            play.wait()
+
+    def forget(self, request_id):
+        with self._lock:
+            self._cancels.pop(request_id, None)
+            self._plays.pop(request_id, None)
+
+    def cancel_all(self):
+        with self._lock:
+            events = list(self._cancels.values()) + list(self._plays.values())
+        for event in events:
+            event.set()
+
+
+class Sidecar:
+    """
+    Sidecar
+
+    Serves any number of connections, each request runs on its own thread so
+    a cancel can arrive while it is being generated or played. With slots
+    the LLM is shared through a FairScheduler, each connection being a
+    session unless its requests name one. A batch takes one slot for all of
+    its lines. The phrase cache is shared by every connection, and so is the
+    response cache (a ResponseCache) if there is one
+    """
+
+    def __init__(
+        self,
+        llm=None,
+        tts=None,
+        slots: int = None,
+        phrase_cache: int = PHRASE_CACHE,
+        responses=None,
+    ):
+        self.llm = llm or StandInLLM()
+        self.tts = tts or StandInTTS()
+        self.phrases = PhraseCache(self.tts, phrase_cache)
+        self.responses = responses
+        self.scheduler = FairScheduler(slots) if slots else None
+        self.requests = 0
+        self.batches = 0
+        self.port = None
+        self.listening = threading.Event()
+        self._server = None
+        self._connections = itertools.count(1)
+
+    def serve(self, host: str = SIDECAR_HOST, port: int = SIDECAR_PORT):
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((host, port))
+        self._server.listen(8)
+        self.port = self._server.getsockname()[1]
+        self.listening.set()
+        while True:
+            try:
+                connection, _ = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(
+                target=self._serve_connection, args=(connection,), daemon=True
+            ).start()
+
+    def start(self, host: str = SIDECAR_HOST, port: int = SIDECAR_PORT):
+        """Serves from a background thread and returns once listening"""
+        thread = threading.Thread(target=self.serve, args=(host, port), daemon=True)
+        thread.start()
+        self.listening.wait()
+        return thread
+
+    def stop(self):
+        if self._server is not None:
+            self._server.close()
+        if self.responses is not None:
+            self.responses.save()
+
+    def _serve_connection(self, connection):
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        send_lock = threading.Lock()
+        session = next(self._connections)
+        in_flight = _Requests()
+
+        def send(message):
+            data = (json.dumps(message) + "\n").encode("utf-8")
+            with send_lock:
+                try:
+                    connection.sendall(data)
+                except OSError:
+                    pass
+
+        try:
+            for line in connection.makefile("r", encoding="utf-8"):
+                message = json.loads(line)
+                if message["type"] == "cancel":
+                    in_flight.cancel(message["id"])
+                    continue
+                if message["type"] == "play":
+                    in_flight.play(message["id"])
+                    continue
+                if message["type"] == "phrases":
+                    self.phrases.preload(message["phrases"])
+                    continue
+                if message["type"] == "batch":
+                    items = message["items"]
+                    item_cancels = [in_flight.add(item["id"]) for item in items]
+                    self.requests += len(items)
+                    self.batches += 1
+                    threading.Thread(
+                        target=self._run_batch,
+                        args=(
+                            items,
+                            message.get("session", session),
+                            send,
+                            in_flight,
+                            item_cancels,
+                        ),
+                        daemon=True,
+                    ).start()
+                    continue
+
+                cancelled = in_flight.add(message["id"])
+                self.requests += 1
+                threading.Thread(
+                    target=self._run,
+                    args=(
+                        message,
+                        message.get("session", session),
+                        cancelled,
+                        send,
+                        in_flight,
+                    ),
+                    daemon=True,
+                ).start()
+        except (OSError, ValueError):
+            pass
+        finally:
+            in_flight.cancel_all()
+            connection.close()
+
+    def _generate(self, session, cancelled: threading.Event, message):
+        """
+        The whole line, from the response cache or generated holding an LLM
+        slot. None if cancelled
+        """
+        line = self._cached(message)
+        if line is not None:
+            return line
+        if self.scheduler is None:
+            line = self.llm.complete(message["prompt"])
+        elif not self.scheduler.acquire(session, cancelled):
+            return None
+        else:
+            try:
+                line = self.llm.complete(message["prompt"])
+            finally:
+                self.scheduler.release()
+        self._remember(message, line)
+        return line
+
+    def _cached(self, message) -> str:
+        """The response cache's line for a request, None on a miss"""
+        cache = message.get("cache")
+        if self.responses is None or not cache:
+            return None
+        line = self.responses.get(cache["key"], cache["values"])
+        if line is not None:
+            message["cached"] = True
+        return line
+
+    def _remember(self, message, line: str):
+        cache = message.get("cache")
+        if self.responses is not None and cache and line:
+            self.responses.put(cache["key"], cache["values"], line)
+
+    def _run(self, message, session, cancelled, send, in_flight):
+        request_id = message["id"]
+        try:
+            if message.get("hold"):
+                line = self._generate(session, cancelled, message)
+                played = self._play_held(request_id, line, cancelled, send, in_flight)
+            elif message.get("stream"):
+                played = self._stream(message, session, cancelled, send)
+            else:
+                line = self._generate(session, cancelled, message)
+                played = line is not None and self._speak(
+                    line, cancelled, lambda: send({"id": request_id, "status": "audio"})
+                )
+            self._finish(message, played, send)
+        except Exception:
+            send({"id": request_id, "status": "error", "success": False})
+        finally:
+            in_flight.forget(request_id)
+
+    def _finish(self, message, played: bool, send):
+        if played:
+            send(
+                {
+                    "id": message["id"],
+                    "status": "done",
+                    "success": True,
+                    "cached": message.get("cached", False),
+                }
+            )
+        else:
+            send({"id": message["id"], "status": "cancelled", "success": False})
+
+    def _play_held(self, request_id, line, cancelled, send, in_flight) -> bool:
+        """Reports a generated line ready and plays it once told to"""
+        if line is None:
+            return False
+        send({"id": request_id, "status": "ready"})
+        in_flight.wait_play(request_id)
+        return self._speak(
+            line, cancelled, lambda: send({"id": request_id, "status": "audio"})
+        )
+
+    def _speak(self, text: str, cancelled, started=None) -> bool:
+        """
+        Renders text through the phrase cache and plays it, calling started
+        as the audio begins. Returns False if cancelled
+        """
+        if cancelled.is_set():
+            return False
+        clips = self.phrases.render(text)
+        if cancelled.is_set():
+            return False
+        if started is not None:
+            started()
+        for clip in clips:
+            if not self.tts.play(clip, cancelled):
+                return False
+        return True
+
+    def _run_batch(self, items, session, send, in_flight, item_cancels):
+        """
+        Generates every line of a batch in one LLM call, then each line
+        waits for its "play" like a held request
+        """
+        try:
+            lines = [self._cached(item) for item in items]
+            missing = [index for index, line in enumerate(lines) if line is None]
+            prompts = [items[index]["prompt"] for index in missing]
+            cancelled = _AllSet([item_cancels[index] for index in missing])
+            generated = []
+            if missing and self.scheduler is None:
+                generated = self.llm.complete_batch(prompts)
+            elif missing and self.scheduler.acquire(session, cancelled):
+                try:
+                    generated = self.llm.complete_batch(prompts)
+                finally:
+                    self.scheduler.release()
+            for index, line in zip(missing, generated):
+                lines[index] = line
+                self._remember(items[index], line)
+        except Exception:
+            for item in items:
+                send({"id": item["id"], "status": "error", "success": False})
+                in_flight.forget(item["id"])
+            return
+
+        def play(item, line, cancelled):
+            request_id = item["id"]
+            try:
+                played = self._play_held(request_id, line, cancelled, send, in_flight)
+                self._finish(item, played, send)
+            finally:
+                in_flight.forget(request_id)
+
+        for item, line, cancelled in zip(items, lines, item_cancels):
+            threading.Thread(
+                target=play, args=(item, line, cancelled), daemon=True
+            ).start()
+
+    def _stream(self, message, session, cancelled, send) -> bool:
+        """
+        Generates the line token by token while a player thread voices the
+        completed sentences in order. The LLM slot is given back once the
+        last token is out, not when playback ends. A cached line is sent as
+        a single token
+        """
+        request_id = message["id"]
+        sentences = queue.Queue()
+        played = [True]
+
+        def started():
+            send({"id": request_id, "status": "audio"})
+
+        def play():
+            first = True
+            while True:
+                sentence = sentences.get()
+                if sentence is None or cancelled.is_set():
+                    return
+                if not self._speak(sentence, cancelled, started if first else None):
+                    played[0] = False
+                    return
+                first = False
+
+        line = self._cached(message)
+        slot = line is None and self.scheduler is not None
+        if slot and not self.scheduler.acquire(session, cancelled):
+            return False
+        player = threading.Thread(target=play, daemon=True)
+        player.start()
+        splitter = SentenceSplitter()
+        tokens = [line] if line is not None else self.llm.stream(message["prompt"])
+        text = []
+        try:
+            for token in tokens:
+                if cancelled.is_set():
+                    break
+                send({"id": request_id, "status": "token", "text": token})
+                text.append(token)
+                for sentence in splitter.feed(token):
+                    sentences.put(sentence)
+        finally:
+            if slot:
+                self.scheduler.release()
+        if line is None and not cancelled.is_set():
+            self._remember(message, "".join(text).strip())
+        for sentence in splitter.flush():
+            sentences.put(sentence)
+        sentences.put(None)
+        player.join()
+        return played[0] and not cancelled.is_set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in YaboAI LLM/TTS sidecar")
+    parser.add_argument("--host", default=SIDECAR_HOST)
+    parser.add_argument("--port", type=int, default=SIDECAR_PORT)
+    parser.add_argument("--first-token", type=float, default=0.5)
+    parser.add_argument("--token-time", type=float, default=0.03)
+    parser.add_argument("--word-time", type=float, default=0.05)
+    parser.add_argument("--render-time", type=float, default=0.01)
+    parser.add_argument(
+        "--slots", type=int, default=None, help="LLM lines generated at once"
+    )
+    parser.add_argument(
+        "--phrase-cache",
+        type=int,
+        default=PHRASE_CACHE,
+        help="Rendered phrases kept, 0 turns the cache off",
+    )
+    parser.add_argument(
+        "--response-cache",
+        default=RESPONSE_CACHE_FILE,
+        help="File the response cache is kept in",
+    )
+    parser.add_argument(
+        "--no-response-cache",
+        action="store_true",
+        help="Generate every line, even ones seen before",
+    )
+    args = parser.parse_args()
+
+    responses = None
+    if not args.no_response_cache:
+        responses = ResponseCache(args.response_cache)
+    sidecar = Sidecar(
+        StandInLLM(args.first_token, args.token_time),
+        StandInTTS(args.word_time, args.render_time),
+        args.slots,
+        args.phrase_cache,
+        responses,
+    )
+    print("Stand-in sidecar listening on {}:{}".format(args.host, args.port))
+    try:
+        sidecar.serve(args.host, args.port)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sidecar.stop()
+        if responses is not None:
+            print("Response cache: {}".format(responses.stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Log
+
+Levelled, rate limited logging that costs the game thread next to nothing.
+Records are kept unformatted in a ring buffer and a background thread
+formats them and appends them to a file. The console (ac.console in game)
+only gets the records at or above the console level, and never more than a
+few lines a frame
+"""
+
+import collections
+import threading
+import time
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR}
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+
+class _Key:
+    __slots__ = ("window", "count", "seen", "suppressed")
+
+    def __init__(self):
+        self.window = 0.0
+        self.count = 0
+        self.seen = 0
+        self.suppressed = 0
+
+
+class Log:
+    """
+    Log
+
+    Every record has a level and a key naming the message, and is formatted
+    lazily, only once it is kept:
+
+        log.info("overtake", "EVENT: {} - {}", EventType.OVERTAKE, name)
+
+    A record under level is dropped before anything else happens. The rest
+    are counted against their key: keys in sample only keep every nth record
+    and no key keeps more than rate records a second. The next kept record
+    of a key says how many were suppressed.
+
+    Kept records go into a ring buffer of the last capacity records and the
+    writer thread started by start() appends them to path every
+    flush_interval seconds. Records at console_level or above are also queued
+    for the console and pump(), called from the thread that may use it,
+    hands at most console_lines of them to console a call
+    """
+
+    def __init__(self):
+        self.level = INFO
+        self.console_level = INFO
+        self.rate = 5
+        self.sample = {}
+        self.console = None
+        self.console_lines = 5
+        self.path = None
+        self.flush_interval = 1.0
+        self.kept = 0
+        self.suppressed = 0
+        self.written = 0
+        self._keys = {}
+        self._buffer = collections.deque(maxlen=4096)
+        self._console = collections.deque(maxlen=64)
+        self._thread = None
+        self._running = False
+        self._wake = threading.Event()
+
+    def configure(
+        self,
+        level: int = INFO,
+        console_level: int = INFO,
+        rate: float = 5,
+        sample=None,
+        console=None,
+        console_lines: int = 5,
+        path: str = None,
+        capacity: int = 4096,
+        flush_interval: float = 1.0,
+    ):
+        self.level = level
+        self.console_level = console_level
+        self.rate = rate
+        self.sample = dict(sample or {})
+        self.console = console
+        self.console_lines = console_lines
+        self.path = path
+        self.flush_interval = flush_interval
+        if capacity != self._buffer.maxlen:
+            self._buffer = collections.deque(self._buffer, maxlen=capacity)
+
+    def debug(self, key: str, message: str, *args):
+        if DEBUG >= self.level:
+            self._record(DEBUG, key, message, args)
+
+    def info(self, key: str, message: str, *args):
+        if INFO >= self.level:
+            self._record(INFO, key, message, args)
+
+    def warning(self, key: str, message: str, *args):
+        if WARNING >= self.level:
+            self._record(WARNING, key, message, args)
+
+    def error(self, key: str, message: str, *args):
+        if ERROR >= self.level:
+            self._record(ERROR, key, message, args)
+
+    def pump(self):
+        """Hands the queued console lines to console, at most console_lines"""
+        queued = self._console
+        console = self.console
+        for _ in range(min(len(queued), self.console_lines)):
+            record = queued.popleft()
+            if console is not None:
+                console(_message(record))
+
+    def start(self):
+        """Starts the writer thread, if there is a path to write to"""
+        if self.path is None or self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="log", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Writes what is left and stops the writer thread"""
+        if self._thread is None:
+            return
+        self._running = False
+        self._wake.set()
+        self._thread.join(5)
+        self._thread = None
+        self._wake.clear()
+
+    def stats(self) -> dict:
+        return {
+            "kept": self.kept,
+            "suppressed": self.suppressed,
+            "written": self.written,
+            "buffered": len(self._buffer),
+        }
+
+    def _record(self, level: int, key: str, message: str, args):
+        now = time.time()
+        state = self._keys.get(key)
+        if state is None:
+            state = self._keys[key] = _Key()
+        state.seen += 1
+        every = self.sample.get(key)
+        if every and state.seen % every:
+            state.suppressed += 1
+            self.suppressed += 1
+            return
+        if now - state.window >= 1:
+            state.window = now
+            state.count = 0
+        if state.count >= self.rate:
+            state.suppressed += 1
+            self.suppressed += 1
+            return
+        state.count += 1
+        record = (now, level, key, message, args, state.suppressed)
+        state.suppressed = 0
+        self.kept += 1
+        if self._thread is not None:
+            self._buffer.append(record)
+        if level >= self.console_level:
+            self._console.append(record)
+
+    def _run(self):
+        while self._running:
+            self._wake.wait(self.flush_interval)
+            self._write()
+        self._write()
+
+    def _write(self):
+        buffer = self._buffer
+        lines = []
+        while buffer:
+            record = buffer.popleft()
+            lines.append(
+                "{} {:<7} {}: {}\n".format(
+                    time.strftime("%H:%M:%S", time.localtime(record[0])),
+                    LEVEL_NAMES.get(record[1], record[1]),
+                    record[2],
+                    _message(record),
+                )
+            )
+        if not lines:
+            return
+        try:
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.writelines(lines)
+            self.written += len(lines)
+        except OSError:
+            pass
+
+
+def _message(record) -> str:
+    message, args, suppressed = record[3], record[4], record[5]
+    try:
+        text = message.format(*args) if args else message
+    except (IndexError, KeyError, ValueError):
+        text = "{} {}".format(message, args)
+    if suppressed:
+        text += " ({} more suppressed)".format(suppressed)
+    return text
+
+
+log = Log()
@@ -1,9 +1,30 @@
-import datetime
 import sys
-from collections import defaultdict
-
-import ac  # type: ignore
-import acsys  # type: ignore
+import time
+
+from battles import BattleTracker
+from cooldowns import Cooldowns, pair
+from history import LapHistory
+from instrumentation import metrics
+from log import log
+from positions import PositionTracker
+from spatial import SplineIndex
+from telemetry import CarState, Reading, TelemetrySource
+from timing import TimingIndex
+
+# Every per-car read Driver.sample() can make
+ALL_FIELDS = frozenset(
+    (
+        CarState.LAST_LAP,
+        CarState.BEST_LAP,
+        CarState.LAP_COUNT,
+        CarState.SPEED_KMH,
+        CarState.SPLINE_POSITION,
+        CarState.DRS_AVAILABLE,
+        Reading.CONNECTED,
+        Reading.IN_PIT,
+        Reading.TYRE_COMPOUND,
+    )
+)
 
 
 class EventType:
@@ -13,7 +34,10 @@ class EventType:
     We don't want to be reporting events that happened too long ago
     so this will apply weights to events according to how likely
     they are to be discarded from the queue if we are currently reporting
-    and there are more events later in the queue
+    and there are more events later in the queue.
+
+    PRIORITY is the weight an event starts with in the EventScheduler and
+    TTL is how many seconds it may wait in the queue before it is dropped
     """
 
     # Race has stopped due to an incident. Racer's line up to restart
@@ -22,8 +46,10 @@ class EventType:
     END_SAFETY_CAR = "end_safety_car"
     # Driver A's engine died/(Did not finish)
     DNF = "dnf"  # TODO
-    # Driver A and Driver B collide
-    COLLISION = "collision"  # TODO
+    # Driver A hits something, Driver B if another car was right there
+    COLLISION = "collision"
+    # Driver has run off the track
+    OFF_TRACK = "off_track"
     # Driver has set their best lap
     BEST_LAP = "best_lap"
     # Driver sets the fastest lap
@@ -43,18 +69,101 @@ class EventType:
     # Driver has been on the same set of tires for over 15 laps
     LONG_STINT = "long_stint"
 
+    PRIORITY = {
+        START_SAFETY_CAR: 100,
+        DNF: 95,
+        COLLISION: 90,
+        END_SAFETY_CAR: 80,
+        OVERTAKE: 70,
+        OFF_TRACK: 65,
+        FASTEST_LAP: 60,
+        LONG_PIT: 50,
+        QUICK_PIT: 45,
+        ENTERED_PIT: 40,
+        DRS_RANGE: 30,
+        BEST_LAP: 25,
+        SHORT_INTERVAL: 20,
+        LONG_STINT: 10,
+    }
+
+    TTL = {
+        START_SAFETY_CAR: 60,
+        DNF: 120,
+        COLLISION: 30,
+        END_SAFETY_CAR: 45,
+        OVERTAKE: 20,
+        OFF_TRACK: 20,
+        FASTEST_LAP: 60,
+        LONG_PIT: 60,
+        QUICK_PIT: 45,
+        ENTERED_PIT: 30,
+        DRS_RANGE: 10,
+        BEST_LAP: 30,
+        SHORT_INTERVAL: 15,
+        LONG_STINT: 120,
+    }
+
+    # (laps, seconds) before a race wide event is raised again for the same
+    # pair of cars, or for the whole field
+    COOLDOWN = {
+        START_SAFETY_CAR: (1, 0),
+        END_SAFETY_CAR: (1, 0),
+        DRS_RANGE: (1, 30),
+        SHORT_INTERVAL: (1, 60),
+    }
+
+    # The params each type of event carries, in the order the event log
+    # stores them. Types without an entry are stored with their params sorted
+    FIELDS = {
+        START_SAFETY_CAR: ("lap_count",),
+        END_SAFETY_CAR: ("lap_count",),
+        DNF: ("driver", "reason"),
+        COLLISION: (
+            "driver",
+            "driver_b",
+            "g",
+            "damage",
+            "speed_before",
+            "speed_after",
+        ),
+        OFF_TRACK: ("driver", "speed_before", "speed_after"),
+        BEST_LAP: ("driver", "lap_time"),
+        FASTEST_LAP: ("driver", "lap_time"),
+        ENTERED_PIT: ("driver", "lap_count", "last_lap", "compound"),
+        LONG_PIT: ("driver", "compound", "duration"),
+        QUICK_PIT: ("driver", "compound", "duration"),
+        SHORT_INTERVAL: ("driver_a", "driver_b", "interval"),
+        DRS_RANGE: ("driver_a", "driver_b", "interval"),
+        OVERTAKE: ("driver_a", "driver_b", "position", "time"),
+        LONG_STINT: (
+            "driver",
+            "lap_count",
+            "tire_age",
+            "last_lap",
+            "compound",
+            "stint_average",
+            "pace",
+            "degradation",
+        ),
+    }
+
 
 class Event:
     """
     Event
 
-    Contains all relevant information for a particular event
+    Contains all relevant information for a particular event. time is when
+    it was detected, in time.monotonic() seconds so it can be compared with
+    the commentary timings, and params holds the fields listed in
+    EventType.FIELDS
     """
 
-    def __init__(self, event_type: str, driver_id: int, params):
+    __slots__ = ("type", "driver_id", "time", "params")
+
+    def __init__(self, event_type: str, driver_id: int, params, when: float = None):
         self.type = event_type
         self.driver_id = driver_id
-        self.time = datetime.datetime.now()
+        self.time = time.monotonic() if when is None else when
         self.params = params
 
     def __str__(self):
@@ -63,168 +172,128 @@ class Event:
         )
 
 
+class CompositeEvent(Event):
+    """
+    CompositeEvent
+
+    Several related events merged into one so they are commentated on in a
+    single line. It takes the type, driver and params of its highest
+    priority event so it is queued and filmed like that event. reason is
+    "battle" for pair events between the same group of cars, otherwise the
+    shared event type
+    """
+
+    __slots__ = ("events", "reason", "drivers")
+
+    def __init__(self, events, reason: str, drivers=()):
+        lead = max(events, key=lambda event: EventType.PRIORITY.get(event.type, 0))
+        super().__init__(lead.type, lead.driver_id, lead.params)
+        # Detected when the first of its events was
+        self.time = min(event.time for event in events)
+        self.events = events
+        self.reason = reason
+        self.drivers = list(drivers)
+
+    def __str__(self):
+        return "{} ({} events) - {}".format(
+            self.reason, len(self.events), ", ".join(e.type for e in self.events)
+        )
+
+
 class Driver:
     """
     Driver
 
-    Contains all race relevant information for a particular driver
+    Contains all race relevant information for a particular driver.
+    connected, in_pit and compound are the values of the previous sample,
+    kept by detect() whichever detectors are active
     """
 
-    def __init__(self, id: int):
+    # Fields read for the values detect() keeps
+    FIELDS = (Reading.CONNECTED, Reading.IN_PIT, Reading.TYRE_COMPOUND)
+
+    def __init__(self, id: int, telemetry: TelemetrySource):
         self.id = id
-        self.name = ac.getDriverName(id)
-        self.nation = ac.getDriverNationCode(id)
-        self.car_name = ac.getCarName(id)
-        self.compound = ac.getCarTyreCompound(id)
+        self.telemetry = telemetry
+        self.name = telemetry.driver_name(id)
+        self.nation = telemetry.driver_nation_code(id)
+        self.car_name = telemetry.car_name(id)
+        self.compound = telemetry.tyre_compound(id)
         self.pit_stops = 0
         self.tire_age = 0
         self.last_compound_change_lap = 0
         self.connected = False
         self.in_pit = False
-        self.last_lap = ac.getCarState(self.id, acsys.CS.LastLap)
-        self.best_lap = ac.getCarState(self.id, acsys.CS.BestLap)
-        self.lap_count = ac.getCarState(self.id, acsys.CS.LapCount)
-        self.speed_kmh = ac.getCarState(self.id, acsys.CS.SpeedKMH)
-        self.lap_distance = ac.getCarState(self.id, acsys.CS.NormalizedSplinePosition)
-        self.drs_available = ac.getCarState(self.id, acsys.CS.DrsAvailable)
-        self.distance = self.lap_count + self.lap_distance
-        self.event_history = defaultdict(int)
+        self.lap_count = None
+        self.lap_completed = False
+        # Set by RaceState.add_driver, until then every field is read
+        self.detectors = None
+        self.cooldowns = None
+        self.sample()
+        # A car already in the pits when it is added hasn't entered them
+        self.in_pit = self.sampled_in_pit
+        self.latest_pit_start = None
+        self.history = LapHistory(self.compound)
+        # The lap in progress when the driver was added isn't recorded
+        self.lap_completed = False
+        self.lap_in_pit = self.sampled_in_pit
 
     def __str__(self) -> str:
         return "{} - {}".format(self.id, self.name)
 
-    def update(self):
-        events = []
-
-        self.last_lap = ac.getCarState(self.id, acsys.CS.LastLap)
-        self.best_lap = ac.getCarState(self.id, acsys.CS.BestLap)
-        self.lap_count = ac.getCarState(self.id, acsys.CS.LapCount)
-        self.speed_kmh = ac.getCarState(self.id, acsys.CS.SpeedKMH)
-        self.lap_distance = ac.getCarState(self.id, acsys.CS.NormalizedSplinePosition)
-        self.drs_available = ac.getCarState(self.id, acsys.CS.DrsAvailable)
+    def sample(self, full: bool = True):
+        """
+        Reads the driver's telemetry for detect(). The position fields are
+        read every time, the lap fields (lap times, tyre compound) only when
+        full is set, a lap was completed or the car left the pits. Fields no
+        active detector needs aren't read and keep their last value
+        """
+        fields = ALL_FIELDS if self.detectors is None else self.detectors.fields
+        lap_changed = self.sample_position(fields)
+        if full or lap_changed or (self.in_pit and not self.sampled_in_pit):
+            self.sample_lap(fields)
+        self.lap_completed = self.lap_completed or lap_changed
+
+    def sample_position(self, fields=ALL_FIELDS) -> bool:
+        """Reads the fast changing fields. Returns True if a lap was completed"""
+        telemetry = self.telemetry
+        lap_count = telemetry.car_state(self.id, CarState.LAP_COUNT)
+        lap_changed = lap_count != self.lap_count
+        self.lap_count = lap_count
+        self.lap_distance = telemetry.car_state(self.id, CarState.SPLINE_POSITION)
         self.distance = self.lap_count + self.lap_distance
-
-        # Check if the driver has left the game (DNF)
-        connected = ac.isConnected(self.id)
-        if self.connected and not connected and EventType.DNF not in self.event_history:
-            ac.console("EVENT: {} - {}".format(EventType.DNF, self.name))
-            events.append(
-                Event(
-                    EventType.DNF,
-                    self.id,
-                    {
-                        "driver": self.name,
-                        "reason": "Disconnected",
-                    },
-                )
+        self.sample_time = telemetry.clock()
+        if CarState.SPEED_KMH in fields:
+            self.speed_kmh = telemetry.car_state(self.id, CarState.SPEED_KMH)
+        if CarState.DRS_AVAILABLE in fields:
+            self.drs_available = telemetry.car_state(self.id, CarState.DRS_AVAILABLE)
+        if Reading.CONNECTED in fields:
+            self.sampled_connected = telemetry.is_connected(self.id)
+        if Reading.IN_PIT in fields:
+            self.sampled_in_pit = bool(
+                telemetry.is_in_pitline(self.id) or telemetry.is_in_pit(self.id)
             )
-            self.event_history[EventType.DNF] = self.last_lap
-        self.connected = connected
-
-        # Track the duration of the driver's pitstop
-        in_pit = bool(ac.isCarInPitline(self.id) or ac.isCarInPit(self.id))
-        if (
-            not self.in_pit
-            and in_pit
-            and self.lap_count - self.event_history[EventType.ENTERED_PIT] > 0
-        ):
-            self.latest_pit_start = datetime.datetime.now()
-            self.pit_stops += 1
-            ac.console("EVENT: {} - {}".format(EventType.ENTERED_PIT, self.name))
-            events.append(
-                Event(
-                    EventType.ENTERED_PIT,
-                    self.id,
-                    {
-                        "driver": self.name,
-                        "lap_count": self.lap_count,
-                        "last_lap": self.last_lap,
-                        "compound": self.compound,
-                    },
-                )
-            )
-            self.event_history[EventType.ENTERED_PIT] = self.lap_count
-        elif self.in_pit and not in_pit:
-            duration = datetime.datetime.now() - self.latest_pit_start
-            if (
-                duration.total_seconds() > 60
-                and self.lap_count - self.event_history[EventType.LONG_PIT] > 0
-            ):
-                ac.console("EVENT: {} - {}".format(EventType.LONG_PIT, self.name))
-                events.append(
-                    Event(
-                        EventType.LONG_PIT,
-                        self.id,
-                        {
-                            "driver": self.name,
-                            "compound": self.compound,
-                            "duration": int(duration.total_seconds()),
-                        },
-                    )
-                )
-                self.event_history[EventType.LONG_PIT] = self.lap_count
-            elif (
-                duration.total_seconds() < 30
-                and self.lap_count - self.event_history[EventType.QUICK_PIT] > 0
-            ):
-                ac.console("EVENT: {} - {}".format(EventType.QUICK_PIT, self.name))
-                events.append(
-                    Event(
-                        EventType.QUICK_PIT,
-                        self.id,
-                        {
-                            "driver": self.name,
-                            "compound": self.compound,
-                            "duration": int(duration.total_seconds()),
-                        },
-                    )
-                )
-                self.event_history[EventType.QUICK_PIT] = self.lap_count
-        self.in_pit = in_pit
+        return lap_changed
 
-        # Check if the driver has set their best lap
-        if (
-            self.last_lap == self.best_lap
-            and self.lap_count - self.event_history[EventType.BEST_LAP] > 0
-        ):
-            ac.console("EVENT: {} - {}".format(EventType.BEST_LAP, self.name))
-            events.append(
-                Event(
-                    EventType.BEST_LAP,
-                    self.id,
-                    {"driver": self.name, "lap_time": self.best_lap},
-                )
-            )
-            self.event_history[EventType.BEST_LAP] = self.lap_count
-
-        # Check tire age
-        compound = ac.getCarTyreCompound(self.id)
-        if compound != self.compound:
-            self.tire_age = 0
-            self.last_compound_change_lap = 0
-        else:
-            self.tire_age = self.lap_count - self.last_compound_change_lap
-            if (
-                self.tire_age > 15
-                and self.lap_count - self.event_history[EventType.LONG_STINT] > 0
-            ):
-                ac.console("EVENT: {} - {}".format(EventType.LONG_STINT, self.name))
-                events.append(
-                    Event(
-                        EventType.LONG_STINT,
-                        self.id,
-                        {
-                            "driver": self.name,
-                            "lap_count": self.lap_count,
-                            "tire_age": self.tire_age,
-                            "last_lap": self.last_lap,
-                            "compound": self.compound,
-                        },
-                    )
-                )
-                self.event_history[EventType.LONG_STINT] = self.lap_count
-        self.compound = compound
+    def sample_lap(self, fields=ALL_FIELDS):
+        """Reads the fields that only change once a lap or in the pits"""
+        if CarState.LAST_LAP in fields:
+            self.last_lap = self.telemetry.car_state(self.id, CarState.LAST_LAP)
+        if CarState.BEST_LAP in fields:
+            self.best_lap = self.telemetry.car_state(self.id, CarState.BEST_LAP)
+        if Reading.TYRE_COMPOUND in fields:
+            self.sampled_compound = self.telemetry.tyre_compound(self.id)
 
+    def update(self):
+        self.sample()
+        return self.detect()
+
+    def detect(self):
+        """Runs the detectors on the values read by the last sample()"""
+        events = [] if self.detectors is None else self.detectors.run(self)
+        self.connected = self.sampled_connected
+        self.in_pit = self.sampled_in_pit
+        self.compound = self.sampled_compound
         return events
 
 
@@ -232,74 +301,139 @@ class RaceState:
     """
     RaceState
 
-    Used to keep track and the current and previous race states
+    Used to keep track and the current and previous race states.
+    The per-driver checks are the detectors of a DetectorSet (detectors.py),
+    by default every registered one
     """
 
-    def __init__(self):
+    # Fields read for the race wide checks of evaluate()
+    FIELDS = (
+        CarState.LAP_COUNT,
+        CarState.SPLINE_POSITION,
+        CarState.SPEED_KMH,
+        CarState.DRS_AVAILABLE,
+        CarState.BEST_LAP,
+    )
+
+    def __init__(self, telemetry: TelemetrySource, detectors=None):
+        if detectors is None:
+            # detectors.py builds on this module
+            from detectors import DetectorSet
+
+            detectors = DetectorSet()
+        self.telemetry = telemetry
+        self.detectors = detectors
         self.drivers = []  # Ordered by position
         self.fastest_lap = sys.float_info.max
         self.safety_car = False
-        self.event_history = defaultdict(int)
+        self.cooldowns = Cooldowns()
+        self.positions = PositionTracker()
+        self.timing = TimingIndex()
+        self.track = SplineIndex()
+        self.battles = BattleTracker()
+        self._by_id = {}
 
     def add_driver(self, driver: Driver):
-        self.drivers.append(driver)
-        self.drivers.sort(key=lambda driver: driver.distance)
+        driver.detectors = self.detectors
+        driver.cooldowns = self.cooldowns
+        self._by_id[driver.id] = driver
+        self.positions.add(driver.id, driver.distance)
+        self.track.add(driver.id, driver.lap_distance)
+        self.drivers = [self._by_id[id] for id in self.positions.order]
+
+    def _cool(self, key, lap: int, now: float):
+        """Starts the cooldown of a race wide key, see EventType.COOLDOWN"""
+        laps, seconds = EventType.COOLDOWN[key[0]]
+        self.cooldowns.start(key, lap, now, laps, seconds)
 
     def update(self):
+        start = metrics.start()
         events = []
-
-        avg_speed = 0
         for driver in self.drivers:
             events.extend(driver.update())
-            avg_speed += driver.speed_kmh
+        events.extend(self.evaluate())
+        metrics.stop("race_state_update", start)
+        return events
+
+    def evaluate(self):
+        """
+        Race wide checks (overtakes, intervals, safety car, fastest lap) on
+        the values the drivers last sampled
+        """
+        start = metrics.start()
+        events = []
+
+        avg_speed = sum(driver.speed_kmh for driver in self.drivers)
         avg_speed /= len(self.drivers)
 
-        sorted_drivers = sorted(
-            self.drivers, key=lambda driver: driver.distance, reverse=True
+        now = self.telemetry.clock()
+        for driver in self.drivers:
+            self.timing.update(driver.id, driver.distance, driver.sample_time)
+        crossings = self.positions.update(
+            {driver.id: driver.distance for driver in self.drivers}, now
         )
+        self.track.update({driver.id: driver.lap_distance for driver in self.drivers})
+        sorted_drivers = [self._by_id[id] for id in self.positions.order]
+        gaps = [
+            self.timing.gap(sorted_drivers[i].id, sorted_drivers[i + 1].id)
+            for i in range(len(sorted_drivers) - 1)
+        ]
+        self.battles.update(self.positions.order, gaps, now)
 
         current_lap = sorted_drivers[0].lap_count
-
-        # Check for overtakes and short intervals
-        for i in range(len(sorted_drivers) - 1):
-            if (
-                sorted_drivers[i].id != self.drivers[i].id
-                and sorted_drivers[i + 1].id == self.drivers[i].id
-                and current_lap - self.event_history[EventType.OVERTAKE] > 0
-            ):
-                ac.console(
-                    "EVENT: {} - {}".format(EventType.OVERTAKE, sorted_drivers[i].name)
+        # The last car is on the lowest lap
+        self.cooldowns.expire(now, sorted_drivers[-1].lap_count)
+
+        # Report every pass since the last update, but not cars swapping
+        # back and forth
+        if current_lap > 0:
+            for crossing in crossings:
+                if crossing.repass:
+                    continue
+                passer = self._by_id[crossing.passer]
+                passed = self._by_id[crossing.passed]
+                log.info(
+                    EventType.OVERTAKE,
+                    "EVENT: {} - {}",
+                    EventType.OVERTAKE,
+                    passer.name,
                 )
                 events.append(
                     Event(
                         EventType.OVERTAKE,
-                        sorted_drivers[i].id,
+                        passer.id,
                         {
-                            "driver_a": sorted_drivers[i].name,
-                            "driver_b": sorted_drivers[i + 1].name,
-                            "position": i + 1,
+                            "driver_a": passer.name,
+                            "driver_b": passed.name,
+                            "position": crossing.position,
+                            "time": round(crossing.time, 2),
                         },
                     )
                 )
-                self.event_history[EventType.OVERTAKE] = current_lap
 
-            interval = self._calculateTimeInterval(
-                sorted_drivers[i], sorted_drivers[i + 1]
+        # Check for DRS range and short intervals
+        for i, interval in enumerate(gaps):
+            if interval is None:
+                # Not enough timing lines crossed yet, or lapped
+                continue
+            log.debug(
+                "drs_available",
+                "DRS available: {} - {}",
+                sorted_drivers[i].drs_available,
+                sorted_drivers[i + 1].drs_available,
             )
-            ac.console(
-                "DRS available: {} - {}".format(
-                    sorted_drivers[i].drs_available, sorted_drivers[i + 1].drs_available
+            # log.debug("interval", "Interval: {} - {}", interval, sorted_drivers[i + 1].name)
+            if sorted_drivers[i + 1].drs_available:
+                key = pair(
+                    EventType.DRS_RANGE, sorted_drivers[i].id, sorted_drivers[i + 1].id
                 )
-            )
-            # ac.console("Interval: {} - {}".format(interval, sorted_drivers[i + 1].name))
-            if (
-                sorted_drivers[i + 1].drs_available
-                and current_lap - self.event_history[EventType.DRS_RANGE] > -1
-            ):
-                ac.console(
-                    "EVENT: {} - {}".format(
-                        EventType.DRS_RANGE, sorted_drivers[i + 1].name
-                    )
+                if not self.cooldowns.ready(key, current_lap, now):
+                    continue
+                log.info(
+                    EventType.DRS_RANGE,
+                    "EVENT: {} - {}",
+                    EventType.DRS_RANGE,
+                    sorted_drivers[i + 1].name,
                 )
                 events.append(
                     Event(
@@ -308,19 +442,25 @@ class RaceState:
                         {
                             "driver_a": sorted_drivers[i].name,
                             "driver_b": sorted_drivers[i + 1].name,
-                            "interval": interval,
+                            "interval": round(interval, 1),
                         },
                     )
                 )
-                self.event_history[EventType.DRS_RANGE] = current_lap
-            elif (
-                interval < 3
-                and current_lap - self.event_history[EventType.SHORT_INTERVAL] > 0
-            ):
-                ac.console(
-                    "EVENT: {} - {}".format(
-                        EventType.SHORT_INTERVAL, sorted_drivers[i + 1].name
-                    )
+                self._cool(key, current_lap, now)
+            elif interval < 3 and current_lap > 0:
+                # Not at the start, with the whole field close together
+                key = pair(
+                    EventType.SHORT_INTERVAL,
+                    sorted_drivers[i].id,
+                    sorted_drivers[i + 1].id,
+                )
+                if not self.cooldowns.ready(key, current_lap, now):
+                    continue
+                log.info(
+                    EventType.SHORT_INTERVAL,
+                    "EVENT: {} - {}",
+                    EventType.SHORT_INTERVAL,
+                    sorted_drivers[i + 1].name,
                 )
                 events.append(
                     Event(
@@ -329,11 +469,11 @@ class RaceState:
                         {
                             "driver_a": sorted_drivers[i].name,
                             "driver_b": sorted_drivers[i + 1].name,
-                            "interval": int(interval),
+                            "interval": round(interval, 1),
                         },
                     )
                 )
-                self.event_history[EventType.SHORT_INTERVAL] = current_lap
+                self._cool(key, current_lap, now)
 
         self.drivers = sorted_drivers
 
@@ -342,10 +482,12 @@ class RaceState:
             not self.safety_car
             and current_lap > 1
             and avg_speed < 30
-            and current_lap - self.event_history[EventType.START_SAFETY_CAR] > 0
+            and self.cooldowns.ready((EventType.START_SAFETY_CAR,), current_lap, now)
         ):
             self.safety_car = True
-            ac.console("EVENT: {}".format(EventType.START_SAFETY_CAR))
+            log.info(
+                EventType.START_SAFETY_CAR, "EVENT: {}", EventType.START_SAFETY_CAR
+            )
             events.append(
                 Event(
                     EventType.START_SAFETY_CAR,
@@ -353,14 +495,14 @@ class RaceState:
                     {"lap_count": current_lap},
                 )
             )
-            self.event_history[EventType.START_SAFETY_CAR] = current_lap
+            self._cool((EventType.START_SAFETY_CAR,), current_lap, now)
         elif (
             self.safety_car
             and avg_speed > 160
-            and current_lap - self.event_history[EventType.END_SAFETY_CAR] > 0
+            and self.cooldowns.ready((EventType.END_SAFETY_CAR,), current_lap, now)
         ):
             self.safety_car = False
-            ac.console("EVENT: {}".format(EventType.END_SAFETY_CAR))
+            log.info(EventType.END_SAFETY_CAR, "EVENT: {}", EventType.END_SAFETY_CAR)
             events.append(
                 (
                     Event(
@@ -370,7 +512,7 @@ class RaceState:
                     )
                 )
             )
-            self.event_history[EventType.END_SAFETY_CAR] = current_lap
+            self._cool((EventType.END_SAFETY_CAR,), current_lap, now)
 
         # Check for fastest lap
         for driver in self.drivers:
@@ -378,8 +520,11 @@ class RaceState:
                 self.fastest_lap = driver.best_lap
                 if current_lap > 3:
                     # Don't report fastest lap on the first few laps
-                    ac.console(
-                        "EVENT: {} - {}".format(EventType.FASTEST_LAP, driver.name)
+                    log.info(
+                        EventType.FASTEST_LAP,
+                        "EVENT: {} - {}",
+                        EventType.FASTEST_LAP,
+                        driver.name,
                     )
                     events.append(
                         Event(
@@ -392,10 +537,5 @@ class RaceState:
                         )
                     )
 
+        metrics.stop("race_state_evaluate", start)
         return events
-
-    def _calculateTimeInterval(
-        self, driverAhead: Driver, driverBehind: Driver
-    ) -> float:
-        deltaD = abs(driverAhead.distance - driverBehind.distance)
-        return driverAhead.last_lap - (driverBehind.last_lap * (1 - deltaD))
@@ -0,0 +1,118 @@
+"""
+Position tracker
+
+Keeps the running order between updates and reports every pass. The order
+barely changes from one update to the next, so it is repaired with an
+insertion sort instead of being sorted from scratch
+"""
+
+
+class Crossing:
+    """
+    passer moved ahead of passed, taking position (1 based) at time. repass
+    is set if the two cars already swapped places within the tracker's
+    repass_time, e.g. while running side by side
+    """
+
+    __slots__ = ("passer", "passed", "position", "time", "repass")
+
+    def __init__(self, passer, passed, position: int, time: float):
+        self.passer = passer
+        self.passed = passed
+        self.position = position
+        self.time = time
+        self.repass = False
+
+    def __repr__(self):
+        return "Crossing({!r}, {!r}, {}, {:.2f})".format(
+            self.passer, self.passed, self.position, self.time
+        )
+
+
+class PositionTracker:
+    """
+    PositionTracker
+
+    order holds the tracked keys (driver ids, array indices...) leader
+    first. update() is given the new distance of every key and moves each
+    car up past the cars it has overtaken. Every move is one pass, so all
+    position exchanges since the last update are found, multi-car passes
+    included, in O(n + passes).
+
+    The time of each pass is interpolated from the two cars' distances at
+    the previous and the current update, assuming constant speeds in
+    between
+    """
+
+    def __init__(self, repass_time: float = 10):
+        self.repass_time = repass_time
+        self.order = []
+        self._distances = {}
+        self._time = None
+        self._last_swap = {}
+
+    def add(self, key, distance: float):
+        position = len(self.order)
+        while position > 0 and self._distances[self.order[position - 1]] < distance:
+            position -= 1
+        self.order.insert(position, key)
+        self._distances[key] = distance
+
+    def update(self, distances, now: float) -> list:
+        """
+        distances maps every key to its distance (lap count plus spline
+        position). Returns the Crossings in the order they were found
+        """
+        previous = self._distances
+        since = self._time
+        order = self.order
+        crossings = []
+        for i in range(1, len(order)):
+            key = order[i]
+            distance = distances[key]
+            j = i
+            while j > 0 and distances[order[j - 1]] < distance:
+                passed = order[j - 1]
+                order[j] = passed
+                crossings.append(
+                    Crossing(
+                        key,
+                        passed,
+                        j,
+                        self._crossing_time(
+                            previous[key],
+                            distance,
+                            previous[passed],
+                            distances[passed],
+                            since,
+                            now,
+                        ),
+                    )
+                )
+                j -= 1
+            order[j] = key
+
+        self.mark_repasses(crossings)
+        self._distances = {key: distances[key] for key in order}
+        self._time = now
+        return crossings
+
+    def mark_repasses(self, crossings):
+        """Sets repass on the crossings of cars that swapped places lately"""
+        for crossing in crossings:
+            pair = frozenset((crossing.passer, crossing.passed))
+            last_swap = self._last_swap.get(pair)
+            crossing.repass = (
+                last_swap is not None and crossing.time - last_swap < self.repass_time
+            )
+            self._last_swap[pair] = crossing.time
+
+    @staticmethod
+    def _crossing_time(passer_from, passer_to, passed_from, passed_to, since, now):
+        if since is None:
+            return now
+        gap_before = passed_from - passer_from
+        gap_after = passer_to - passed_to
+        if gap_before <= 0 or gap_before + gap_after <= 0:
+            return since
+        return since + (now - since) * gap_before / (gap_before + gap_after)
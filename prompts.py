@@ -0,0 +1,240 @@
+"""
+Prompts
+
+Turns events into the prompts sent to the LLM
+"""
+
+from models import CompositeEvent, Event, EventType
+
+# Fragments of the prompts below that are likely to be said as they are,
+# rendered by the sidecar ahead of time along with the driver names
+STOCK_PHRASES = (
+    "safety car",
+    "out of the race",
+    "has crashed",
+    "has collided with",
+    "kilometres per hour",
+    "has gone off the track",
+    "personal best",
+    "fastest lap",
+    "lap time",
+    "has entered the pit",
+    "pit stop",
+    "compound tire",
+    "D-R-S",
+    "has overtaken",
+    "is now in position",
+)
+
+
+# Parameters holding names, swapped into a cached line for the event at hand
+NAME_PARAMS = ("driver", "driver_a", "driver_b")
+# The params each type of prompt states. Response cache keys are made of
+# these alone, bookkeeping params such as an overtake's time would make
+# every key unique
+PROMPT_PARAMS = {
+    EventType.START_SAFETY_CAR: (),
+    EventType.END_SAFETY_CAR: (),
+    EventType.DNF: ("driver", "reason"),
+    EventType.COLLISION: (
+        "driver",
+        "driver_b",
+        "g",
+        "damage",
+        "speed_before",
+        "speed_after",
+    ),
+    EventType.OFF_TRACK: ("driver", "speed_before"),
+    EventType.BEST_LAP: ("driver", "lap_time"),
+    EventType.FASTEST_LAP: ("driver", "lap_time"),
+    EventType.ENTERED_PIT: ("driver", "last_lap", "compound"),
+    EventType.LONG_PIT: ("driver", "compound", "duration"),
+    EventType.QUICK_PIT: ("driver", "compound", "duration"),
+    EventType.SHORT_INTERVAL: ("driver_a", "driver_b", "interval"),
+    EventType.DRS_RANGE: ("driver_a", "driver_b", "interval"),
+    EventType.OVERTAKE: ("driver_a", "driver_b", "position"),
+    EventType.LONG_STINT: (
+        "driver",
+        "tire_age",
+        "last_lap",
+        "compound",
+        "stint_average",
+        "degradation",
+    ),
+}
+# Numeric parameters are rounded to these steps in response cache keys, so
+# events a listener couldn't tell apart share lines, and in the prompts, so
+# a cached line never quotes a figure its key doesn't. The rest must match
+KEY_STEPS = {
+    "lap_time": 100,
+    "last_lap": 100,
+    "stint_average": 0.1,
+    "pace": 0.1,
+    "degradation": 0.05,
+    "g": 1,
+    "damage": 1,
+    "speed_before": 10,
+    "speed_after": 10,
+}
+
+
+def commentary_key(event: Event):
+    """
+    The response cache entry for event's line: key is the event type and
+    the PROMPT_PARAMS it has, numbers rounded to KEY_STEPS and names by
+    name only, and values the names to swap into a cached line. None for
+    composite events, which aren't cached, and types without PROMPT_PARAMS
+    """
+    if isinstance(event, CompositeEvent) or event.type not in PROMPT_PARAMS:
+        return None
+    parts = [event.type]
+    values = {}
+    for name in PROMPT_PARAMS[event.type]:
+        if name not in event.params:
+            continue
+        value = event.params[name]
+        if name in NAME_PARAMS:
+            values[name] = str(value)
+            parts.append(name)
+            continue
+        parts.append("{}={}".format(name, _rounded(name, value)))
+    return {"key": "|".join(parts), "values": values}
+
+
+def _rounded(name: str, value):
+    """value rounded to name's KEY_STEPS step, if it has one"""
+    step = KEY_STEPS.get(name)
+    if step is not None and isinstance(value, (int, float)):
+        value = round(round(value / step) * step, 3)
+    return value
+
+
+def _param(event: Event, name: str):
+    """The value of one of event's params as the prompt states it"""
+    return _rounded(name, event.params[name])
+
+
+def session_phrases(drivers) -> list:
+    """Phrases worth rendering ahead of time for a session with drivers"""
+    return [driver.name for driver in drivers] + list(STOCK_PHRASES)
+
+
+def generate_prompt(event: Event):
+    if isinstance(event, CompositeEvent):
+        return generate_composite_prompt(event)
+
+    prompt = ""
+    if event.type == EventType.START_SAFETY_CAR:
+        prompt = "The safety car has come out."
+    elif event.type == EventType.END_SAFETY_CAR:
+        prompt = "The safety car has now ended."
+    elif event.type == EventType.DNF:
+        prompt = (
+            "The driver named {} is now out of the race due to this reason: {}.".format(
+                event.params["driver"], event.params["reason"]
+            )
+        )
+    elif event.type == EventType.COLLISION:
+        if "driver_b" in event.params:
+            prompt = (
+                "The driver named {} has collided with the driver named {}.".format(
+                    event.params["driver"], event.params["driver_b"]
+                )
+            )
+        else:
+            prompt = "The driver named {} has crashed.".format(event.params["driver"])
+        prompt += " The impact was {} g and they went from {} to {} kilometres per hour.".format(
+            _param(event, "g"),
+            _param(event, "speed_before"),
+            _param(event, "speed_after"),
+        )
+        if _param(event, "damage") > 0:
+            prompt += " The car is damaged."
+    elif event.type == EventType.OFF_TRACK:
+        prompt = "The driver named {} has gone off the track at {} kilometres per hour.".format(
+            event.params["driver"], _param(event, "speed_before")
+        )
+    elif event.type == EventType.BEST_LAP:
+        prompt = "The driver named {} has just set a personal best with a lap time of {}.".format(
+            event.params["driver"], _param(event, "lap_time")
+        )
+    elif event.type == EventType.FASTEST_LAP:
+        prompt = "The driver named {} has just set the fastest lap with a time of {}.".format(
+            event.params["driver"], _param(event, "lap_time")
+        )
+    elif event.type == EventType.ENTERED_PIT:
+        prompt = "The driver named {} has entered the pit. They completed their last lap with a time of {} on the {} compound tire.".format(
+            event.params["driver"],
+            _param(event, "last_lap"),
+            event.params["compound"],
+        )
+    elif event.type == EventType.QUICK_PIT:
+        prompt = "The driver named {} just finished a quick pit stop that lasted {} seconds. They are now running the {} compound tire.".format(
+            event.params["driver"],
+            event.params["duration"],
+            event.params["compound"],
+        )
+    elif event.type == EventType.LONG_PIT:
+        prompt = "The driver named {} just finished a long pit stop that lasted {} seconds. They are now running the {} compound tire.".format(
+            event.params["driver"],
+            event.params["duration"],
+            event.params["compound"],
+        )
+    elif event.type == EventType.SHORT_INTERVAL:
+        prompt = (
+            "The driver named {} is within {} seconds of the driver named {}.".format(
+                event.params["driver_b"],
+                event.params["interval"],
+                event.params["driver_a"],
+            )
+        )
+    elif event.type == EventType.DRS_RANGE:
+        prompt = "The driver named {} is within {} seconds of the driver named {}. They can now use D-R-S to help with overtaking.".format(
+            event.params["driver_b"],
+            event.params["interval"],
+            event.params["driver_a"],
+        )
+    elif event.type == EventType.OVERTAKE:
+        prompt = "The driver named {} has overtaken the driver named {}. The driver named {} is now in position {}.".format(
+            event.params["driver_a"],
+            event.params["driver_b"],
+            event.params["driver_a"],
+            event.params["position"],
+        )
+    elif event.type == EventType.LONG_STINT:
+        prompt = "The driver named {} has now completed {} laps with the {} compound tires. They completed the last lap with a time of {}.".format(
+            event.params["driver"],
+            event.params["tire_age"],
+            event.params["compound"],
+            _param(event, "last_lap"),
+        )
+        if event.params.get("degradation") is not None:
+            degradation = _param(event, "degradation")
+            if degradation:
+                prompt += " Over this stint their lap times are {} by {} seconds a lap, averaging {} seconds.".format(
+                    "rising" if degradation > 0 else "falling",
+                    abs(degradation),
+                    _param(event, "stint_average"),
+                )
+            else:
+                prompt += " Over this stint their lap times are steady, averaging {} seconds.".format(
+                    _param(event, "stint_average")
+                )
+
+    return prompt
+
+
+def generate_composite_prompt(event: CompositeEvent):
+    prompt = ""
+    if event.reason == "battle":
+        prompt = "There is a battle on track between the drivers named {}. ".format(
+            ", ".join(event.drivers)
+        )
+    sentences = []
+    for member in event.events:
+        sentence = generate_prompt(member)
+        if sentence and sentence not in sentences:
+            sentences.append(sentence)
+    prompt += " ".join(sentences)
+    prompt += " Cover all of this together in one commentary line."
+    return prompt
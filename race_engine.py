@@ -0,0 +1,484 @@
+"""
+Race engine
+
+Event detection, scheduling, commentary and camera direction for one race.
+The in-game app runs it on the game loop, or in split mode (SPLIT_ENGINE)
+it runs in its own process fed from the shared memory ring:
+
+    python race_engine.py
+"""
+
+import argparse
+import os
+import threading
+import time
+
+import config
+from camera import Camera, CameraMode
+from coalescer import EventCoalescer
+from director import CameraDirector
+from eventlog import EventLog
+from incidents import IncidentSampler, incident_event
+from instrumentation import metrics
+from log import LEVELS, log
+from llm.services import channel, play_commentary, request_commentary
+from models import Driver, EventType, RaceState
+from prompts import commentary_key, generate_prompt, session_phrases
+from sampler import AdaptiveSampler
+from scheduler import EventScheduler
+from speculation import Speculator, batch_size
+from telemetry import TelemetryRecorder, TelemetrySource
+from workers import WorkerPool
+
+
+class RaceEngine:
+    """
+    RaceEngine
+
+    update() is called with the seconds since the last call, every frame in
+    game or every ENGINE_TICK in split mode. session is the sim_info session
+    type, used to pick the detectors. The game doesn't reload the app when
+    practice or qualifying turns into the race, so set_session() is called
+    with the current one every update. With sim_info (a SimInfo) the
+    player's car is watched for incidents
+    """
+
+    def __init__(
+        self, telemetry: TelemetrySource, camera: Camera, session=None, sim_info=None
+    ):
+        if config.RECORD_TELEMETRY_PATH:
+            telemetry = TelemetryRecorder(telemetry, config.RECORD_TELEMETRY_PATH)
+        self.telemetry = telemetry
+        log.configure(
+            LEVELS[config.LOG_LEVEL],
+            LEVELS[config.LOG_CONSOLE_LEVEL],
+            config.LOG_RATE,
+            config.LOG_SAMPLE,
+            telemetry.console,
+            config.LOG_CONSOLE_LINES,
+            config.LOG_PATH,
+        )
+        log.start()
+        self.camera = camera
+        self.last_update_time = 0
+        self.last_camera_update_time = 0
+
+        self.event_queue = EventScheduler()
+        self.coalescer = EventCoalescer(
+            config.COALESCE_WINDOW, max_drivers=config.COALESCE_MAX_DRIVERS
+        )
+        self.event_log = None
+        if config.EVENT_LOG_PATH:
+            self.event_log = EventLog(config.EVENT_LOG_PATH)
+        self.speculator = Speculator(channel)
+        self.commentary_pool = WorkerPool(
+            config.COMMENTARY_WORKERS, config.COMMENTARY_QUEUE, "commentary"
+        )
+        # Guards event_queue and speculator, the commentary worker pops the
+        # next event itself when its line is already generated
+        self.queue_lock = threading.Lock()
+        # Event chained by the commentary thread that still needs the camera
+        self.pending_camera_event = None
+        # Seconds the played lines took, one job can chain several
+        self.line_seconds = 0
+        self.lines_played = 0
+
+        if config.VECTORIZED_STATE:
+            from vector_state import VectorRaceState
+
+            self.state = VectorRaceState(telemetry)
+        else:
+            self.state = RaceState(telemetry)
+        self.session = session
+        self._configure_detectors()
+
+        self.director = CameraDirector(self.state)
+
+        self.incidents = None
+        if config.INCIDENT_DETECTION and sim_info is not None:
+            self.incidents = IncidentSampler(
+                sim_info,
+                config.INCIDENT_SAMPLE_RATE,
+                config.IMPACT_G,
+                off_track_time=config.OFF_TRACK_TIME,
+            )
+            self.incidents.start()
+
+        self.sampler = None
+        if config.ADAPTIVE_SAMPLING and not config.VECTORIZED_STATE:
+            self.sampler = AdaptiveSampler(
+                self.state,
+                telemetry,
+                fast_interval=config.SAMPLE_INTERVAL,
+                frame_budget=config.SAMPLE_FRAME_BUDGET,
+            )
+
+    def add_drivers(self):
+        for id in range(self.telemetry.cars_count()):
+            driver = Driver(id, self.telemetry)
+            self.state.add_driver(driver)
+            log.info(
+                "driver",
+                "Driver: {} - {} - {}",
+                driver.name,
+                driver.car_name,
+                driver.nation,
+            )
+        if config.PRELOAD_PHRASES:
+            channel.preload(session_phrases(self.state.drivers))
+
+    def set_session(self, session):
+        """Picks the detectors again when the session type has changed"""
+        if session != self.session:
+            self.session = session
+            self._configure_detectors()
+
+    def _configure_detectors(self):
+        detectors = self.state.detectors
+        detectors.configure(self.session, config.DISABLED_DETECTORS)
+        log.info(
+            "detectors",
+            "Detectors: {}",
+            ", ".join(detector.name for detector in detectors.active),
+        )
+
+    def shutdown(self):
+        if self.incidents is not None:
+            self.incidents.stop()
+        with self.queue_lock:
+            self.speculator.cancel()
+        self.commentary_pool.shutdown()
+        channel.close()
+        if self.event_log is not None:
+            self.event_log.close()
+        log.pump()
+        log.stop()
+        self.telemetry.close()
+
+    def update(self, delta_t: float):
+        log.pump()
+        self.last_update_time += delta_t
+        self.last_camera_update_time += delta_t
+
+        if self.pending_camera_event is not None:
+            self.camera_control(self.pending_camera_event)
+            self.pending_camera_event = None
+
+        if self.incidents is not None:
+            # Found on the sampler thread, only what is ready is taken
+            incidents = self.incidents.drain()
+            if incidents:
+                events = [
+                    incident_event(incident, self.state) for incident in incidents
+                ]
+                for event in events:
+                    log.info(
+                        event.type, "EVENT: {} - {}", event.type, event.params["driver"]
+                    )
+                self._detected(events)
+
+        if self.sampler is not None:
+            self._detected(self.sampler.step(delta_t))
+            if self.last_update_time < config.DISPATCH_INTERVAL:
+                return
+        elif self.last_update_time < config.UPDATE_INTERVAL:
+            return
+
+        event_queue = self.event_queue
+        now = event_queue.clock()
+        if self.sampler is None:
+            self.telemetry.begin_tick(self.last_update_time)
+            self._detected(self.state.update(), now)
+        with self.queue_lock:
+            for event in self.coalescer.flush(now):
+                if not event_queue.push(event, now):
+                    metrics.count("events_dropped")
+                    log.warning(
+                        "event_dropped",
+                        "Event queue full. Dropped {} event",
+                        event.type,
+                    )
+            event_queue.expire(now)
+
+            if len(event_queue) == 0:
+                self.speculator.cancel()
+                log.debug("idle", "No events. Resetting last_update_time")
+                if self.sampler is not None:
+                    stats = self.sampler.stats()
+                    log.debug(
+                        "sampling",
+                        "Sampling: {} cars in {} frames, {} over budget, "
+                        "mean {:.0f}us, max {:.0f}us",
+                        stats["samples"],
+                        stats["frames"],
+                        stats["over_budget"],
+                        stats["mean_cost"] * 1e6,
+                        stats["max_cost"] * 1e6,
+                    )
+                self.camera_control()
+                self.last_update_time = 0
+                return
+
+            if self.commentary_pool.load >= config.COMMENTARY_WORKERS:
+                stats = self.commentary_pool.stats()
+                log.debug(
+                    "commentating",
+                    "Actively commentating. {} events queued, {} expired. "
+                    "Commentary jobs: {} waiting, mean wait {:.2f}s, mean run {:.2f}s",
+                    len(event_queue),
+                    event_queue.expired,
+                    stats["queue_depth"],
+                    stats["mean_wait"],
+                    stats["mean_run"],
+                )
+                if config.SPECULATIVE_COMMENTARY:
+                    self.speculator.update(
+                        self._speculate(now),
+                        generate_prompt,
+                        commentary_key if config.CACHE_COMMENTARY else None,
+                    )
+            else:
+                event = event_queue.pop(now)
+                request = self.speculator.take(event)
+                job = self.commentary_pool.submit(
+                    self.handle_commentary,
+                    event,
+                    request,
+                    deadline=now + config.COMMENTARY_DEADLINE,
+                )
+                if job is None:
+                    log.warning(
+                        "commentary_full",
+                        "Commentary queue full. Requeueing {} event",
+                        event.type,
+                    )
+                    if request is not None:
+                        request.cancel()
+                    event_queue.requeue(event, now)
+                else:
+                    log.info("trigger", "Trigger commentary on {} event", event.type)
+                    self.camera_control(event)
+
+        self.last_update_time = 0
+
+    def _detected(self, events, now: float = None):
+        metrics.count("events_detected", len(events))
+        if self.event_log is not None:
+            self.event_log.extend(events)
+        self.coalescer.add(events, now)
+
+    def _speculate(self, now: float) -> list:
+        """
+        The pending events to generate lines for while the current one
+        plays, as many as could still play before they expire
+        """
+        candidates = self.event_queue.top(config.COMMENTARY_BATCH, now)
+        line_seconds = config.LINE_SECONDS
+        if self.lines_played:
+            line_seconds = self.line_seconds / self.lines_played
+        size = batch_size(candidates, now, line_seconds, config.COMMENTARY_BATCH)
+        return [event for event, expires in candidates[:size]]
+
+    def camera_control(self, event=None):
+        if self.last_camera_update_time < 15:
+            log.debug(
+                "camera_locked",
+                "Camera locked for {} more seconds",
+                15 - int(self.last_camera_update_time),
+            )
+            return
+
+        if not event or event.type == EventType.DNF:
+            # Nothing to follow, or the car has gone
+            driver_id = self.director.pick(exclude=event.driver_id if event else None)
+            if driver_id is None:
+                return
+            self.camera.focus(driver_id)
+            log.debug(
+                "camera",
+                "No camera event or driver DNF'd. Focusing on driver: {}",
+                self._driver_name(driver_id),
+            )
+            self.camera.set_mode(CameraMode.RANDOM)
+            self.last_camera_update_time = 0
+            return
+
+        log.debug("camera", "Focus on driver_id: {}", event.driver_id)
+        if not self.camera.focus(event.driver_id):
+            log.error(
+                "camera_focus", "Unable to focus on driver_id: {}", event.driver_id
+            )
+            driver_id = self.director.pick(exclude=event.driver_id)
+            if driver_id is not None:
+                self.camera.focus(driver_id)
+                log.debug(
+                    "camera", "Focusing on driver: {}", self._driver_name(driver_id)
+                )
+
+        if event.type in (
+            EventType.START_SAFETY_CAR,
+            EventType.END_SAFETY_CAR,
+            EventType.DNF,
+            EventType.COLLISION,
+            EventType.OFF_TRACK,
+        ):
+            self.camera.set_mode(CameraMode.HELICOPTER)
+            log.debug("camera_mode", "Selecting HELICOPTER camera")
+        elif event.type in (EventType.ENTERED_PIT, EventType.OVERTAKE):
+            self.camera.set_mode(CameraMode.CAR)
+            log.debug("camera_mode", "Selecting CAR camera")
+        elif event.type in (EventType.SHORT_INTERVAL, EventType.DRS_RANGE):
+            self.camera.set_mode(CameraMode.COCKPIT)
+            log.debug("camera_mode", "Selecting COCKPIT camera")
+        else:
+            self.camera.set_mode(CameraMode.RANDOM)
+            log.debug("camera_mode", "Selecting RANDOM camera")
+
+        self.last_camera_update_time = 0
+
+    def _driver_name(self, driver_id: int) -> str:
+        for driver in self.state.drivers:
+            if driver.id == driver_id:
+                return driver.name
+        return str(driver_id)
+
+    def handle_commentary(self, job, event, request=None):
+        """
+        Handles chat completion and audio generation on the commentary
+        worker. request is a line the Speculator already generated for event.
+        When the line for the next best event is ready by the time this one
+        finishes it is played straight away
+        """
+        while event is not None and not job.cancelled:
+            line_start = time.perf_counter()
+            if request is not None:
+                log.info(
+                    "commentary", "Playing pre-generated line for {} event", event.type
+                )
+                job.on_cancel(request.cancel)
+                start = metrics.start()
+                request = play_commentary(request, job.remaining())
+                metrics.stop("commentary_play", start)
+            else:
+                # Generate the prompt
+                start = metrics.start()
+                prompt = generate_prompt(event)
+                start = metrics.lap("generate_prompt", start)
+                log.info("prompt", "PROMPT = '{}'", prompt)
+
+                # Get the chat completion from ollama and generate/play audio
+                request = request_commentary(
+                    prompt,
+                    job.remaining(),
+                    on_submit=lambda request: job.on_cancel(request.cancel),
+                    cache=commentary_key(event) if config.CACHE_COMMENTARY else None,
+                )
+                metrics.stop("commentary_request", start)
+            metrics.count(
+                "commentary_lines" if request.success else "commentary_failed"
+            )
+            if request.cached:
+                metrics.count("commentary_cached")
+            log.info("commentary", "SCRIPT STATUS = '{}'", request.success)
+            if request.first_audio_time is not None:
+                metrics.observe("event_to_audio", request.first_audio_time - event.time)
+            if request.time_to_first_audio is not None:
+                log.info(
+                    "first_audio",
+                    "{} event time to first audio: {:.2f}s",
+                    event.type,
+                    request.time_to_first_audio,
+                )
+
+            with self.queue_lock:
+                if request.success:
+                    self.line_seconds += time.perf_counter() - line_start
+                    self.lines_played += 1
+                now = self.event_queue.clock()
+                event = self.event_queue.peek(now)
+                if (
+                    event is None
+                    or not self.speculator.ready(event)
+                    or job.remaining() == 0
+                ):
+                    break
+                self.event_queue.pop(now)
+                request = self.speculator.take(event)
+                self.pending_camera_event = event
+
+
+def run(
+    ring_name: str,
+    tick: float = config.ENGINE_TICK,
+    metrics_path=None,
+    stop=None,
+    report=None,
+):
+    """
+    Runs an engine for every session the game starts on ring_name. stop
+    (a threading or multiprocessing Event) ends it after the current tick.
+    report, if given, is called with the stats of the session stop ended
+    before its engine shuts down, which can take a while with a line still
+    being generated. Returns the stats of the last session
+    """
+    from ring import RingCamera, RingTelemetry, TelemetryRing
+
+    # The game's shared memory pages can be read from any process on Windows
+    sim_info = None
+    if config.INCIDENT_DETECTION and os.name == "nt":
+        from third_party.sim_info import SimInfo
+
+        sim_info = SimInfo()
+
+    stats = {}
+    while stop is None or not stop.is_set():
+        ring = TelemetryRing(ring_name)
+        print("Waiting for the game on ring {}".format(ring_name))
+        telemetry = RingTelemetry(ring)
+        engine = RaceEngine(telemetry, RingCamera(ring), telemetry.session, sim_info)
+        engine.add_drivers()
+
+        last_metrics_time = 0
+        last_tick = time.perf_counter()
+        while not telemetry.restarted and (stop is None or not stop.is_set()):
+            time.sleep(tick)
+            now = time.perf_counter()
+            start = metrics.start()
+            engine.set_session(telemetry.session)
+            engine.update(now - last_tick)
+            metrics.stop("engine_update", start)
+            if metrics_path:
+                last_metrics_time += now - last_tick
+                if last_metrics_time >= config.METRICS_INTERVAL:
+                    metrics.write(metrics_path)
+                    last_metrics_time = 0
+            last_tick = now
+
+        if telemetry.restarted:
+            print("The game started a new session")
+        stats = {
+            "cars": telemetry.car_count,
+            "lost": telemetry.lost,
+            "expired": engine.event_queue.expired,
+            "commentary": engine.commentary_pool.stats(),
+        }
+        if report is not None and stop is not None and stop.is_set():
+            report(stats)
+        engine.shutdown()
+        ring.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="YaboAI race engine (split mode)")
+    parser.add_argument("--ring", default=config.RING_NAME)
+    parser.add_argument("--tick", type=float, default=config.ENGINE_TICK)
+    args = parser.parse_args()
+
+    if config.METRICS_PATH:
+        metrics.enable()
+    run(args.ring, args.tick, config.METRICS_PATH)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Replay
+
+Runs the RaceState pipeline headless from a telemetry recording made with
+RECORD_TELEMETRY_PATH and reports the per-tick cost and the events produced
+
+    python replay.py race.ytl.gz              # as fast as the CPU allows
+    python replay.py race.ytl.gz --speed 1    # real time
+    python replay.py race.ytl.gz --event-log race.yel
+"""
+
+import argparse
+import time
+from collections import Counter
+
+from coalescer import coalesce
+from eventlog import EventLog
+from log import log
+from models import Driver, RaceState
+from telemetry import ReplayTelemetry
+
+
+def replay(path: str, speed: float = 0, verbose: bool = False):
+    """
+    Feeds every recorded tick through RaceState.update(). A speed of 0 runs
+    as fast as possible, otherwise ticks are paced at speed times real time.
+    Returns the per-tick cost in seconds, the list of events and the number
+    of prompts left after coalescing each tick's events
+    """
+    telemetry = ReplayTelemetry(path, verbose)
+    if verbose:
+        log.configure(rate=float("inf"), console=print, console_lines=1000)
+    state = RaceState(telemetry)
+    for id in range(telemetry.cars_count()):
+        state.add_driver(Driver(id, telemetry))
+
+    tick_costs = []
+    events = []
+    prompts = 0
+    started = time.perf_counter()
+    while True:
+        delta_t = telemetry.next_tick()
+        if delta_t is None:
+            break
+
+        if speed:
+            delay = started + telemetry.session_time / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        tick_start = time.perf_counter()
+        tick_events = state.update()
+        tick_costs.append(time.perf_counter() - tick_start)
+        events.extend(tick_events)
+        log.pump()
+        prompts += len(coalesce(tick_events))
+
+    telemetry.close()
+    return tick_costs, events, prompts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a YaboAI telemetry file")
+    parser.add_argument("path")
+    parser.add_argument("--speed", type=float, default=0)
+    parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--event-log", help="Also write the events to this event log")
+    args = parser.parse_args()
+
+    wall_start = time.perf_counter()
+    tick_costs, events, prompts = replay(args.path, args.speed, args.verbose)
+    wall_time = time.perf_counter() - wall_start
+
+    print("Ticks: {}  Wall time: {:.3f}s".format(len(tick_costs), wall_time))
+    if tick_costs:
+        costs = sorted(tick_costs)
+        print(
+            "Tick cost (us): mean {:.1f}  p50 {:.1f}  p99 {:.1f}  max {:.1f}".format(
+                sum(costs) / len(costs) * 1e6,
+                costs[len(costs) // 2] * 1e6,
+                costs[min(len(costs) - 1, int(len(costs) * 0.99))] * 1e6,
+                costs[-1] * 1e6,
+            )
+        )
+    print("Events: {}  Prompts after coalescing: {}".format(len(events), prompts))
+    for event_type, count in sorted(Counter(e.type for e in events).items()):
+        print("  {}: {}".format(event_type, count))
+
+    if args.event_log:
+        event_log = EventLog(args.event_log)
+        event_log.extend(events)
+        event_log.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+Telemetry ring
+
+Shared memory between the game and the race engine process in split mode
+(SPLIT_ENGINE). The game appends raw per-car samples to a ring and the
+engine reads them. Camera commands go the other way through a second,
+smaller ring. Each ring has a single writer that publishes a running count
+after the entry is written, so neither side ever takes a lock
+"""
+
+import mmap
+import os
+import random
+import struct
+import tempfile
+import time
+
+from camera import Camera
+from telemetry import CarState, TelemetrySource
+
+MAGIC = b"YABO"
+VERSION = 2
+MAX_CARS = 64
+CAPACITY = 4096  # Samples, about 15s of a full grid at 60 fps
+COMMAND_CAPACITY = 64
+
+# magic, version, generation, car count, session, samples, commands written
+_HEADER = struct.Struct("<4sIIiiQQ")
+_SESSION = 16
+_SAMPLES_WRITTEN = 20
+_COMMANDS_WRITTEN = 28
+# driver name, nation code, car name
+_CAR_INFO = struct.Struct("<48s8s48s")
+# time, car id, lap count, spline position, speed, DRS available, connected,
+# in pit, last lap, best lap, tyre compound
+_SAMPLE = struct.Struct("<dHiffBBBii32s")
+# car to focus (-1 for none), camera mode ("" for no change)
+_COMMAND = struct.Struct("<i16s")
+
+_CAR_INFO_OFFSET = _HEADER.size
+_SAMPLES_OFFSET = _CAR_INFO_OFFSET + MAX_CARS * _CAR_INFO.size
+_COMMANDS_OFFSET = _SAMPLES_OFFSET + CAPACITY * _SAMPLE.size
+SIZE = _COMMANDS_OFFSET + COMMAND_CAPACITY * _COMMAND.size
+
+# Index of each CarState field in an unpacked sample
+_FIELDS = {
+    CarState.LAP_COUNT: 2,
+    CarState.SPLINE_POSITION: 3,
+    CarState.SPEED_KMH: 4,
+    CarState.DRS_AVAILABLE: 5,
+    CarState.LAST_LAP: 8,
+    CarState.BEST_LAP: 9,
+}
+
+
+def _text(value: bytes) -> str:
+    return value.split(b"\0", 1)[0].decode("utf-8", "replace")
+
+
+def _bytes(value: str, size: int) -> bytes:
+    return value.encode("utf-8")[:size]
+
+
+class TelemetryRing:
+    """
+    TelemetryRing
+
+    The mapped memory. On Windows it is a named mapping both processes
+    open by name, elsewhere a file in the temp directory. create clears it
+    for a new session
+    """
+
+    def __init__(self, name: str, create: bool = False):
+        self.name = name
+        self._file = None
+        if os.name == "nt":
+            self.buffer = mmap.mmap(-1, SIZE, "Local\\" + name)
+        else:
+            # Either side may get here first. The file is only ever grown
+            # (with zeros), never truncated under the other side's mapping
+            path = os.path.join(tempfile.gettempdir(), name)
+            self._file = open(path, "a+b")
+            if os.fstat(self._file.fileno()).st_size < SIZE:
+                os.ftruncate(self._file.fileno(), SIZE)
+            self.buffer = mmap.mmap(self._file.fileno(), SIZE)
+        if create:
+            self.buffer[:SIZE] = bytes(SIZE)
+
+    def header(self):
+        """(generation, car count, session, samples, commands written)"""
+        magic, version, generation, cars, session, samples, commands = (
+            _HEADER.unpack_from(self.buffer, 0)
+        )
+        if magic != MAGIC or version != VERSION:
+            return None
+        return generation, cars, session, samples, commands
+
+    def close(self):
+        self.buffer.close()
+        if self._file is not None:
+            self._file.close()
+
+
+class RingWriter:
+    """
+    RingWriter
+
+    The in-game side. write() copies cars_per_frame cars into the ring,
+    round-robin, so the per frame cost doesn't depend on the grid size, and
+    publishes the session type, which changes when e.g. qualifying turns
+    into the race. commands() returns the camera commands the engine sent
+    since the last call
+    """
+
+    def __init__(
+        self,
+        ring: TelemetryRing,
+        telemetry: TelemetrySource,
+        session: int,
+        cars_per_frame: int = 4,
+    ):
+        self.ring = ring
+        self.telemetry = telemetry
+        self.cars_per_frame = cars_per_frame
+        self.car_count = min(telemetry.cars_count(), MAX_CARS)
+        self.written = 0
+        self.commands_read = ring.header()[4] if ring.header() else 0
+        self._cursor = 0
+
+        buffer = ring.buffer
+        for id in range(self.car_count):
+            _CAR_INFO.pack_into(
+                buffer,
+                _CAR_INFO_OFFSET + id * _CAR_INFO.size,
+                _bytes(telemetry.driver_name(id), 48),
+                _bytes(telemetry.driver_nation_code(id), 8),
+                _bytes(telemetry.car_name(id), 48),
+            )
+        # A new generation tells a running engine to start over
+        _HEADER.pack_into(
+            buffer,
+            0,
+            MAGIC,
+            VERSION,
+            random.getrandbits(32),
+            self.car_count,
+            session,
+            0,
+            self.commands_read,
+        )
+
+    def write(self, session: int = None):
+        telemetry = self.telemetry
+        buffer = self.ring.buffer
+        if session is not None:
+            struct.pack_into("<i", buffer, _SESSION, session)
+        now = telemetry.clock()
+        for _ in range(min(self.cars_per_frame, self.car_count)):
+            id = self._cursor
+            self._cursor = (self._cursor + 1) % self.car_count
+            _SAMPLE.pack_into(
+                buffer,
+                _SAMPLES_OFFSET + (self.written % CAPACITY) * _SAMPLE.size,
+                now,
+                id,
+                telemetry.car_state(id, CarState.LAP_COUNT),
+                telemetry.car_state(id, CarState.SPLINE_POSITION),
+                telemetry.car_state(id, CarState.SPEED_KMH),
+                bool(telemetry.car_state(id, CarState.DRS_AVAILABLE)),
+                bool(telemetry.is_connected(id)),
+                bool(telemetry.is_in_pitline(id) or telemetry.is_in_pit(id)),
+                telemetry.car_state(id, CarState.LAST_LAP),
+                telemetry.car_state(id, CarState.BEST_LAP),
+                _bytes(telemetry.tyre_compound(id), 32),
+            )
+            self.written += 1
+        # Publish after the samples are in place
+        struct.pack_into("<Q", buffer, _SAMPLES_WRITTEN, self.written)
+
+    def commands(self) -> list:
+        """[(car id or None, camera mode or None)]"""
+        written = struct.unpack_from("<Q", self.ring.buffer, _COMMANDS_WRITTEN)[0]
+        start = max(self.commands_read, written - COMMAND_CAPACITY)
+        commands = []
+        for index in range(start, written):
+            car_id, mode = _COMMAND.unpack_from(
+                self.ring.buffer,
+                _COMMANDS_OFFSET + (index % COMMAND_CAPACITY) * _COMMAND.size,
+            )
+            commands.append((None if car_id < 0 else car_id, _text(mode) or None))
+        self.commands_read = written
+        return commands
+
+
+class RingTelemetry(TelemetrySource):
+    """
+    RingTelemetry
+
+    The engine side: a TelemetrySource over the latest sample of every car.
+    The constructor waits until the game has started a session and every
+    car has been sampled once. restarted is set once the game starts a new
+    session, session follows the session type the game publishes. lost
+    counts samples overwritten before they were read
+    """
+
+    def __init__(self, ring: TelemetryRing, poll: float = 0.1):
+        self.ring = ring
+        self.restarted = False
+        self.lost = 0
+        self.session_time = 0
+        header = ring.header()
+        while header is None or not header[1]:
+            time.sleep(poll)
+            header = ring.header()
+        self.generation, self.car_count, self.session, written, _ = header
+        self._read = max(0, written - CAPACITY)
+
+        buffer = ring.buffer
+        self._info = [
+            [
+                _text(value)
+                for value in _CAR_INFO.unpack_from(
+                    buffer, _CAR_INFO_OFFSET + id * _CAR_INFO.size
+                )
+            ]
+            for id in range(self.car_count)
+        ]
+        self._cars = [None] * self.car_count
+        while None in self._cars:
+            time.sleep(poll)
+            self.begin_tick(0)
+
+    def begin_tick(self, delta_t):
+        buffer = self.ring.buffer
+        header = self.ring.header()
+        if header is None or header[0] != self.generation:
+            self.restarted = True
+            return
+        self.session = header[2]
+        written = header[3]
+        if written - self._read > CAPACITY:
+            self.lost += written - CAPACITY - self._read
+            self._read = written - CAPACITY
+        start = self._read
+        for index in range(self._read, written):
+            sample = _SAMPLE.unpack_from(
+                buffer, _SAMPLES_OFFSET + (index % CAPACITY) * _SAMPLE.size
+            )
+            self._cars[sample[1]] = sample
+            self.session_time = sample[0]
+        # The game may have lapped the ring while the samples were copied
+        written_now = struct.unpack_from("<Q", buffer, _SAMPLES_WRITTEN)[0]
+        overwritten = min(written_now - CAPACITY, written) - start
+        if overwritten > 0:
+            self.lost += overwritten
+        self._read = written
+
+    def clock(self):
+        return self.session_time
+
+    def cars_count(self):
+        return self.car_count
+
+    def driver_name(self, car_id):
+        return self._info[car_id][0]
+
+    def driver_nation_code(self, car_id):
+        return self._info[car_id][1]
+
+    def car_name(self, car_id):
+        return self._info[car_id][2]
+
+    def tyre_compound(self, car_id):
+        return _text(self._cars[car_id][10])
+
+    def car_state(self, car_id, field):
+        return self._cars[car_id][_FIELDS[field]]
+
+    def is_connected(self, car_id):
+        return bool(self._cars[car_id][6])
+
+    def is_in_pitline(self, car_id):
+        return bool(self._cars[car_id][7])
+
+    def is_in_pit(self, car_id):
+        return False  # Folded into is_in_pitline by the writer
+
+    def console(self, message):
+        print(message)
+
+
+class RingCamera(Camera):
+    """Sends the engine's camera commands to the game"""
+
+    def __init__(self, ring: TelemetryRing):
+        self.ring = ring
+        header = ring.header()
+        self.written = header[4] if header else 0
+
+    def focus(self, car_id):
+        self._send(car_id, "")
+        return True  # The game can't answer, it falls back to its own camera
+
+    def set_mode(self, mode):
+        self._send(-1, mode)
+
+    def _send(self, car_id: int, mode: str):
+        _COMMAND.pack_into(
+            self.ring.buffer,
+            _COMMANDS_OFFSET + (self.written % COMMAND_CAPACITY) * _COMMAND.size,
+            car_id,
+            _bytes(mode, 16),
+        )
+        self.written += 1
+        struct.pack_into("<Q", self.ring.buffer, _COMMANDS_WRITTEN, self.written)
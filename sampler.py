@@ -0,0 +1,117 @@
+"""
+Adaptive sampler
+
+Reads the race a few cars per frame instead of the whole grid every five
+seconds, so events are seen within a fraction of a second and no single
+frame pays for all of the telemetry reads
+"""
+
+import time
+
+from instrumentation import metrics
+from models import RaceState
+from telemetry import TelemetrySource
+
+
+class AdaptiveSampler:
+    """
+    AdaptiveSampler
+
+    step() is called every frame. Each car's position fields are refreshed
+    at least every fast_interval seconds, spread round-robin across frames,
+    and its lap fields only when it completes a lap or leaves the pits (see
+    Driver.sample). The race wide checks of RaceState.evaluate() run every
+    race_interval seconds.
+
+    A frame stops sampling once it has spent frame_budget seconds, the cars
+    it didn't get to are carried over to the next frame. evaluate() waits
+    for a frame with budget left, but at most one extra race_interval
+    """
+
+    def __init__(
+        self,
+        state: RaceState,
+        telemetry: TelemetrySource,
+        fast_interval: float = 0.5,
+        race_interval: float = 1.0,
+        frame_budget: float = 0.001,
+        clock=time.perf_counter,
+    ):
+        self.state = state
+        self.telemetry = telemetry
+        self.fast_interval = fast_interval
+        self.race_interval = race_interval
+        self.frame_budget = frame_budget
+        self.clock = clock
+        self.frames = 0
+        self.samples = 0
+        self.evaluations = 0
+        self.over_budget = 0
+        self.total_cost = 0
+        self.max_cost = 0
+        self._drivers = []
+        self._cursor = 0
+        self._owed = 0
+        self._race_time = 0
+        self._tick_time = 0
+
+    def step(self, delta_t: float) -> list:
+        """Samples the cars that are due and returns their events"""
+        if len(self._drivers) != len(self.state.drivers):
+            # state.drivers is reordered by position, keep a stable order
+            self._drivers = sorted(self.state.drivers, key=lambda driver: driver.id)
+            self._cursor = 0
+        count = len(self._drivers)
+        if not count:
+            return []
+
+        self._owed = min(count, self._owed + count * delta_t / self.fast_interval)
+        self._race_time += delta_t
+        self._tick_time += delta_t
+        race_due = self._race_time >= self.race_interval
+        if self._owed < 1 and not race_due:
+            return []
+
+        start = self.clock()
+        self.telemetry.begin_tick(self._tick_time)
+        self._tick_time = 0
+
+        events = []
+        while self._owed >= 1:
+            driver = self._drivers[self._cursor]
+            self._cursor = (self._cursor + 1) % count
+            self._owed -= 1
+            driver.sample(full=False)
+            events.extend(driver.detect())
+            self.samples += 1
+            if self.clock() - start > self.frame_budget:
+                break
+
+        if race_due and (
+            self.clock() - start <= self.frame_budget
+            or self._race_time >= 2 * self.race_interval
+        ):
+            self._race_time = 0
+            events.extend(self.state.evaluate())
+            self.evaluations += 1
+
+        cost = self.clock() - start
+        metrics.observe("sampler_step", cost)
+        self.frames += 1
+        self.total_cost += cost
+        self.max_cost = max(self.max_cost, cost)
+        if cost > self.frame_budget:
+            self.over_budget += 1
+        return events
+
+    def stats(self) -> dict:
+        frames = max(1, self.frames)
+        return {
+            "frames": self.frames,
+            "samples": self.samples,
+            "evaluations": self.evaluations,
+            "over_budget": self.over_budget,
+            "backlog": int(self._owed),
+            "mean_cost": self.total_cost / frames,
+            "max_cost": self.max_cost,
+        }
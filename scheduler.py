@@ -0,0 +1,167 @@
+"""
+Event scheduler
+
+Pending events waiting to be commentated on, ordered by priority and age
+"""
+
+import heapq
+import itertools
+import time
+
+from models import Event, EventType
+
+# Priority points an event loses for every second it waits in the queue
+AGE_DECAY = 1.0
+# Used for event types without an entry in EventType.PRIORITY/TTL
+DEFAULT_PRIORITY = 0
+DEFAULT_TTL = 30
+
+
+class _Entry:
+    __slots__ = ("event", "score", "expires", "live")
+
+    def __init__(self, event, score, expires):
+        self.event = event
+        self.score = score
+        self.expires = expires
+        self.live = True
+
+
+class EventScheduler:
+    """
+    EventScheduler
+
+    A bounded priority queue of events. An event's score is its
+    EventType.PRIORITY minus AGE_DECAY for every second it has been queued.
+    Since every event ages at the same rate the order never changes after
+    insertion, so it can be kept in a heap: push and pop are O(log n).
+
+    Each event expires after its EventType.TTL. When the queue is full a new
+    event evicts the lowest scored one, or is dropped if it scores lower
+    itself, so a burst of minor events can't push out a DNF.
+
+    requeue() puts back the event pop() just returned, e.g. when there was
+    no worker free to commentate on it, with the score and expiry it was
+    first queued with, so it keeps aging instead of starting over.
+
+    Entries sit in three heaps (best first, worst first, soonest expiry
+    first). Removing an entry only marks it dead and it is discarded when it
+    reaches the top of the other heaps
+    """
+
+    def __init__(self, max_length: int = 32, clock=time.time):
+        self.max_length = max_length
+        self.clock = clock
+        self.dropped = 0
+        self.expired = 0
+        self._best = []
+        self._worst = []
+        self._expiry = []
+        self._length = 0
+        self._sequence = itertools.count()
+        self._popped = None  # Entry of the last pop(), for requeue()
+
+    def __len__(self):
+        return self._length
+
+    def push(self, event: Event, now: float = None) -> bool:
+        """Returns False if the event was dropped because the queue is full"""
+        if now is None:
+            now = self.clock()
+        self.expire(now)
+
+        score = EventType.PRIORITY.get(event.type, DEFAULT_PRIORITY) + AGE_DECAY * now
+        expires = now + EventType.TTL.get(event.type, DEFAULT_TTL)
+        return self._insert(_Entry(event, score, expires))
+
+    def requeue(self, event: Event, now: float = None) -> bool:
+        """
+        Puts back the event the last pop() returned, with its original score
+        and expiry. Any other event is pushed as new. Returns False if it
+        was dropped or has expired meanwhile
+        """
+        popped = self._popped
+        self._popped = None
+        if popped is None or popped.event is not event:
+            return self.push(event, now)
+        if now is None:
+            now = self.clock()
+        self.expire(now)
+        if popped.expires <= now:
+            self.expired += 1
+            return False
+        return self._insert(_Entry(event, popped.score, popped.expires))
+
+    def _insert(self, entry) -> bool:
+        if self._length >= self.max_length:
+            worst = self._top(self._worst)
+            if worst.score >= entry.score:
+                self.dropped += 1
+                return False
+            self._remove(worst)
+            self.dropped += 1
+
+        sequence = next(self._sequence)
+        heapq.heappush(self._best, (-entry.score, -sequence, entry))
+        heapq.heappush(self._worst, (entry.score, sequence, entry))
+        heapq.heappush(self._expiry, (entry.expires, sequence, entry))
+        self._length += 1
+        return True
+
+    def peek(self, now: float = None):
+        """The event pop() would return, without removing it"""
+        self.expire(now)
+        entry = self._top(self._best)
+        return entry.event if entry else None
+
+    def top(self, count: int, now: float = None) -> list:
+        """(event, expiry time) of the count best events, best first"""
+        self.expire(now)
+        entries = heapq.nsmallest(count, (item for item in self._best if item[2].live))
+        return [(item[2].event, item[2].expires) for item in entries]
+
+    def pop(self, now: float = None):
+        """Removes and returns the best scored event, or None if empty"""
+        self.expire(now)
+        entry = self._top(self._best)
+        if entry is None:
+            return None
+        self._remove(entry)
+        self._popped = entry
+        return entry.event
+
+    def expire(self, now: float = None):
+        """Drops every event that has outlived its TTL"""
+        if now is None:
+            now = self.clock()
+        while self._expiry and self._expiry[0][0] <= now:
+            entry = heapq.heappop(self._expiry)[2]
+            if entry.live:
+                self._remove(entry)
+                self.expired += 1
+
+    def events(self):
+        """Queued events, best first. O(n log n), meant for inspection"""
+        entries = sorted(item for item in self._best if item[2].live)
+        return [item[2].event for item in entries]
+
+    def _top(self, heap):
+        while heap and not heap[0][2].live:
+            heapq.heappop(heap)
+        return heap[0][2] if heap else None
+
+    def _remove(self, entry):
+        entry.live = False
+        self._length -= 1
+        # Dead entries are normally dropped as they surface, rebuild the
+        # heaps if they start to dominate
+        if len(self._best) > 4 * self.max_length + 16:
+            self._compact()
+
+    def _compact(self):
+        self._best = [item for item in self._best if item[2].live]
+        self._worst = [item for item in self._worst if item[2].live]
+        self._expiry = [item for item in self._expiry if item[2].live]
+        heapq.heapify(self._best)
+        heapq.heapify(self._worst)
+        heapq.heapify(self._expiry)
@@ -0,0 +1,88 @@
+"""
+SimInfo snapshots
+
+Consistent reads of the SimInfo physics and graphics pages. SimInfo's
+structures are from_buffer views straight over the shared memory, so a
+PageReader never copies the whole page: it reads packetId, copies only the
+fields it was asked for out of the view and reads packetId again. If the
+game published a new packet in between the read is torn and is retried.
+When packetId hasn't moved since the last snapshot nothing is read at all.
+
+A single counter can only catch a packet that is published while the fields
+are being copied. A writer that stalls half way through a packet (e.g. it is
+descheduled on a single core) is not detected
+"""
+
+import ctypes
+
+
+def _plain(value):
+    """Copies a ctypes array field out of the shared memory view"""
+    if isinstance(value, ctypes.Array):
+        return tuple(_plain(item) for item in value)
+    return value
+
+
+class Snapshot:
+    """
+    Snapshot
+
+    The requested fields of a page at a single packetId
+    """
+
+    __slots__ = ("packet_id", "values")
+
+    def __init__(self, packet_id: int, values: dict):
+        self.packet_id = packet_id
+        self.values = values
+
+    def __getattr__(self, name):
+        try:
+            return self.values[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __str__(self):
+        return "{} - {}".format(self.packet_id, self.values)
+
+
+class PageReader:
+    """
+    PageReader
+
+    Takes torn-read safe snapshots of a few fields of a SimInfo page, e.g.
+
+        physics = PageReader(sim_info.physics, ("accG", "carDamage"))
+        snapshot = physics.read()
+        if snapshot:
+            ...
+
+    read() returns None when there is no new packet (or every retry was
+    torn), the last good snapshot stays in self.latest
+    """
+
+    def __init__(self, page, fields, retries: int = 3):
+        self.page = page
+        self.fields = tuple(fields)
+        self.retries = retries
+        self.latest = None
+        self.reads = 0
+        self.unchanged = 0
+        self.torn = 0
+
+    def read(self):
+        page = self.page
+        fields = self.fields
+        for _ in range(self.retries + 1):
+            packet_id = page.packetId
+            if self.latest is not None and packet_id == self.latest.packet_id:
+                self.unchanged += 1
+                return None
+
+            values = [_plain(getattr(page, field)) for field in fields]
+            if page.packetId == packet_id:
+                self.reads += 1
+                self.latest = Snapshot(packet_id, dict(zip(fields, values)))
+                return self.latest
+            self.torn += 1
+        return None
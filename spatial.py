@@ -0,0 +1,135 @@
+"""
+Spline index
+
+Where the cars are on track, for "which cars are near this one" queries.
+Cars are kept sorted by spline position (0 to 1 along the lap), so lapped
+cars are found next to the cars they are physically close to, and every
+query wraps around the start/finish line
+"""
+
+import bisect
+
+
+def spline_offset(from_position: float, to_position: float) -> float:
+    """How far to_position is ahead of from_position, -0.5 to 0.5 of a lap"""
+    return (to_position - from_position + 0.5) % 1.0 - 0.5
+
+
+class SplineIndex:
+    """
+    SplineIndex
+
+    keys are kept sorted by spline position. update() repairs the order with
+    an insertion sort, cheap as it barely changes between updates. Queries
+    bisect the sorted positions, so within() is O(log n + k) and nearest()
+    O(log n + k) for k results. Distances are fractions of a lap
+    """
+
+    def __init__(self):
+        self.keys = []
+        self.splines = []  # Sorted, splines[i] is the position of keys[i]
+        self._spline = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key, spline: float):
+        index = bisect.bisect(self.splines, spline)
+        self.keys.insert(index, key)
+        self.splines.insert(index, spline)
+        self._spline[key] = spline
+
+    def remove(self, key):
+        index = self.keys.index(key)
+        del self.keys[index]
+        del self.splines[index]
+        del self._spline[key]
+
+    def update(self, splines):
+        """splines maps keys to their new spline position"""
+        position = self._spline
+        position.update(splines)
+        keys = self.keys
+        for i in range(1, len(keys)):
+            key = keys[i]
+            spline = position[key]
+            j = i
+            while j > 0 and position[keys[j - 1]] > spline:
+                keys[j] = keys[j - 1]
+                j -= 1
+            keys[j] = key
+        self.splines = [position[key] for key in keys]
+
+    def assign(self, keys, splines):
+        """
+        Replaces every position at once with keys already sorted by spline,
+        for callers that sort them themselves (VectorRaceState, on arrays)
+        """
+        self.keys = list(keys)
+        self.splines = list(splines)
+        self._spline = dict(zip(self.keys, self.splines))
+
+    def spline(self, key) -> float:
+        return self._spline[key]
+
+    def within(self, key, distance: float) -> list:
+        """(key, offset) of the other cars at most distance away, > 0 ahead"""
+        return self.around(self._spline[key], distance, key)
+
+    def around(self, spline: float, distance: float, exclude=None) -> list:
+        """(key, offset) of the cars at most distance from spline"""
+        splines = self.splines
+        count = len(splines)
+        if distance >= 0.5:
+            indices = range(count)
+        else:
+            low = bisect.bisect_left(splines, spline - distance)
+            high = bisect.bisect_right(splines, spline + distance)
+            indices = list(range(low, high))
+            # The part of the window on the other side of the line
+            if spline - distance < 0:
+                wrapped = bisect.bisect_left(splines, spline - distance + 1)
+                indices.extend(range(max(wrapped, high), count))
+            if spline + distance > 1:
+                wrapped = bisect.bisect_right(splines, spline + distance - 1)
+                indices.extend(range(0, min(wrapped, low)))
+        return [
+            (self.keys[i], spline_offset(spline, splines[i]))
+            for i in indices
+            if self.keys[i] != exclude
+        ]
+
+    def nearest(self, key, k: int = 1) -> list:
+        """(key, offset) of the k cars closest to key, closest first"""
+        keys = self.keys
+        splines = self.splines
+        count = len(keys)
+        spline = self._spline[key]
+        index = bisect.bisect_left(splines, spline)
+        while keys[index] != key:
+            index += 1
+        # Walk out both ways around the lap taking the closer car each step
+        found = []
+        ahead = 1
+        behind = 1
+        while len(found) < min(k, count - 1):
+            forward = (splines[(index + ahead) % count] - spline) % 1.0
+            backward = (spline - splines[(index - behind) % count]) % 1.0
+            if forward <= backward:
+                found.append((keys[(index + ahead) % count], forward))
+                ahead += 1
+            else:
+                found.append((keys[(index - behind) % count], -backward))
+                behind += 1
+        return found
+
+    def closest_pair(self):
+        """(key behind, key ahead, distance) of the two closest cars on track"""
+        keys = self.keys
+        splines = self.splines
+        best = None
+        for i in range(len(keys)):
+            gap = (splines[(i + 1) % len(keys)] - splines[i]) % 1.0
+            if best is None or gap < best[2]:
+                best = (keys[i], keys[(i + 1) % len(keys)], gap)
+        return best
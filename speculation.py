@@ -0,0 +1,100 @@
+"""
+Speculative commentary
+
+Generates the lines for the best pending events while the current line is
+still playing, so the next one can start the moment the sidecar is free.
+When several events are waiting their lines are generated as one batch, so
+the LLM's latency is paid once for all of them
+"""
+
+from llm.services import CommentaryRequest, SidecarChannel
+
+
+def batch_size(candidates, now: float, line_seconds: float, limit: int) -> int:
+    """
+    How many of candidates, (event, expiry time) best first, are worth
+    generating lines for: at most limit, and only as many as could still be
+    played before they expire, one line every line_seconds after the
+    current one
+    """
+    size = 0
+    for position, (event, expires) in enumerate(candidates[:limit]):
+        if expires - now < (position + 1) * line_seconds:
+            break
+        size += 1
+    return max(size, min(1, len(candidates)))
+
+
+class Speculator:
+    """
+    Speculator
+
+    Holds pre-generated lines for the best pending events. update() is given
+    those events every tick: held lines for events that dropped out (they
+    expired or were outranked) are cancelled and lines are started for the
+    new ones, several at a time as a batch. take() hands a held request over
+    once its event is popped.
+
+    Not thread-safe, callers share a lock with the event queue
+    """
+
+    def __init__(self, channel: SidecarChannel):
+        self.channel = channel
+        self.requests = {}  # Event to its held request, best first
+        self.started = 0
+        self.batches = 0
+        self.used = 0
+        self.cancelled = 0
+
+    def update(self, events, build_prompt, build_key=None):
+        """
+        events are the best pending events, best first, and build_prompt
+        turns an event into a prompt. build_key, if given, gives an event's
+        response cache entry (see prompts.commentary_key)
+        """
+        for event in list(self.requests):
+            if event not in events:
+                self._cancel(event)
+        new = [event for event in events if event not in self.requests]
+        if not new or not self.channel.connect():
+            return
+
+        prompts = [build_prompt(event) for event in new]
+        fields = [{} for event in new]
+        if build_key is not None:
+            for event, item in zip(new, fields):
+                cache = build_key(event)
+                if cache is not None:
+                    item["cache"] = cache
+        if len(new) == 1:
+            requests = [self.channel.submit(prompts[0], hold=True, **fields[0])]
+        else:
+            requests = self.channel.submit_batch(prompts, fields)
+            self.batches += 1
+        for event, request in zip(new, requests):
+            self.requests[event] = request
+        self.started += len(new)
+
+    def ready(self, event) -> bool:
+        """True if the line for event has been generated and can play now"""
+        request = self.requests.get(event)
+        return request is not None and request.ready
+
+    def take(self, event) -> CommentaryRequest:
+        """
+        Returns the held request for event, or None if there isn't a usable
+        one. Lines held for other events are kept
+        """
+        request = self.requests.pop(event, None)
+        if request is None or request.status != "pending":
+            return None
+        self.used += 1
+        return request
+
+    def cancel(self):
+        for event in list(self.requests):
+            self._cancel(event)
+
+    def _cancel(self, event):
+        self.requests.pop(event).cancel()
+        self.cancelled += 1
@@ -0,0 +1,431 @@
+"""
+Telemetry
+
+Every read the race pipeline makes from Assetto Corsa goes through a
+TelemetrySource so Driver and RaceState can run outside of a live session.
+LiveTelemetry talks to the ac module, TelemetryRecorder captures every read
+to a file tick by tick and ReplayTelemetry feeds those reads back headless.
+"""
+
+import gzip
+import json
+import time
+
+
+class CarState:
+    """
+    Car State
+
+    Names of the acsys.CS fields that are read through
+    TelemetrySource.car_state
+    """
+
+    LAST_LAP = "LastLap"
+    BEST_LAP = "BestLap"
+    LAP_COUNT = "LapCount"
+    SPEED_KMH = "SpeedKMH"
+    SPLINE_POSITION = "NormalizedSplinePosition"
+    DRS_AVAILABLE = "DrsAvailable"
+
+
+class Reading:
+    """
+    Reading
+
+    Names of the other per-car reads, used next to the CarState names when
+    detectors declare the fields they need
+    """
+
+    CONNECTED = "Connected"
+    IN_PIT = "InPit"  # isCarInPitline or isCarInPit
+    TYRE_COMPOUND = "TyreCompound"
+
+
+class TelemetrySource:
+    """
+    TelemetrySource
+
+    The subset of the ac module used by the race pipeline. A tick is
+    everything read between two calls to begin_tick
+    """
+
+    def begin_tick(self, delta_t: float):
+        pass
+
+    def close(self):
+        pass
+
+    def clock(self) -> float:
+        """Session time in seconds"""
+        raise NotImplementedError
+
+    def cars_count(self) -> int:
+        raise NotImplementedError
+
+    def driver_name(self, car_id: int) -> str:
+        raise NotImplementedError
+
+    def driver_nation_code(self, car_id: int) -> str:
+        raise NotImplementedError
+
+    def car_name(self, car_id: int) -> str:
+        raise NotImplementedError
+
+    def tyre_compound(self, car_id: int) -> str:
+        raise NotImplementedError
+
+    def car_state(self, car_id: int, field: str):
+        raise NotImplementedError
+
+    def car_states(self, car_ids, field: str) -> list:
+        """One car_state field for several cars at once"""
+        return [self.car_state(car_id, field) for car_id in car_ids]
+
+    def is_connected(self, car_id: int) -> bool:
+        raise NotImplementedError
+
+    def is_in_pitline(self, car_id: int) -> bool:
+        raise NotImplementedError
+
+    def is_in_pit(self, car_id: int) -> bool:
+        raise NotImplementedError
+
+    def console(self, message: str):
+        pass
+
+
+class LiveTelemetry(TelemetrySource):
+    """
+    LiveTelemetry
+
+    Reads straight from a running Assetto Corsa session
+    """
+
+    def __init__(self):
+        import ac  # type: ignore
+        import acsys  # type: ignore
+
+        self._ac = ac
+        self._fields = {}
+        for name in vars(CarState).values():
+            if isinstance(name, str) and hasattr(acsys.CS, name):
+                self._fields[name] = getattr(acsys.CS, name)
+
+    def clock(self):
+        return time.time()
+
+    def cars_count(self):
+        return self._ac.getCarsCount()
+
+    def driver_name(self, car_id):
+        return self._ac.getDriverName(car_id)
+
+    def driver_nation_code(self, car_id):
+        return self._ac.getDriverNationCode(car_id)
+
+    def car_name(self, car_id):
+        return self._ac.getCarName(car_id)
+
+    def tyre_compound(self, car_id):
+        return self._ac.getCarTyreCompound(car_id)
+
+    def car_state(self, car_id, field):
+        return self._ac.getCarState(car_id, self._fields[field])
+
+    def car_states(self, car_ids, field):
+        get_car_state = self._ac.getCarState
+        field = self._fields[field]
+        return [get_car_state(car_id, field) for car_id in car_ids]
+
+    def is_connected(self, car_id):
+        return self._ac.isConnected(car_id)
+
+    def is_in_pitline(self, car_id):
+        return self._ac.isCarInPitline(car_id)
+
+    def is_in_pit(self, car_id):
+        return self._ac.isCarInPit(car_id)
+
+    def console(self, message):
+        self._ac.console(message)
+
+
+class TelemetryRecorder(TelemetrySource):
+    """
+    TelemetryRecorder
+
+    Passes every read through to another source and writes the values to a
+    gzipped JSON lines file, one line per tick. Only values that changed
+    since the previous tick are written. The first line holds the reads made
+    before the first tick (driver list, names, etc.)
+    """
+
+    def __init__(self, source: TelemetrySource, path: str):
+        self.source = source
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._delta_t = 0
+        self._frame = {}
+        self._written = {}
+
+    def _record(self, key, value):
+        self._frame[key] = value
+        return value
+
+    def _flush(self):
+        changed = {}
+        for key, value in self._frame.items():
+            if key not in self._written or self._written[key] != value:
+                changed[key] = value
+                self._written[key] = value
+        self._file.write(
+            json.dumps({"dt": self._delta_t, "v": changed}, separators=(",", ":"))
+        )
+        self._file.write("\n")
+        self._frame = {}
+
+    def begin_tick(self, delta_t):
+        self._flush()
+        self._delta_t = delta_t
+        self.source.begin_tick(delta_t)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._flush()
+        self._file.close()
+        self.source.close()
+
+    def clock(self):
+        return self._record("clock", self.source.clock())
+
+    def cars_count(self):
+        return self._record("cars_count", self.source.cars_count())
+
+    def driver_name(self, car_id):
+        return self._record(
+            "driver_name:{}".format(car_id), self.source.driver_name(car_id)
+        )
+
+    def driver_nation_code(self, car_id):
+        return self._record(
+            "driver_nation_code:{}".format(car_id),
+            self.source.driver_nation_code(car_id),
+        )
+
+    def car_name(self, car_id):
+        return self._record("car_name:{}".format(car_id), self.source.car_name(car_id))
+
+    def tyre_compound(self, car_id):
+        return self._record(
+            "tyre_compound:{}".format(car_id), self.source.tyre_compound(car_id)
+        )
+
+    def car_state(self, car_id, field):
+        return self._record(
+            "car_state:{}:{}".format(car_id, field),
+            self.source.car_state(car_id, field),
+        )
+
+    def is_connected(self, car_id):
+        return self._record(
+            "is_connected:{}".format(car_id), bool(self.source.is_connected(car_id))
+        )
+
+    def is_in_pitline(self, car_id):
+        return self._record(
+            "is_in_pitline:{}".format(car_id),
+            bool(self.source.is_in_pitline(car_id)),
+        )
+
+    def is_in_pit(self, car_id):
+        return self._record(
+            "is_in_pit:{}".format(car_id), bool(self.source.is_in_pit(car_id))
+        )
+
+    def console(self, message):
+        self.source.console(message)
+
+
+class ReplayTelemetry(TelemetrySource):
+    """
+    ReplayTelemetry
+
+    Serves the reads captured by TelemetryRecorder. The setup frame is
+    loaded on construction and next_tick() advances one tick at a time.
+    A value that was never recorded (e.g. a field a newer detector reads)
+    comes back as 0, "" or False
+    """
+
+    def __init__(self, path: str, verbose: bool = False):
+        self.verbose = verbose
+        self.session_time = 0
+        self._file = gzip.open(path, "rt", encoding="utf-8")
+        self._values = {}
+        self._load_frame()
+
+    def _load_frame(self):
+        line = self._file.readline()
+        if not line:
+            return None
+        frame = json.loads(line)
+        self._values.update(frame["v"])
+        return frame["dt"]
+
+    def next_tick(self):
+        """
+        Applies the next recorded tick. Returns its delta time in seconds
+        or None once the recording is exhausted
+        """
+        delta_t = self._load_frame()
+        if delta_t is not None:
+            self.session_time += delta_t
+        return delta_t
+
+    def close(self):
+        self._file.close()
+
+    def clock(self):
+        return self._values.get("clock", self.session_time)
+
+    def cars_count(self):
+        return self._values.get("cars_count", 0)
+
+    def driver_name(self, car_id):
+        return self._values.get("driver_name:{}".format(car_id), "")
+
+    def driver_nation_code(self, car_id):
+        return self._values.get("driver_nation_code:{}".format(car_id), "")
+
+    def car_name(self, car_id):
+        return self._values.get("car_name:{}".format(car_id), "")
+
+    def tyre_compound(self, car_id):
+        return self._values.get("tyre_compound:{}".format(car_id), "")
+
+    def car_state(self, car_id, field):
+        return self._values.get("car_state:{}:{}".format(car_id, field), 0)
+
+    def is_connected(self, car_id):
+        return self._values.get("is_connected:{}".format(car_id), False)
+
+    def is_in_pitline(self, car_id):
+        return self._values.get("is_in_pitline:{}".format(car_id), False)
+
+    def is_in_pit(self, car_id):
+        return self._values.get("is_in_pit:{}".format(car_id), False)
+
+    def console(self, message):
+        if self.verbose:
+            print(message)
+
+
+class SyntheticTelemetry(TelemetrySource):
+    """
+    SyntheticTelemetry
+
+    A seeded stand-in race for benchmarks and load tests. Cars lap at a
+    slightly different pace, pit roughly every 25 laps and get DRS when
+    within a second of the car ahead. begin_tick advances the race
+    """
+
+    COMPOUNDS = ("S", "M", "H")
+
+    def __init__(self, car_count: int, seed: int = 0):
+        import random
+
+        self._random = random.Random(seed)
+        self.session_time = 0
+        self.car_count = car_count
+        self._pace = [self._random.uniform(88, 92) for _ in range(car_count)]
+        self._progress = [-0.002 * id for id in range(car_count)]
+        self._lap_start = [0] * car_count
+        self._last_lap = [0] * car_count
+        self._best_lap = [0] * car_count
+        self._speed = [0.0] * car_count
+        self._drs = [0] * car_count
+        self._pit_until = [0] * car_count
+        self._compound = [self._random.choice(self.COMPOUNDS) for _ in range(car_count)]
+
+    def begin_tick(self, delta_t):
+        self.session_time += delta_t
+        for id in range(self.car_count):
+            in_pit = self.session_time < self._pit_until[id]
+            pace = self._pace[id] * self._random.uniform(0.98, 1.02)
+            if in_pit:
+                pace *= 4
+            laps = delta_t / pace
+            lap_count = int(self._progress[id])
+            self._progress[id] += laps
+            self._speed[id] = laps * 5000 * 3600 / delta_t / 1000
+            if int(self._progress[id]) > lap_count >= 0:
+                lap_time = int((self.session_time - self._lap_start[id]) * 1000)
+                self._lap_start[id] = self.session_time
+                self._last_lap[id] = lap_time
+                if not self._best_lap[id] or lap_time < self._best_lap[id]:
+                    self._best_lap[id] = lap_time
+                if self._random.random() < 1 / 25:
+                    self._pit_until[id] = self.session_time + self._random.uniform(
+                        20, 70
+                    )
+                    self._compound[id] = self._random.choice(self.COMPOUNDS)
+
+        order = sorted(range(self.car_count), key=lambda id: -self._progress[id])
+        self._drs[order[0]] = 0
+        for ahead, behind in zip(order, order[1:]):
+            gap = (self._progress[ahead] - self._progress[behind]) * self._pace[behind]
+            self._drs[behind] = int(gap < 1 and self._progress[behind] > 2)
+
+    def clock(self):
+        return self.session_time
+
+    def cars_count(self):
+        return self.car_count
+
+    def driver_name(self, car_id):
+        return "Driver {}".format(car_id)
+
+    def driver_nation_code(self, car_id):
+        return "ITA"
+
+    def car_name(self, car_id):
+        return "ks_car_{}".format(car_id % 5)
+
+    def tyre_compound(self, car_id):
+        return self._compound[car_id]
+
+    def car_state(self, car_id, field):
+        if field == CarState.LAST_LAP:
+            return self._last_lap[car_id]
+        if field == CarState.BEST_LAP:
+            return self._best_lap[car_id]
+        if field == CarState.LAP_COUNT:
+            return max(0, int(self._progress[car_id]))
+        if field == CarState.SPEED_KMH:
+            return self._speed[car_id]
+        if field == CarState.SPLINE_POSITION:
+            return self._progress[car_id] % 1
+        if field == CarState.DRS_AVAILABLE:
+            return self._drs[car_id]
+        return 0
+
+    def car_states(self, car_ids, field):
+        if field == CarState.LAST_LAP:
+            values = self._last_lap
+        elif field == CarState.BEST_LAP:
+            values = self._best_lap
+        elif field == CarState.SPEED_KMH:
+            values = self._speed
+        elif field == CarState.DRS_AVAILABLE:
+            values = self._drs
+        else:
+            return [self.car_state(car_id, field) for car_id in car_ids]
+        return [values[car_id] for car_id in car_ids]
+
+    def is_connected(self, car_id):
+        return True
+
+    def is_in_pitline(self, car_id):
+        return self.session_time < self._pit_until[car_id]
+
+    def is_in_pit(self, car_id):
+        return False
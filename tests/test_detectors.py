@@ -0,0 +1,44 @@
+import pytest
+
+from models import Driver, EventType, RaceState
+from telemetry import SyntheticTelemetry
+from third_party.sim_info import AC_PRACTICE, AC_RACE
+from vector_state import VectorRaceState
+
+RACE_ONLY = (
+    EventType.DNF,
+    EventType.ENTERED_PIT,
+    EventType.LONG_PIT,
+    EventType.QUICK_PIT,
+    EventType.LONG_STINT,
+)
+
+
+def event_types(state_class, session, disabled=()):
+    telemetry = SyntheticTelemetry(20, seed=3)
+    state = state_class(telemetry)
+    state.detectors.configure(session, disabled)
+    for id in range(20):
+        state.add_driver(Driver(id, telemetry))
+    types = set()
+    for _ in range(1500):
+        telemetry.begin_tick(1.0)
+        types.update(event.type for event in state.update())
+    return types
+
+
+@pytest.mark.parametrize("state_class", [RaceState, VectorRaceState])
+def test_race_only_detectors_are_off_in_practice(state_class):
+    types = event_types(state_class, AC_PRACTICE)
+
+    assert EventType.BEST_LAP in types
+    assert not types.intersection(RACE_ONLY)
+
+
+@pytest.mark.parametrize("state_class", [RaceState, VectorRaceState])
+def test_disabled_detectors_raise_no_events(state_class):
+    types = event_types(state_class, AC_RACE, {"best_lap", "long_stint"})
+
+    assert EventType.ENTERED_PIT in types
+    assert EventType.BEST_LAP not in types
+    assert EventType.LONG_STINT not in types
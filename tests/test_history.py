@@ -0,0 +1,15 @@
+from history import LapHistory
+
+
+def test_laps_past_the_initial_capacity_are_kept():
+    history = LapHistory("Soft", capacity=4)
+    for lap in range(10):
+        history.add_lap(lap, 90000 + lap, pit=lap == 6)
+
+    assert history.capacity >= 10
+    assert history.lap_time(0) == 90000
+    assert history.lap_time(9) == 90009
+    assert history.lap(6) == (90006, 0, True)
+    assert history.lap_time(10) is None
+    assert history.lap_time(-1) is None
+    assert history.best_lap == 90000
@@ -0,0 +1,28 @@
+from models import Event, EventType
+from prompts import commentary_key
+
+
+def overtake(driver_a, driver_b, position, time):
+    params = {
+        "driver_a": driver_a,
+        "driver_b": driver_b,
+        "position": position,
+        "time": time,
+    }
+    return Event(EventType.OVERTAKE, 0, params)
+
+
+def test_overtakes_at_different_times_share_a_key():
+    first = commentary_key(overtake("Alice", "Bob", 3, 125.37))
+    second = commentary_key(overtake("Alice", "Bob", 3, 1893.02))
+
+    assert first == second
+    assert "time" not in first["key"]
+    assert first["values"] == {"driver_a": "Alice", "driver_b": "Bob"}
+
+
+def test_overtakes_for_different_positions_have_different_keys():
+    first = commentary_key(overtake("Alice", "Bob", 3, 125.37))
+    second = commentary_key(overtake("Alice", "Bob", 2, 125.37))
+
+    assert first["key"] != second["key"]
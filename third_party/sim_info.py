@@ -207,18 +207,39 @@ class SPageFileStatic(ctypes.Structure):
     ]
 
 class SimInfo:
-    def __init__(self):
-        self._acpmf_physics = mmap.mmap(0, ctypes.sizeof(SPageFilePhysics), "acpmf_physics")
-        self._acpmf_graphics = mmap.mmap(0, ctypes.sizeof(SPageFileGraphic), "acpmf_graphics")
-        self._acpmf_static = mmap.mmap(0, ctypes.sizeof(SPageFileStatic), "acpmf_static")
+    def __init__(self, path=None):
+        """
+        Maps the shared memory pages Assetto Corsa creates on Windows. When
+        path is a directory the pages are mapped from acpmf_* files in it
+        instead, so they can be read (and written) without the game
+        """
+        self._files = []
+        self._acpmf_physics = self._map("acpmf_physics", SPageFilePhysics, path)
+        self._acpmf_graphics = self._map("acpmf_graphics", SPageFileGraphic, path)
+        self._acpmf_static = self._map("acpmf_static", SPageFileStatic, path)
         self.physics = SPageFilePhysics.from_buffer(self._acpmf_physics)
         self.graphics = SPageFileGraphic.from_buffer(self._acpmf_graphics)
         self.static = SPageFileStatic.from_buffer(self._acpmf_static)
 
+    def _map(self, tagname, structure, path):
+        size = ctypes.sizeof(structure)
+        if path is None:
+            return mmap.mmap(0, size, tagname)
+        page_file = open(os.path.join(path, tagname), "a+b")
+        if os.path.getsize(page_file.name) < size:
+            page_file.truncate(size)
+        self._files.append(page_file)
+        return mmap.mmap(page_file.fileno(), size)
+
     def close(self):
+        # The ctypes views have to go before the maps can be closed
+        self.physics = self.graphics = self.static = None
         self._acpmf_physics.close()
         self._acpmf_graphics.close()
         self._acpmf_static.close()
+        for page_file in self._files:
+            page_file.close()
+        self._files = []
 
     def __del__(self):
         self.close()
@@ -0,0 +1,77 @@
+"""
+Timing index
+
+Splits the lap into timing lines and records when each car crosses each
+of them, the way live timing measures gaps
+"""
+
+
+class TimingIndex:
+    """
+    TimingIndex
+
+    Line k is at distance k / lines_per_lap, where distance is lap count
+    plus spline position, so line numbers keep counting up across laps.
+    update() records the time every line was crossed since the car's last
+    update, interpolated between the two samples. Each car keeps its last
+    laps * lines_per_lap crossings in a ring buffer.
+
+    gap() is the difference between the two cars' times at the last line
+    the car behind crossed, an O(1) lookup. It doesn't depend on lap times,
+    so it stays right on out-laps and behind the safety car
+    """
+
+    def __init__(self, lines_per_lap: int = 100, laps: int = 2):
+        self.lines_per_lap = lines_per_lap
+        self.size = lines_per_lap * laps
+        self._lines = {}  # Ring of line numbers per car, to spot stale slots
+        self._times = {}
+        self._last = {}  # (line, distance, time) of the car's last update
+
+    def update(self, key, distance: float, time: float):
+        line = int(distance * self.lines_per_lap)
+        last = self._last.get(key)
+        self._last[key] = (line, distance, time)
+        if last is None:
+            self._lines[key] = [None] * self.size
+            self._times[key] = [0.0] * self.size
+            return
+        last_line, last_distance, last_time = last
+        if line <= last_line or distance <= last_distance:
+            # No line crossed, or the car went backwards (e.g. reset to pits)
+            return
+
+        lines = self._lines[key]
+        times = self._times[key]
+        rate = (time - last_time) / (distance - last_distance)
+        for crossed in range(max(last_line + 1, line - self.size + 1), line + 1):
+            slot = crossed % self.size
+            lines[slot] = crossed
+            times[slot] = (
+                last_time + (crossed / self.lines_per_lap - last_distance) * rate
+            )
+
+    def crossing_time(self, key, line: int) -> float:
+        """When the car crossed line, None if it isn't in its buffer"""
+        lines = self._lines.get(key)
+        if lines is None:
+            return None
+        slot = line % self.size
+        if lines[slot] != line:
+            return None
+        return self._times[key][slot]
+
+    def gap(self, ahead, behind) -> float:
+        """
+        Seconds between ahead and behind at the last line behind crossed,
+        None if either car has no time for it (e.g. more than laps behind).
+        0 if behind was still ahead at that line and passed since
+        """
+        last = self._last.get(behind)
+        if last is None:
+            return None
+        behind_time = self.crossing_time(behind, last[0])
+        ahead_time = self.crossing_time(ahead, last[0])
+        if behind_time is None or ahead_time is None:
+            return None
+        return max(0.0, behind_time - ahead_time)
@@ -0,0 +1,665 @@
+"""
+Vectorized race state
+
+A struct-of-arrays RaceState for large grids. Every per-car value lives in
+a contiguous NumPy array indexed in the order drivers were added, and the
+position order is an index array. The detectors of Driver.update and
+RaceState.update run as batched array operations, as do the timing lines,
+position order, gaps and battles, and only the events that fire are turned
+into Event objects. The per-tick NumPy overhead makes it slower than
+RaceState on small grids, it pays off from around 60 cars
+"""
+
+import sys
+
+import numpy as np
+
+from battles import BattleTracker
+from cooldowns import Cooldowns, pair
+from detectors import (
+    BestLapDetector,
+    DetectorSet,
+    DNFDetector,
+    LapHistoryRecorder,
+    LongStintDetector,
+    PitDetector,
+)
+from instrumentation import metrics
+from log import log
+from models import Driver, Event, EventType
+from positions import Crossing, PositionTracker
+from spatial import SplineIndex
+from telemetry import CarState, TelemetrySource
+
+# The detector whose cooldown (laps and seconds) each per-driver event has
+_DRIVER_EVENTS = {
+    EventType.DNF: DNFDetector,
+    EventType.ENTERED_PIT: PitDetector,
+    EventType.LONG_PIT: PitDetector,
+    EventType.QUICK_PIT: PitDetector,
+    EventType.BEST_LAP: BestLapDetector,
+    EventType.LONG_STINT: LongStintDetector,
+}
+# Row of each per-driver event in the cooldown arrays
+_EVENT_ROWS = {event_type: row for row, event_type in enumerate(_DRIVER_EVENTS)}
+_NEVER = np.iinfo(np.int64).max
+
+# (attribute, dtype, initial value) of every per-car array
+_ARRAYS = (
+    ("ids", np.int32, 0),
+    ("lap_count", np.int32, 0),
+    ("lap_distance", np.float64, 0),
+    ("speed_kmh", np.float64, 0),
+    ("last_lap", np.int64, 0),
+    ("best_lap", np.int64, 0),
+    ("drs_available", np.bool_, False),
+    ("in_pit", np.bool_, False),
+    ("lap_in_pit", np.bool_, False),
+    ("connected", np.bool_, False),
+    ("latest_pit_start", np.float64, np.nan),
+    ("pit_stops", np.int32, 0),
+    ("tire_age", np.int32, 0),
+    ("last_compound_change_lap", np.int32, 0),
+)
+
+# (CarState field, array attribute) read on every update
+_CAR_STATE_FIELDS = (
+    (CarState.LAST_LAP, "last_lap"),
+    (CarState.BEST_LAP, "best_lap"),
+    (CarState.LAP_COUNT, "lap_count"),
+    (CarState.SPEED_KMH, "speed_kmh"),
+    (CarState.SPLINE_POSITION, "lap_distance"),
+    (CarState.DRS_AVAILABLE, "drs_available"),
+)
+
+
+class TimingArrays:
+    """
+    TimingArrays
+
+    TimingIndex for cars keyed by array index, with every car's ring of
+    timing lines in one 2D array. update() records the lines all the cars
+    crossed since their last update in one pass and gaps() looks up the gap
+    of many pairs at once, both without a Python loop over the cars. The
+    times are those TimingIndex records
+    """
+
+    def __init__(self, lines_per_lap: int = 100, laps: int = 2):
+        self.lines_per_lap = lines_per_lap
+        self.size = lines_per_lap * laps
+        self._lines = np.full((0, self.size), -1, dtype=np.int64)
+        self._times = np.zeros((0, self.size))
+        # Line, distance and time of each car's last update
+        self._known = np.zeros(0, dtype=np.bool_)
+        self._line = np.zeros(0, dtype=np.int64)
+        self._distance = np.zeros(0)
+        self._time = np.zeros(0)
+
+    def add(self):
+        """Makes room for the next array index"""
+        self._lines = np.vstack((self._lines, np.full((1, self.size), -1)))
+        self._times = np.vstack((self._times, np.zeros((1, self.size))))
+        self._known = np.append(self._known, False)
+        self._line = np.append(self._line, 0)
+        self._distance = np.append(self._distance, 0.0)
+        self._time = np.append(self._time, 0.0)
+
+    def update(self, distances, time: float):
+        """distances of every car, by array index, at time"""
+        lines = (distances * self.lines_per_lap).astype(np.int64)
+        # Cars that crossed a line without going backwards since last time
+        moved = (
+            self._known & (lines > self._line) & (distances > self._distance)
+        ).nonzero()[0]
+        if len(moved):
+            line = lines[moved]
+            last_line = self._line[moved]
+            last_distance = self._distance[moved]
+            last_time = self._time[moved]
+            first = np.maximum(last_line + 1, line - self.size + 1)
+            counts = line - first + 1
+            rate = (time - last_time) / (distances[moved] - last_distance)
+            # One entry per line crossed, the lines of each car in a run
+            cars = np.repeat(np.arange(len(moved)), counts)
+            starts = np.cumsum(counts) - counts
+            crossed = first[cars] + np.arange(len(cars)) - starts[cars]
+            slots = crossed % self.size
+            rows = moved[cars]
+            self._lines[rows, slots] = crossed
+            self._times[rows, slots] = (
+                last_time[cars]
+                + (crossed / self.lines_per_lap - last_distance[cars]) * rate[cars]
+            )
+        self._known[:] = True
+        self._line = lines
+        self._distance = distances.astype(np.float64)
+        self._time[:] = time
+
+    def gaps(self, ahead, behind):
+        """
+        Seconds between each pair of cars at the last line the car behind
+        crossed, NaN where TimingIndex.gap() is None
+        """
+        line = self._line[behind]
+        slots = line % self.size
+        behind_ok = self._known[behind] & (self._lines[behind, slots] == line)
+        ahead_ok = self._lines[ahead, slots] == line
+        gaps = np.maximum(0.0, self._times[behind, slots] - self._times[ahead, slots])
+        return np.where(behind_ok & ahead_ok, gaps, np.nan)
+
+
+class PositionArrays(PositionTracker):
+    """
+    PositionArrays
+
+    PositionTracker for cars keyed by array index that sorts on arrays.
+    order is an index array, re-sorted with a stable sort of the distances
+    taken in the previous order, which keeps cars level on distance in
+    place like the insertion sort does. Every pair the sort swapped is a
+    pass. They are found in one pass over the offsets by which a car can
+    have moved, and reported with the positions and times and in the order
+    PositionTracker reports them
+    """
+
+    def __init__(self, repass_time: float = 10):
+        super().__init__(repass_time)
+        self.order = np.zeros(0, dtype=np.intp)
+        self._previous = np.zeros(0)
+
+    def add(self, key, distance: float):
+        position = int(np.count_nonzero(self._previous[self.order] >= distance))
+        self.order = np.insert(self.order, position, key)
+        self._previous = np.append(self._previous, distance)
+
+    def update(self, distances, now: float) -> list:
+        """distances of every car, by array index. Returns the Crossings"""
+        old = self.order
+        count = len(old)
+        by_position = np.argsort(-distances[old], kind="stable")
+        # New position of the car at each old position
+        moved_to = np.empty(count, dtype=np.intp)
+        moved_to[by_position] = np.arange(count)
+        reach = int(np.abs(moved_to - np.arange(count)).max()) if count else 0
+        crossings = []
+        if reach:
+            crossings = self._crossings(old, moved_to, reach, distances, now)
+        self.mark_repasses(crossings)
+        self.order = old[by_position]
+        self._previous = distances.astype(np.float64)
+        self._time = now
+        return crossings
+
+    def _crossings(self, old, moved_to, reach, distances, now) -> list:
+        # A pair swapped if the car behind (old position i) ends up ahead of
+        # the car ahead (k < i). Neither moved more than reach places, so
+        # they were less than 2 * reach apart
+        passers = []
+        passed = []
+        for offset in range(1, min(2 * reach, len(old))):
+            swapped = (moved_to[:-offset] > moved_to[offset:]).nonzero()[0]
+            passed.append(swapped)
+            passers.append(swapped + offset)
+        passed = np.concatenate(passed)
+        passers = np.concatenate(passers)
+        if not len(passed):
+            return []
+        # Grouped by the car passed, in the order its passers get to it
+        by_passed = np.lexsort((passers, passed))
+        passed = passed[by_passed]
+        passers = passers[by_passed]
+        # When the car at i moves past the car at k, the cars at i or later
+        # that also pass k are still behind it
+        starts = np.r_[True, passed[1:] != passed[:-1]].nonzero()[0]
+        ends = np.r_[starts[1:], len(passed)]
+        later = np.repeat(ends, ends - starts) - np.arange(len(passed))
+        positions = moved_to[passed] - later + 1
+
+        passer_keys = old[passers]
+        passed_keys = old[passed]
+        times = self._crossing_times(passer_keys, passed_keys, distances, now)
+        # The insertion sort moves the cars one at a time from the front,
+        # each past the cars it overtook nearest first. By then those are in
+        # their new order
+        reported = np.lexsort((-moved_to[passed], passers))
+        return [
+            Crossing(passer, victim, position, time)
+            for passer, victim, position, time in zip(
+                passer_keys[reported].tolist(),
+                passed_keys[reported].tolist(),
+                positions[reported].tolist(),
+                times[reported].tolist(),
+            )
+        ]
+
+    def _crossing_times(self, passers, passed, distances, now: float):
+        """PositionTracker._crossing_time of every pass"""
+        since = self._time
+        if since is None:
+            return np.full(len(passers), float(now))
+        previous = self._previous
+        gap_before = previous[passed] - previous[passers]
+        gap_after = distances[passers] - distances[passed]
+        total = gap_before + gap_after
+        valid = (gap_before > 0) & (total > 0)
+        fraction = np.divide(
+            (now - since) * gap_before, total, out=np.zeros(len(total)), where=valid
+        )
+        return np.where(valid, since + fraction, since)
+
+
+class VectorRaceState:
+    """
+    VectorRaceState
+
+    Drop-in replacement for RaceState. self.drivers keeps the Driver objects
+    in position order for names and ids, the live per-car values are in the
+    arrays. The batched checks of the detectors detectors.configure() turned
+    off (disabled, or not for this session type) are skipped
+    """
+
+    def __init__(self, telemetry: TelemetrySource, detectors=None):
+        if detectors is None:
+            detectors = DetectorSet()
+        self.telemetry = telemetry
+        self.detectors = detectors
+        self.drivers = []  # Ordered by position
+        self.fastest_lap = sys.float_info.max
+        self.safety_car = False
+        self.cooldowns = Cooldowns()
+        self.names = []
+        self.compounds = []
+        self.order = np.zeros(0, dtype=np.intp)  # Array indices by position
+        self.positions = PositionArrays()
+        self.timing = TimingArrays()
+        # Keyed by driver id like RaceState's, for the camera director
+        self.track = SplineIndex()
+        self.battles = BattleTracker()
+        # Array index of the car each car is linked to in a battle, -1 if none
+        self._linked_to = np.zeros(0, dtype=np.intp)
+        # The lap and time each car's per-driver events are ready again, a
+        # copy of their keys in cooldowns that can be checked on the arrays
+        self._ready_lap = np.zeros((len(_EVENT_ROWS), 0), dtype=np.int64)
+        self._ready_time = np.zeros((len(_EVENT_ROWS), 0))
+        for name, dtype, value in _ARRAYS:
+            setattr(self, name, np.zeros(0, dtype=dtype))
+        self._by_index = []
+
+    @property
+    def distance(self):
+        return self.lap_count + self.lap_distance
+
+    def add_driver(self, driver: Driver):
+        for name, dtype, value in _ARRAYS:
+            setattr(
+                self,
+                name,
+                np.append(getattr(self, name), np.array([value], dtype=dtype)),
+            )
+        index = len(self._by_index)
+        self.ids[index] = driver.id
+        for field, name in _CAR_STATE_FIELDS:
+            getattr(self, name)[index] = getattr(driver, name)
+        self.in_pit[index] = driver.in_pit
+        self.lap_in_pit[index] = driver.lap_in_pit
+        self.names.append(driver.name)
+        self.compounds.append(driver.compound)
+        self._by_index.append(driver)
+
+        self.positions.add(index, driver.distance)
+        self.timing.add()
+        self._linked_to = np.append(self._linked_to, -1)
+        self._ready_lap = np.hstack(
+            (self._ready_lap, np.full((len(_EVENT_ROWS), 1), -_NEVER))
+        )
+        self._ready_time = np.hstack(
+            (self._ready_time, np.full((len(_EVENT_ROWS), 1), -np.inf))
+        )
+        self.track.add(driver.id, driver.lap_distance)
+        self.order = self.positions.order
+        self.drivers = [self._by_index[index] for index in self.order]
+
+    def _read(self):
+        telemetry = self.telemetry
+        ids = self.ids.tolist()
+        for field, name in _CAR_STATE_FIELDS:
+            getattr(self, name)[:] = telemetry.car_states(ids, field)
+        connected = np.array([bool(telemetry.is_connected(id)) for id in ids])
+        in_pit = np.array(
+            [bool(telemetry.is_in_pitline(id) or telemetry.is_in_pit(id)) for id in ids]
+        )
+        compounds = [telemetry.tyre_compound(id) for id in ids]
+        return connected, in_pit, compounds
+
+    def _ready(self, event_type, mask, now: float) -> list:
+        """The indices in mask of the cars event_type isn't cooling down for"""
+        if not mask.any():
+            return []
+        row = _EVENT_ROWS[event_type]
+        ready = (self.lap_count >= self._ready_lap[row]) & (
+            now >= self._ready_time[row]
+        )
+        return (mask & ready).nonzero()[0].tolist()
+
+    def _driver_event(self, event_type, index, params, now: float):
+        """The event, starting its cooldown like Detector.emit"""
+        log.info(event_type, "EVENT: {} - {}", event_type, self.names[index])
+        detector = _DRIVER_EVENTS[event_type]
+        driver_id = self._by_index[index].id
+        lap = int(self.lap_count[index])
+        self.cooldowns.start(
+            (event_type, driver_id), lap, now, detector.cooldown, detector.cooldown_time
+        )
+        row = _EVENT_ROWS[event_type]
+        if detector.cooldown is None:
+            self._ready_lap[row, index] = _NEVER
+        else:
+            self._ready_lap[row, index] = lap + detector.cooldown
+        self._ready_time[row, index] = now + detector.cooldown_time
+        return Event(event_type, driver_id, params)
+
+    def _cool(self, key, lap: int, now: float):
+        """Starts the cooldown of a race wide key, see EventType.COOLDOWN"""
+        laps, seconds = EventType.COOLDOWN[key[0]]
+        self.cooldowns.start(key, lap, now, laps, seconds)
+
+    def _update_drivers(self):
+        """Batched equivalent of Driver.update for every car"""
+        events = []
+        previous_lap = self.lap_count.copy()
+        connected, in_pit, compounds = self._read()
+        lap = self.lap_count
+        clock = self.telemetry.clock()
+        active = {type(detector) for detector in self.detectors.active}
+
+        # Check if a driver has left the game (DNF)
+        if DNFDetector in active:
+            self._check_dnf(connected, clock, events)
+        self.connected = connected
+
+        if PitDetector in active:
+            self._check_pits(in_pit, clock, events)
+        self.in_pit = in_pit
+
+        # Record completed laps and stints in the drivers' LapHistory
+        completed = lap != previous_lap
+        changed = np.array(compounds) != np.array(self.compounds)
+        if LapHistoryRecorder in active:
+            self._record_laps(completed, changed, in_pit, compounds)
+        self.lap_in_pit = np.where(completed, in_pit, self.lap_in_pit | in_pit)
+
+        # Check if a driver has set their best lap. 0 until they have one
+        if BestLapDetector in active:
+            best_lap = (self.last_lap > 0) & (self.last_lap == self.best_lap)
+            for index in self._ready(EventType.BEST_LAP, best_lap, clock):
+                events.append(
+                    self._driver_event(
+                        EventType.BEST_LAP,
+                        index,
+                        {
+                            "driver": self.names[index],
+                            "lap_time": int(self.best_lap[index]),
+                        },
+                        clock,
+                    )
+                )
+
+        # Check tire age
+        if LongStintDetector in active:
+            self._check_stints(changed, clock, events)
+        self.compounds = compounds
+
+        return events
+
+    def _check_dnf(self, connected, clock: float, events):
+        for index in self._ready(EventType.DNF, self.connected & ~connected, clock):
+            events.append(
+                self._driver_event(
+                    EventType.DNF,
+                    index,
+                    {"driver": self.names[index], "reason": "Disconnected"},
+                    clock,
+                )
+            )
+
+    def _check_pits(self, in_pit, clock: float, events):
+        """Pit entries and the duration of pitstops"""
+        lap = self.lap_count
+        entered = self._ready(EventType.ENTERED_PIT, ~self.in_pit & in_pit, clock)
+        for index in entered:
+            events.append(
+                self._driver_event(
+                    EventType.ENTERED_PIT,
+                    index,
+                    {
+                        "driver": self.names[index],
+                        "lap_count": int(lap[index]),
+                        "last_lap": int(self.last_lap[index]),
+                        "compound": self.compounds[index],
+                    },
+                    clock,
+                )
+            )
+        self.latest_pit_start[entered] = clock
+        self.pit_stops[entered] += 1
+
+        exited = self.in_pit & ~in_pit
+        duration = clock - self.latest_pit_start
+        long_pit = set(self._ready(EventType.LONG_PIT, exited & (duration > 60), clock))
+        quick_pit = self._ready(EventType.QUICK_PIT, exited & (duration < 30), clock)
+        for index in exited.nonzero()[0].tolist():
+            if index in long_pit:
+                event_type = EventType.LONG_PIT
+            elif index in quick_pit:
+                event_type = EventType.QUICK_PIT
+            else:
+                continue
+            events.append(
+                self._driver_event(
+                    event_type,
+                    index,
+                    {
+                        "driver": self.names[index],
+                        "compound": self.compounds[index],
+                        "duration": int(duration[index]),
+                    },
+                    clock,
+                )
+            )
+
+    def _record_laps(self, completed, changed, in_pit, compounds):
+        lap = self.lap_count
+        for index in (completed & (self.last_lap > 0)).nonzero()[0].tolist():
+            self._by_index[index].history.add_lap(
+                int(lap[index]),
+                int(self.last_lap[index]),
+                bool(self.lap_in_pit[index] or in_pit[index]),
+            )
+        for index in changed.nonzero()[0].tolist():
+            self._by_index[index].history.new_stint(compounds[index], int(lap[index]))
+
+    def _check_stints(self, changed, clock: float, events):
+        """Tire age, an event once the tires are over 15 laps old"""
+        lap = self.lap_count
+        self.last_compound_change_lap[changed] = 0
+        self.tire_age = np.where(changed, 0, lap - self.last_compound_change_lap)
+        long_stint = ~changed & (self.tire_age > 15)
+        for index in self._ready(EventType.LONG_STINT, long_stint, clock):
+            params = {
+                "driver": self.names[index],
+                "lap_count": int(lap[index]),
+                "tire_age": int(self.tire_age[index]),
+                "last_lap": int(self.last_lap[index]),
+                "compound": self.compounds[index],
+            }
+            params.update(self._by_index[index].history.stint.params())
+            events.append(
+                self._driver_event(EventType.LONG_STINT, index, params, clock)
+            )
+
+    def _update_battles(self, order, ahead, behind, intervals, now: float):
+        """BattleTracker.update, with the links worked out on the arrays"""
+        battles = self.battles
+        limit = np.where(
+            self._linked_to[behind] == ahead, battles.leave_gap, battles.join_gap
+        )
+        # NaN (unknown) gaps compare False
+        linked = intervals <= limit
+        self._linked_to[:] = -1
+        self._linked_to[behind[linked]] = ahead[linked]
+        battles.update_linked(
+            self.ids[order].tolist(),
+            intervals.tolist(),
+            linked.nonzero()[0].tolist(),
+            now,
+        )
+
+    def update(self):
+        start = metrics.start()
+        events = self._update_drivers()
+
+        avg_speed = self.speed_kmh.mean()
+        distance = self.distance
+        now = self.telemetry.clock()
+        self.timing.update(distance, now)
+        crossings = self.positions.update(distance, now)
+        order = self.positions.order
+        current_lap = int(self.lap_count[order[0]])
+        # The last car is on the lowest lap
+        self.cooldowns.expire(now, int(self.lap_count[order[-1]]))
+        ahead = order[:-1]
+        behind = order[1:]
+
+        # Report every pass since the last update, but not cars swapping
+        # back and forth
+        if current_lap > 0:
+            for crossing in crossings:
+                if crossing.repass:
+                    continue
+                log.info(
+                    EventType.OVERTAKE,
+                    "EVENT: {} - {}",
+                    EventType.OVERTAKE,
+                    self.names[crossing.passer],
+                )
+                events.append(
+                    Event(
+                        EventType.OVERTAKE,
+                        int(self.ids[crossing.passer]),
+                        {
+                            "driver_a": self.names[crossing.passer],
+                            "driver_b": self.names[crossing.passed],
+                            "position": crossing.position,
+                            "time": round(crossing.time, 2),
+                        },
+                    )
+                )
+
+        # Check for DRS range and short intervals
+        intervals = self.timing.gaps(ahead, behind)
+        known = ~np.isnan(intervals)
+        ids = self.ids.tolist()
+        by_spline = np.argsort(self.lap_distance, kind="stable")
+        self.track.assign(self.ids[by_spline].tolist(), self.lap_distance[by_spline])
+        self._update_battles(order, ahead, behind, intervals, now)
+        drs = self.drs_available[behind] & known
+        for event_type, mask in (
+            (EventType.DRS_RANGE, drs),
+            (EventType.SHORT_INTERVAL, ~drs & known & (intervals < 3)),
+        ):
+            if event_type == EventType.SHORT_INTERVAL and current_lap == 0:
+                # Not at the start, with the whole field close together
+                continue
+            pairs = mask.nonzero()[0]
+            for car_a, car_b, interval in zip(
+                ahead[pairs].tolist(),
+                behind[pairs].tolist(),
+                intervals[pairs].tolist(),
+            ):
+                key = pair(event_type, ids[car_a], ids[car_b])
+                if not self.cooldowns.ready(key, current_lap, now):
+                    continue
+                log.info(event_type, "EVENT: {} - {}", event_type, self.names[car_b])
+                events.append(
+                    Event(
+                        event_type,
+                        ids[car_b],
+                        {
+                            "driver_a": self.names[car_a],
+                            "driver_b": self.names[car_b],
+                            "interval": round(interval, 1),
+                        },
+                    )
+                )
+                self._cool(key, current_lap, now)
+
+        if crossings:
+            self.drivers = [self._by_index[index] for index in order.tolist()]
+        self.order = order
+
+        # Check for safety car
+        if (
+            not self.safety_car
+            and current_lap > 1
+            and avg_speed < 30
+            and self.cooldowns.ready((EventType.START_SAFETY_CAR,), current_lap, now)
+        ):
+            self.safety_car = True
+            log.info(
+                EventType.START_SAFETY_CAR, "EVENT: {}", EventType.START_SAFETY_CAR
+            )
+            events.append(
+                Event(
+                    EventType.START_SAFETY_CAR,
+                    int(self.ids[order[0]]),
+                    {"lap_count": current_lap},
+                )
+            )
+            self._cool((EventType.START_SAFETY_CAR,), current_lap, now)
+        elif (
+            self.safety_car
+            and avg_speed > 160
+            and self.cooldowns.ready((EventType.END_SAFETY_CAR,), current_lap, now)
+        ):
+            self.safety_car = False
+            log.info(EventType.END_SAFETY_CAR, "EVENT: {}", EventType.END_SAFETY_CAR)
+            events.append(
+                Event(
+                    EventType.END_SAFETY_CAR,
+                    int(self.ids[order[0]]),
+                    {"lap_count": current_lap},
+                )
+            )
+            self._cool((EventType.END_SAFETY_CAR,), current_lap, now)
+
+        # Check for fastest lap. Every car that beats the running minimum in
+        # position order is reported, the same as the sequential scan
+        best_laps = self.best_lap[order]
+        running = np.minimum.accumulate(
+            np.concatenate(([self.fastest_lap], best_laps[:-1]))
+        )
+        improved = (best_laps < running).nonzero()[0]
+        if len(improved):
+            self.fastest_lap = min(self.fastest_lap, int(best_laps[improved[-1]]))
+            if current_lap > 3:
+                # Don't report fastest lap on the first few laps
+                for i in improved:
+                    index = order[i]
+                    log.info(
+                        EventType.FASTEST_LAP,
+                        "EVENT: {} - {}",
+                        EventType.FASTEST_LAP,
+                        self.names[index],
+                    )
+                    events.append(
+                        Event(
+                            EventType.FASTEST_LAP,
+                            int(self.ids[index]),
+                            {
+                                "driver": self.names[index],
+                                "lap_time": int(best_laps[i]),
+                            },
+                        )
+                    )
+
+        metrics.stop("race_state_update", start)
+        return events
@@ -0,0 +1,253 @@
+"""
+Worker pool
+
+Long-lived worker threads with a bounded job queue, used instead of
+starting a thread for every commentary line
+"""
+
+import queue
+import threading
+import time
+import traceback
+
+from instrumentation import metrics
+from log import log
+
+
+class Job:
+    """
+    Job
+
+    A call queued on a WorkerPool. The function is called as fn(job, *args)
+    so it can check job.remaining() against the deadline and register
+    on_cancel callbacks (e.g. to cancel a sidecar request) while it runs
+    """
+
+    def __init__(self, fn, args, deadline: float = None):
+        self.fn = fn
+        self.args = args
+        self.deadline = deadline
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.queued_time = time.time()
+        self.started_time = None
+        self.finished_time = None
+        self._cancel_callbacks = []
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.status == "cancelled"
+
+    def remaining(self) -> float:
+        """Seconds left until the deadline, None if there isn't one"""
+        if self.deadline is None:
+            return None
+        return max(0, self.deadline - time.time())
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    def on_cancel(self, callback):
+        with self._lock:
+            if self.status != "cancelled":
+                self._cancel_callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self):
+        with self._lock:
+            if self.status not in ("queued", "running"):
+                return
+            was_queued = self.status == "queued"
+            self.status = "cancelled"
+            callbacks = self._cancel_callbacks
+            self._cancel_callbacks = []
+        for callback in callbacks:
+            callback()
+        if was_queued:
+            self._done.set()
+
+    def _start(self, pool) -> bool:
+        """
+        Marks the job running, counted in pool.running in the same step it
+        stops counting as queued so pool.load never misses it
+        """
+        with self._lock, pool._lock:
+            pool.queued -= 1
+            if self.status != "queued":
+                return False
+            if self.deadline is not None and time.time() > self.deadline:
+                self.status = "expired"
+                self._done.set()
+                return False
+            self.status = "running"
+            self.started_time = time.time()
+            pool.running += 1
+            return True
+
+    def _finish(self, status: str):
+        with self._lock:
+            if self.status == "running":
+                self.status = status
+            self._cancel_callbacks = []
+        self.finished_time = time.time()
+        self._done.set()
+
+
+class WorkerPool:
+    """
+    WorkerPool
+
+    workers threads take jobs from a queue of at most max_queue jobs.
+    submit() never blocks: when the queue is full the job is rejected and
+    None is returned so the caller can keep the work for later. Jobs that
+    are still queued past their deadline are skipped. A job that raises is
+    logged with its traceback and counted as failed (name + "_jobs_failed" in
+    the metrics)
+    """
+
+    def __init__(self, workers: int = 1, max_queue: int = 4, name: str = "worker"):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.expired = 0
+        self.queued = 0
+        self.running = 0
+        self.total_wait = 0
+        self.max_wait = 0
+        self.total_run = 0
+        self.max_run = 0
+        self._queue = queue.Queue(max_queue)
+        self._jobs = set()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._threads = []
+        for index in range(workers):
+            thread = threading.Thread(
+                target=self._work, name="{}-{}".format(name, index), daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def load(self) -> int:
+        """Running plus queued jobs"""
+        with self._lock:
+            return self.running + self.queued
+
+    def submit(self, fn, *args, deadline: float = None) -> Job:
+        """Queues fn(job, *args). Returns None if the queue is full"""
+        if self._closed:
+            return None
+        job = Job(fn, args, deadline)
+        # Tracked before a worker can take it, or a job finished straight
+        # away would be added after it was forgotten
+        with self._lock:
+            self._jobs.add(job)
+            self.queued += 1
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._jobs.discard(job)
+                self.queued -= 1
+                self.rejected += 1
+            return None
+        with self._lock:
+            self.submitted += 1
+        return job
+
+    def stats(self) -> dict:
+        finished = max(1, self.completed + self.failed + self.cancelled)
+        return {
+            "queue_depth": self.queue_depth,
+            "running": self.running,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "expired": self.expired,
+            "mean_wait": self.total_wait / finished,
+            "max_wait": self.max_wait,
+            "mean_run": self.total_run / finished,
+            "max_run": self.max_run,
+        }
+
+    def shutdown(self, timeout: float = 5):
+        """Cancels queued and running jobs and stops the workers"""
+        self._closed = True
+        with self._lock:
+            jobs = list(self._jobs)
+        for job in jobs:
+            job.cancel()
+        deadline = time.time() + timeout
+        try:
+            for _ in self._threads:
+                # Workers drain the cancelled jobs, so this only waits briefly
+                self._queue.put(None, timeout=max(0, deadline - time.time()))
+        except queue.Full:
+            pass
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.time()))
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            if not job._start(self):
+                # Cancelled or past its deadline while queued
+                self._forget(job)
+                continue
+
+            status = "done"
+            try:
+                job.result = job.fn(job, *job.args)
+            except Exception as error:
+                job.error = error
+                status = "failed"
+                metrics.count(self.name + "_jobs_failed")
+                log.error(
+                    self.name + "_jobs_failed",
+                    "{} job {} failed:\n{}",
+                    self.name,
+                    getattr(job.fn, "__name__", job.fn),
+                    traceback.format_exc(),
+                )
+            job._finish(status)
+            with self._lock:
+                self.running -= 1
+            self._forget(job)
+
+    def _forget(self, job):
+        with self._lock:
+            self._jobs.discard(job)
+            if job.status == "expired":
+                self.expired += 1
+                return
+            if job.status == "done":
+                self.completed += 1
+            elif job.status == "failed":
+                self.failed += 1
+            elif job.status == "cancelled":
+                self.cancelled += 1
+            if job.started_time is not None:
+                wait = job.started_time - job.queued_time
+                run = job.finished_time - job.started_time
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+                self.total_run += run
+                self.max_run = max(self.max_run, run)